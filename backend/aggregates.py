@@ -0,0 +1,107 @@
+"""Agregados de risco por turma mantidos incrementalmente em class_summary.
+
+Cada UPDATE em students que possa mudar turma, nível ou indicadores é escrito como
+uma CTE chamada "changed" cujo RETURNING traz os valores antigos e novos
+(SUMMARY_RETURNING); a CTE SUMMARY_DELTA aplica a diferença na mesma instrução.
+Linhas inseridas entram em "changed" com os valores antigos nulos e só somam.
+Cargas em lote (seed, limpeza) usam rebuild_class_summary().
+"""
+# Colunas de students que entram nos agregados
+SUMMARY_SOURCE_COLUMNS = ('class', 'risk_level', 'attendance', 'grades', 'risk_score')
+
+# RETURNING de um UPDATE students AS s ... FROM (SELECT ... FOR UPDATE) AS old:
+# os valores antigos vêm da subconsulta, que trava e lê a versão mais recente da linha
+SUMMARY_RETURNING = ', '.join(
+    [f'old.{column} AS old_{column}' for column in SUMMARY_SOURCE_COLUMNS] +
+    [f's.{column}' for column in SUMMARY_SOURCE_COLUMNS]
+)
+
+# Expressões agregadas sobre linhas (class, risk_level, attendance, grades, risk_score, sign)
+_SUMMARY_SELECT = '''
+    SUM(sign) AS students,
+    SUM(CASE WHEN risk_level = 'Alto' THEN sign ELSE 0 END) AS high_risk,
+    SUM(CASE WHEN risk_level = 'Médio' THEN sign ELSE 0 END) AS medium_risk,
+    SUM(CASE WHEN risk_level = 'Baixo' THEN sign ELSE 0 END) AS low_risk,
+    COALESCE(SUM(sign * attendance), 0) AS attendance_sum,
+    SUM(CASE WHEN attendance IS NOT NULL THEN sign ELSE 0 END) AS attendance_count,
+    COALESCE(SUM(sign * grades), 0) AS grades_sum,
+    SUM(CASE WHEN grades IS NOT NULL THEN sign ELSE 0 END) AS grades_count,
+    COALESCE(SUM(sign * risk_score), 0) AS risk_score_sum,
+    SUM(CASE WHEN risk_score IS NOT NULL THEN sign ELSE 0 END) AS risk_score_count
+'''
+
+SUMMARY_COLUMNS = (
+    'students', 'high_risk', 'medium_risk', 'low_risk', 'attendance_sum', 'attendance_count',
+    'grades_sum', 'grades_count', 'risk_score_sum', 'risk_score_count'
+)
+
+# CTE que aplica os deltas de "changed"; as turmas são atualizadas sempre na mesma
+# ordem para que escritas concorrentes não entrem em deadlock
+SUMMARY_DELTA = f'''
+    summary_delta AS (
+        INSERT INTO class_summary AS cs (class, {', '.join(SUMMARY_COLUMNS)})
+        SELECT class, {_SUMMARY_SELECT}
+        FROM (
+            SELECT old_class AS class, old_risk_level AS risk_level, old_attendance AS attendance,
+                   old_grades AS grades, old_risk_score AS risk_score, -1 AS sign
+            FROM changed
+            WHERE old_class IS NOT NULL
+            UNION ALL
+            SELECT class, risk_level, attendance, grades, risk_score, 1 AS sign
+            FROM changed
+        ) AS deltas
+        GROUP BY class
+        ORDER BY class
+        ON CONFLICT (class) DO UPDATE SET
+            {', '.join(f'{column} = cs.{column} + EXCLUDED.{column}' for column in SUMMARY_COLUMNS)},
+            updated_at = CURRENT_TIMESTAMP
+    )
+'''
+
+_SUMMARY_FROM_STUDENTS = f'''
+    SELECT class, {_SUMMARY_SELECT}
+    FROM (SELECT class, risk_level, attendance, grades, risk_score, 1 AS sign FROM students) AS current
+    GROUP BY class
+'''
+
+
+def rebuild_class_summary(cur):
+    """Recalcula class_summary a partir de students (bloqueia escritas em students até o commit)"""
+    cur.execute('LOCK TABLE students IN SHARE MODE')
+    cur.execute('DELETE FROM class_summary')
+    cur.execute(f'''
+        INSERT INTO class_summary (class, {', '.join(SUMMARY_COLUMNS)})
+        {_SUMMARY_FROM_STUDENTS}
+    ''')
+    return cur.rowcount
+
+
+def check_class_summary(conn):
+    """Compara class_summary com um GROUP BY em students no mesmo snapshot.
+
+    Retorna a lista de divergências [{class, column, stored, expected}] (vazia se
+    consistente). Usa REPEATABLE READ, então escritas concorrentes não geram
+    falsos positivos. Termina a transação com rollback.
+    """
+    conn.rollback()
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    try:
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT COALESCE(stored.class, expected.class) AS class,
+                   {', '.join(f'stored.{column} AS stored_{column}, expected.{column} AS expected_{column}' for column in SUMMARY_COLUMNS)}
+            FROM class_summary AS stored
+            FULL JOIN ({_SUMMARY_FROM_STUDENTS}) AS expected ON expected.class = stored.class
+            ORDER BY 1
+        ''')
+        mismatches = []
+        for row in cur.fetchall():
+            for column in SUMMARY_COLUMNS:
+                stored, expected = row[f'stored_{column}'] or 0, row[f'expected_{column}'] or 0
+                if stored != expected:
+                    mismatches.append({'class': row['class'], 'column': column, 'stored': stored, 'expected': expected})
+        cur.close()
+        return mismatches
+    finally:
+        conn.rollback()
+        conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
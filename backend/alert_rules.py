@@ -0,0 +1,166 @@
+"""Regras de alerta configuráveis (tabela alert_rules) avaliadas em conjunto no banco.
+
+Cada regra tem um tipo (RULE_KINDS), um limite e um modelo de mensagem; o nome da
+regra é o alert_type dos alertas que ela cria. As regras são avaliadas pela CTE
+ALERTS_CTE sobre as linhas de uma CTE "changed" (id, name, indicadores novos e
+old_risk_level), na mesma instrução que altera students: um aluno atualizado,
+um lote inteiro ou um bloco do recálculo. As regras de queda comparam com a
+referência do último snapshot (student_snapshots). O índice único parcial
+uq_alerts_open_student_type garante um único alerta aberto por aluno e regra,
+então reavaliar não duplica alertas.
+"""
+from events import publish_change
+
+# Condição e valor ({value} da mensagem) de cada tipo de regra; "c" é a linha
+# alterada, "b" a referência do último snapshot e "r" a regra
+RULE_KINDS = {
+    'attendance_below': ('c.attendance < r.threshold', 'c.attendance'),
+    'grades_below': ('c.grades < r.threshold', 'c.grades'),
+    'risk_score_above': ('c.risk_score > r.threshold', 'c.risk_score'),
+    'attendance_drop': ('b.attendance - c.attendance >= r.threshold', 'b.attendance - c.attendance'),
+    'grades_drop': ('b.grades - c.grades >= r.threshold', 'b.grades - c.grades'),
+    # Sem valor anterior na instrução (avaliação completa, inserção), vale o do snapshot
+    'became_high_risk': (
+        "c.risk_level = 'Alto' AND COALESCE(c.old_risk_level, b.risk_level) IS DISTINCT FROM 'Alto'",
+        'c.risk_score',
+    ),
+}
+# Tipos que dispensam limite
+RULE_KINDS_WITHOUT_THRESHOLD = ('became_high_risk',)
+RULE_SEVERITIES = ('Alta', 'Média', 'Baixa')
+
+_RULE_CONDITION = 'CASE r.kind {} ELSE FALSE END'.format(
+    ' '.join(f"WHEN '{kind}' THEN {condition}" for kind, (condition, _) in RULE_KINDS.items())
+)
+_RULE_VALUE = 'CASE r.kind {} END'.format(
+    ' '.join(f"WHEN '{kind}' THEN {value}" for kind, (_, value) in RULE_KINDS.items())
+)
+
+# CTE que cria os alertas das regras ativas para as linhas de "changed". Alunos
+# que já têm um alerta aberto da mesma regra saem no anti-join (em uma passada
+# completa, um hash join é bem mais barato que um conflito por linha); o ON
+# CONFLICT cobre apenas inserções concorrentes
+ALERTS_CTE = f'''
+    new_alerts AS (
+        INSERT INTO alerts (student_id, alert_type, message, severity)
+        SELECT c.id, r.name,
+               replace(replace(replace(r.message,
+                   '{{name}}', c.name),
+                   '{{value}}', COALESCE(round({_RULE_VALUE}, 1)::text, '')),
+                   '{{threshold}}', COALESCE(r.threshold::text, '')),
+               r.severity
+        FROM changed AS c
+        JOIN alert_rules AS r ON r.enabled
+        LEFT JOIN student_snapshots AS b ON b.student_id = c.id
+        WHERE {_RULE_CONDITION}
+          AND NOT EXISTS (
+              SELECT 1 FROM alerts AS a
+              WHERE a.student_id = c.id AND a.alert_type = r.name AND a.resolved = FALSE
+          )
+        ORDER BY c.id, r.name
+        ON CONFLICT (student_id, alert_type) WHERE resolved = FALSE DO NOTHING
+        RETURNING id, student_id, alert_type, severity
+    )
+'''
+
+# Colunas das regras nas respostas (threshold como número JSON)
+RULE_SELECT = 'id, name, kind, threshold::float8 AS threshold, severity, message, enabled, updated_at'
+
+
+def list_alert_rules(cur):
+    """Lista as regras em ordem de id"""
+    cur.execute(f'SELECT {RULE_SELECT} FROM alert_rules ORDER BY id')
+    return cur.fetchall()
+
+
+def validate_rule_update(data):
+    """Valida a alteração de uma regra; retorna (valores normalizados, lista de erros)"""
+    if not isinstance(data, dict):
+        return None, ['O corpo deve ser um objeto JSON']
+    values, errors = {}, []
+    if 'kind' in data:
+        if data['kind'] not in RULE_KINDS:
+            errors.append(f"kind deve ser um de: {', '.join(RULE_KINDS)}")
+        else:
+            values['kind'] = data['kind']
+    if 'threshold' in data:
+        threshold = data['threshold']
+        if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, (int, float))):
+            errors.append('threshold deve ser numérico')
+        else:
+            values['threshold'] = threshold
+    if 'severity' in data:
+        if data['severity'] not in RULE_SEVERITIES:
+            errors.append(f"severity deve ser um de: {', '.join(RULE_SEVERITIES)}")
+        else:
+            values['severity'] = data['severity']
+    if 'message' in data:
+        if not isinstance(data['message'], str) or not data['message'].strip():
+            errors.append('message deve ser um texto não vazio')
+        else:
+            values['message'] = data['message'].strip()
+    if 'enabled' in data:
+        if not isinstance(data['enabled'], bool):
+            errors.append('enabled deve ser true ou false')
+        else:
+            values['enabled'] = data['enabled']
+    if not values and not errors:
+        errors.append('Nenhum campo para alterar (kind, threshold, severity, message, enabled)')
+    return (None if errors else values), errors
+
+
+def update_alert_rule(cur, rule_id, values):
+    """Altera uma regra; retorna a linha gravada ou None se não existir.
+
+    Levanta ValueError se o tipo resultante exigir limite e ele estiver nulo.
+    Não faz commit.
+    """
+    assignments = ', '.join(f'{column} = %({column})s' for column in values)
+    cur.execute(f'''
+        UPDATE alert_rules SET {assignments}, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %(id)s
+        RETURNING {RULE_SELECT}
+    ''', {**values, 'id': rule_id})
+    rule = cur.fetchone()
+    if rule and rule['threshold'] is None and rule['kind'] not in RULE_KINDS_WITHOUT_THRESHOLD:
+        raise ValueError(f"A regra do tipo {rule['kind']} exige threshold")
+    if rule:
+        publish_change(cur, 'alert_rules_changed', id=rule_id)
+    return rule
+
+
+def evaluate_alert_rules(cur):
+    """Avalia as regras ativas sobre todos os alunos em uma única instrução.
+
+    Sem valor anterior na instrução, "became_high_risk" compara com o nível do
+    último snapshot. Não faz commit; retorna {created, by_rule}.
+    """
+    cur.execute(f'''
+        WITH changed AS (
+            SELECT id, name, attendance, grades, risk_score, risk_level, NULL::varchar AS old_risk_level
+            FROM students
+        ),
+        {ALERTS_CTE}
+        SELECT alert_type, COUNT(*) AS created
+        FROM new_alerts
+        GROUP BY alert_type
+        ORDER BY alert_type
+    ''')
+    by_rule = {row['alert_type']: row['created'] for row in cur.fetchall()}
+    created = sum(by_rule.values())
+    if created:
+        publish_change(cur, 'alerts_created', count=created)
+    return {'created': created, 'by_rule': by_rule}
+
+
+def refresh_student_snapshots(cur):
+    """Grava os indicadores atuais de todos os alunos como referência das regras de queda"""
+    cur.execute('''
+        INSERT INTO student_snapshots AS b (student_id, attendance, grades, risk_score, risk_level, taken_at)
+        SELECT id, attendance, grades, risk_score, risk_level, CURRENT_TIMESTAMP FROM students
+        ON CONFLICT (student_id) DO UPDATE SET
+            attendance = EXCLUDED.attendance, grades = EXCLUDED.grades,
+            risk_score = EXCLUDED.risk_score, risk_level = EXCLUDED.risk_level,
+            taken_at = EXCLUDED.taken_at
+    ''')
+    return cur.rowcount
@@ -1,325 +1,522 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+import base64
+import csv
+import hashlib
+import io
+import json
+import queue
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
-import random
 
-app = Flask(__name__, static_folder='../frontend', static_url_path='')
-CORS(app)
+import click
+import numpy as np
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from werkzeug.http import is_resource_modified
 
-# Configuração do banco de dados
-DATABASE_URL = os.environ.get('DATABASE_URL', 'postgresql://localhost/evasao_escolar')
-if DATABASE_URL.startswith('postgres://'):
-    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+from aggregates import SUMMARY_DELTA, SUMMARY_RETURNING, check_class_summary, rebuild_class_summary
+from alert_rules import ALERTS_CTE, evaluate_alert_rules, list_alert_rules, update_alert_rule, validate_rule_update
+from cache import DASHBOARD_CACHE_TTL, VersionedCache, get_data_version
+from db import (
+    DATABASE_URL, DB_STICKY_SECONDS, RequestRouting, db_connection, get_db_connection, get_pool,
+    get_replica_router, reset_request_routing, run_parallel, set_request_routing,
+)
+from events import SSE_HEARTBEAT, get_listener, publish_change, sse_frame
+from history import (
+    HISTORY_RETENTION_MONTHS, ensure_history_partitions, history_cte, maintain_history, record_history_baseline,
+)
+from imports import IMPORT_CHUNK_SIZE, RejectsReport, import_students_csv
+from metrics import PROMETHEUS_CONTENT_TYPE, collect_slow_queries, init_metrics, render_metrics
+from migrations import LATEST_VERSION, check_query_plans, migration_lock, run_migrations, schema_status
+from risk import (
+    METRIC_FIELDS, METRIC_RANGES, METRIC_SCALES, RECOMPUTE_CHUNK_SIZE, calculate_risk_score, calculate_risk_scores,
+    recompute_risk_scores,
+)
+from seed import CLASSES, generate_dataset, reset_tables
+from serialization import JSON_ENCODER, OrjsonProvider, init_json, orjson, rows_payload
+from simulation import (
+    SIMULATION_CHANGES_DEFAULT, SIMULATION_CHANGES_MAX, SIMULATION_MAX_CANDIDATES, parse_candidate, simulate_risk,
+)
+from slow_queries import SLOW_QUERY_BUFFER, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_MS
+from snapshots import SNAPSHOT_INTERVAL, backfill_from_csv, snapshot_month, start_snapshot_scheduler
 
-def get_db_connection():
-    """Cria conexão com o banco de dados com tratamento de erro"""
-    try:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        return conn
-    except Exception as e:
-        print(f"ERRO DE CONEXÃO COM O BANCO DE DADOS: {e}")
-        # Usamos a exceção original do psycopg2 para manter o rastreamento, mas garantimos que a rota a capture
-        raise ConnectionError("Falha ao conectar com o banco de dados. Verifique DATABASE_URL e a disponibilidade do serviço.") from e
+app = Flask(__name__, static_folder='../frontend', static_url_path='')
+init_json(app)
+init_metrics(app)
+CORS(app, expose_headers=['X-Total-Count', 'X-Next-Cursor', 'X-Cache', 'X-Import-Summary', 'Server-Timing', 'ETag', 'Last-Modified'])
 
-def init_db():
-    """Inicializa o banco de dados com as tabelas necessárias"""
-    conn = None
+def init_db(conn):
+    """Inicializa o banco de dados aplicando as migrações pendentes"""
     try:
-        conn = get_db_connection()
+        applied = run_migrations(conn)
+        if applied:
+            print(f"✓ Schema atualizado para a versão {applied[-1]}")
+        else:
+            print(f"✓ Schema já está na versão {LATEST_VERSION}")
+        # Partições do histórico para o mês atual e os próximos
         cur = conn.cursor()
-        
-        # Tabela de alunos
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS students (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(200) NOT NULL,
-                class VARCHAR(10) NOT NULL,
-                attendance DECIMAL(5,2) DEFAULT 0,
-                grades DECIMAL(5,2) DEFAULT 0,
-                participation DECIMAL(5,2) DEFAULT 0,
-                absences INTEGER DEFAULT 0,
-                socioeconomic DECIMAL(3,1) DEFAULT 3.0,
-                risk_score DECIMAL(5,2) DEFAULT 0,
-                risk_level VARCHAR(20) DEFAULT 'Baixo',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabela de histórico de alertas
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id SERIAL PRIMARY KEY,
-                student_id INTEGER REFERENCES students(id),
-                alert_type VARCHAR(50) NOT NULL,
-                message TEXT NOT NULL,
-                severity VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                resolved BOOLEAN DEFAULT FALSE
-            )
-        ''')
-        
-        # Tabela de intervenções
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS interventions (
-                id SERIAL PRIMARY KEY,
-                student_id INTEGER REFERENCES students(id),
-                intervention_type VARCHAR(100) NOT NULL,
-                description TEXT,
-                status VARCHAR(50) DEFAULT 'Pendente',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP
-            )
-        ''')
-        
-        # Tabela de evolução mensal
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS monthly_stats (
-                id SERIAL PRIMARY KEY,
-                month DATE NOT NULL,
-                total_students INTEGER,
-                high_risk INTEGER,
-                medium_risk INTEGER,
-                low_risk INTEGER,
-                avg_attendance DECIMAL(5,2),
-                avg_grades DECIMAL(5,2),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
+        created = ensure_history_partitions(cur)
         conn.commit()
         cur.close()
-        print("✓ Tabelas do banco de dados criadas/verificadas com sucesso")
+        if created:
+            print(f"✓ Partições do histórico criadas: {', '.join(created)}")
     except Exception as e:
         print(f"ERRO ao inicializar o banco de dados: {e}")
-        if conn:
-            conn.rollback()
         raise e
-    finally:
-        if conn:
-            conn.close()
 
-def populate_initial_data():
+def populate_initial_data(conn):
     """Popula dados iniciais se o banco estiver vazio"""
-    conn = None
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
-        cur.execute('SELECT COUNT(*) as count FROM students')
-        count = cur.fetchone()['count']
+        # EXISTS em vez de COUNT(*): roda a cada inicialização, mesmo com tabelas grandes
+        cur.execute('SELECT EXISTS (SELECT 1 FROM students) AS has_data')
+        has_data = cur.fetchone()['has_data']
         
-        if count == 0:
+        if not has_data:
             print("⚙️  Populando dados iniciais...")
-            # Lista expandida de nomes brasileiros
-            nomes_masculinos = [
-                'Miguel Silva', 'Davi Santos', 'Gabriel Oliveira', 'Arthur Costa', 'Lucas Souza',
-                'Matheus Ferreira', 'Pedro Rodrigues', 'Guilherme Almeida', 'Gustavo Lima', 'Rafael Pereira',
-                'Felipe Carvalho', 'Bernardo Ribeiro', 'Enzo Martins', 'Nicolas Araújo', 'João Pedro Dias',
-                'Cauã Fernandes', 'Vitor Gomes', 'Eduardo Cardoso', 'Daniel Rocha', 'Henrique Barbosa',
-                'Murilo Castro', 'Vinicius Nascimento', 'Samuel Moreira', 'Pietro Pinto', 'João Vitor Monteiro',
-                'Leonardo Freitas', 'Caio Duarte', 'Heitor Teixeira', 'Lorenzo Barros', 'Isaac Cavalcanti',
-                'Lucca Azevedo', 'Thiago Mendes', 'João Gabriel Correia', 'João Moraes', 'Alexandre Nunes',
-                'Bruno Rezende', 'Benício Campos', 'Ryan Cardoso', 'Emanuel Farias', 'Fernando Vieira',
-                'Joaquim Ramos', 'André Nogueira', 'Tomás Cunha', 'Francisco Batista', 'Rodrigo Melo',
-                'Igor Peixoto', 'Otávio Lopes', 'Augusto Torres', 'Marcelo Santana', 'Fábio Cruz',
-                'Benjamin Lima', 'Elias Santos', 'Theo Oliveira', 'Gael Costa', 'Noah Souza',
-                'Luan Ferreira', 'Breno Rodrigues', 'Ian Almeida', 'Caleb Lima', 'Levi Pereira',
-                'Raul Carvalho', 'Diego Ribeiro', 'Yuri Martins', 'Renan Araújo', 'Erick Dias',
-                'Victor Fernandes', 'Bryan Gomes', 'Kauã Cardoso', 'Arthur Rocha', 'Luiz Barbosa',
-                'Antônio Castro', 'Benício Nascimento', 'Erick Moreira', 'Felipe Pinto', 'Giovanni Monteiro',
-                'Hugo Freitas', 'Israel Duarte', 'Júlio Teixeira', 'Kevin Barros', 'Léo Cavalcanti',
-                'Marcos Azevedo', 'Nathan Mendes', 'Oliver Correia', 'Paulo Moraes', 'Quentin Nunes',
-                'Rian Rezende', 'Saulo Campos', 'Téo Cardoso', 'Uriel Farias', 'Wallace Vieira',
-                'Xavier Ramos', 'Yago Nogueira', 'Zion Cunha', 'Alan Batista', 'Bento Melo',
-                'César Peixoto', 'Davi Lopes', 'Erick Torres', 'Fábio Santana', 'Gael Cruz'
-            ]
-            
-            nomes_femininos = [
-                'Sophia Oliveira', 'Alice Santos', 'Julia Silva', 'Isabella Costa', 'Manuela Souza',
-                'Laura Ferreira', 'Luiza Rodrigues', 'Valentina Almeida', 'Giovanna Lima', 'Maria Eduarda Pereira',
-                'Helena Carvalho', 'Beatriz Ribeiro', 'Maria Luiza Martins', 'Lara Araújo', 'Mariana Dias',
-                'Nicole Fernandes', 'Rafaela Gomes', 'Heloísa Cardoso', 'Isadora Rocha', 'Lívia Barbosa',
-                'Maria Clara Castro', 'Ana Clara Nascimento', 'Lorena Moreira', 'Gabriela Pinto', 'Yasmin Monteiro',
-                'Isabelly Freitas', 'Sarah Duarte', 'Ana Julia Teixeira', 'Letícia Barros', 'Ana Luiza Cavalcanti',
-                'Melissa Azevedo', 'Marina Mendes', 'Clara Correia', 'Cecília Moraes', 'Esther Nunes',
-                'Emanuelly Rezende', 'Rebeca Campos', 'Ana Beatriz Cardoso', 'Lavínia Farias', 'Vitória Vieira',
-                'Bianca Ramos', 'Catarina Nogueira', 'Larissa Cunha', 'Maria Fernanda Batista', 'Fernanda Melo',
-                'Amanda Peixoto', 'Alícia Lopes', 'Carolina Torres', 'Agatha Santana', 'Gabrielly Cruz',
-                'Elisa Lima', 'Maya Santos', 'Ayla Oliveira', 'Aurora Costa', 'Stella Souza',
-                'Pietra Ferreira', 'Milena Rodrigues', 'Liz Almeida', 'Antonella Lima', 'Maitê Pereira',
-                'Eliza Carvalho', 'Eloá Ribeiro', 'Maria Alice Martins', 'Luna Araújo', 'Duda Dias',
-                'Bella Fernandes', 'Sophie Gomes', 'Aurora Cardoso', 'Maria Vitória Rocha', 'Olívia Barbosa',
-                'Maria Helena Castro', 'Helena Nascimento', 'Laís Moreira', 'Maria Cecília Pinto', 'Brenda Monteiro',
-                'Evelyn Freitas', 'Hadassa Duarte', 'Maria Júlia Teixeira', 'Alana Barros', 'Elisa Cavalcanti',
-                'Jade Azevedo', 'Joana Mendes', 'Lorena Correia', 'Maria Luísa Moraes', 'Nina Nunes',
-                'Pérola Rezende', 'Stella Campos', 'Valentina Cardoso', 'Yasmin Farias', 'Zoe Vieira',
-                'Ana Ramos', 'Bárbara Nogueira', 'Camila Cunha', 'Diana Batista', 'Emilly Melo',
-                'Flávia Peixoto', 'Gisele Lopes', 'Ingrid Torres', 'Jéssica Santana', 'Kelly Cruz'
-            ]
-            
-            todos_nomes = nomes_masculinos + nomes_femininos
-            random.shuffle(todos_nomes)
-            todos_nomes = todos_nomes[:200]
-            
-            classes = ['1A', '1B', '1C', '2A', '2B', '2C', '3A', '3B', '3C']
-            
-            # Criar 200 alunos com diferentes perfis de risco
-            # Divisão: 20 Alto Risco, 60 Médio Risco, 120 Baixo Risco
-            num_alto = 20
-            num_medio = 60
-            
-            for i in range(200):
-                nome = todos_nomes[i]
-                
-                if i < num_alto: # Alto Risco (20 alunos)
-                    risk_level = 'Alto'
-                    risk_score = random.uniform(65, 90)
-                    attendance = random.uniform(30, 50)
-                    grades = random.uniform(2.0, 4.0)
-                    participation = random.uniform(10, 30)
-                    absences = random.randint(25, 50)
-                    socioeconomic = random.uniform(1.0, 2.0)
-                    
-                elif i < num_alto + num_medio: # Médio Risco (60 alunos)
-                    risk_level = 'Médio'
-                    risk_score = random.uniform(40, 60)
-                    attendance = random.uniform(50, 70)
-                    grades = random.uniform(4.0, 6.0)
-                    participation = random.uniform(30, 60)
-                    absences = random.randint(10, 25)
-                    socioeconomic = random.uniform(2.0, 3.5)
-                    
-                else: # Baixo Risco (120 alunos)
-                    risk_level = 'Baixo'
-                    risk_score = random.uniform(10, 30)
-                    attendance = random.uniform(75, 98)
-                    grades = random.uniform(6.5, 10)
-                    participation = random.uniform(65, 95)
-                    absences = random.randint(0, 10)
-                    socioeconomic = random.uniform(3.5, 5.0)
-                
-                # Arredondamento final dos valores antes da inserção
-                final_risk_score = round(risk_score, 2)
-                final_attendance = round(attendance, 2)
-                final_grades = round(grades, 2)
-                final_participation = round(participation, 2)
-                final_socioeconomic = round(socioeconomic, 1)
-                
-                cur.execute('''
-                    INSERT INTO students 
-                    (name, class, attendance, grades, participation, absences, socioeconomic, risk_score, risk_level)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                ''', (
-                    nome,
-                    random.choice(classes),
-                    final_attendance,
-                    final_grades,
-                    final_participation,
-                    absences,
-                    final_socioeconomic,
-                    final_risk_score,
-                    str(risk_level).strip() # Garantia de string pura na inserção
-                ))
-                
-                student_id = cur.fetchone()['id']
-                
-                # Criar alertas para alunos de alto risco
-                if risk_level == 'Alto':
-                    alert_types = [
-                        ('Frequência Crítica', f'{nome} tem frequência de apenas {attendance:.1f}%', 'Alta'),
-                        ('Notas Baixas', f'{nome} está com média {grades:.1f}', 'Alta'),
-                        ('Risco de Evasão', f'{nome} apresenta múltiplos indicadores de risco', 'Alta')
-                    ]
-                    
-                    for alert_type, message, severity in alert_types[:random.randint(1, 2)]:
-                        cur.execute('''
-                            INSERT INTO alerts (student_id, alert_type, message, severity)
-                            VALUES (%s, %s, %s, %s)
-                        ''', (student_id, alert_type, message, severity))
-            
-            # Criar dados de evolução mensal (últimos 6 meses)
-            for i in range(6):
-                month = datetime.now() - timedelta(days=30*i)
-                high_risk = random.randint(35 - i*2, 45 - i*2)
-                medium_risk = random.randint(55 - i, 65 - i)
-                low_risk = 200 - high_risk - medium_risk
-                
-                cur.execute('''
-                    INSERT INTO monthly_stats 
-                    (month, total_students, high_risk, medium_risk, low_risk, avg_attendance, avg_grades)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ''', (
-                    month.date(),
-                    200,
-                    high_risk,
-                    medium_risk,
-                    low_risk,
-                    random.uniform(70, 80),
-                    random.uniform(6, 7.5)
-                ))
-            
+            # 200 alunos com perfis 20 Alto, 60 Médio e 120 Baixo (nível pela fórmula);
+            # sem histórico inventado, apenas o registro real do mês atual
+            inserted = generate_dataset(conn, students=200, months=1)
+            record_history_baseline(cur)
+            snapshot_month(cur, baselines=True)
+            publish_change(cur, 'reset')
             conn.commit()
-            print(f"✓ Dados iniciais populados com sucesso! {len(todos_nomes)} alunos criados.")
+            print(f"✓ Dados iniciais populados com sucesso! {inserted['students']} alunos criados.")
         else:
-            print(f"✓ Banco de dados já contém {count} alunos.")
+            print("✓ Banco de dados já contém alunos.")
         
         cur.close()
     except Exception as e:
         print(f"ERRO ao popular dados iniciais: {e}")
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise e
-    finally:
-        if conn:
-            conn.close()
 
 # ========================================
 # INICIALIZAÇÃO AUTOMÁTICA AO INICIAR
 # ========================================
+def setup_database():
+    """Aplica migrações e popula dados iniciais sob advisory lock.
+
+    Com vários workers iniciando juntos, apenas um executa a migração; os demais
+    esperam o lock e encontram o schema já atualizado.
+    """
+    conn = get_db_connection()
+    try:
+        with migration_lock(conn):
+            init_db(conn)
+            populate_initial_data(conn)
+    finally:
+        conn.close()
+
 def initialize_app():
     """Inicializa o banco automaticamente quando a app inicia"""
     try:
         print("=" * 60)
         print("🚀 INICIALIZANDO EDUXO")
         print("=" * 60)
-        init_db()
-        populate_initial_data()
+        setup_database()
         print("=" * 60)
         print("✓ EDUXO inicializado com sucesso!")
         print("=" * 60)
+        return True
     except Exception as e:
         print(f"❌ ERRO na inicialização: {e}")
         print("⚠️  A aplicação pode não funcionar corretamente!")
+        return False
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Aplica as migrações e popula os dados iniciais (passo de deploy)."""
+    if not initialize_app():
+        raise click.ClickException("Falha na inicialização do banco de dados")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Aplica as migrações pendentes do schema."""
+    conn = get_db_connection()
+    try:
+        with migration_lock(conn):
+            init_db(conn)
+    finally:
+        conn.close()
+
+def load_dataset(conn, reset=False, months=6, **options):
+    """Migra o schema e gera os dados sintéticos (seed.generate_dataset) com commit.
+
+    Também grava o ponto de partida do histórico, atualiza as estatísticas, grava
+    o mês atual com as referências das regras de alerta e avisa os clientes.
+    Retorna as quantidades por tabela.
+    """
+    with migration_lock(conn):
+        init_db(conn)
+        cur = conn.cursor()
+        if reset:
+            reset_tables(cur)
+        inserted = generate_dataset(conn, months=months, **options)
+        record_history_baseline(cur)
+        # Estatísticas atualizadas para o planejador depois de uma carga grande
+        cur.execute('ANALYZE students')
+        cur.execute('ANALYZE alerts')
+        cur.execute('ANALYZE interventions')
+        cur.execute('ANALYZE student_metric_history')
+        if months:
+            snapshot_month(cur, baselines=True)
+            inserted['monthly_stats'] += 1
+        publish_change(cur, 'reset')
+        conn.commit()
+        cur.close()
+    return inserted
+
+@app.cli.command('seed')
+@click.option('--students', default=200, show_default=True, help='Quantidade de alunos.')
+@click.option('--classes', default=','.join(CLASSES), show_default=True, help='Turmas separadas por vírgula.')
+@click.option('--risk-mix', default='0.1,0.3,0.6', show_default=True, help='Proporção dos perfis Alto,Médio,Baixo (o nível vem da fórmula).')
+@click.option('--alerts-per-student', default=2, show_default=True, help='Máximo de alertas por aluno de Alto risco.')
+@click.option('--interventions-per-student', default=0.0, show_default=True, help='Média de intervenções por aluno.')
+@click.option('--months', default=6, show_default=True, help='Meses de histórico.')
+@click.option('--seed', 'seed_value', type=int, default=None, help='Semente para gerar sempre os mesmos dados.')
+@click.option('--reset', is_flag=True, help='Apaga os dados existentes antes de gerar.')
+def seed_command(students, classes, risk_mix, alerts_per_student, interventions_per_student, months, seed_value, reset):
+    """Gera dados sintéticos em lote (COPY) para desenvolvimento e testes de carga."""
+    try:
+        mix = [float(value) for value in risk_mix.split(',')]
+    except ValueError:
+        raise click.BadParameter('use três números separados por vírgula', param_hint='--risk-mix')
+    
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        inserted = load_dataset(
+            conn, reset=reset, students=students, classes=[c.strip() for c in classes.split(',') if c.strip()],
+            risk_mix=mix, alerts_per_student=alerts_per_student,
+            interventions_per_student=interventions_per_student, months=months, seed=seed_value,
+            progress=lambda done, total: print(f"   {done}/{total} alunos")
+        )
+    except ValueError as ve:
+        raise click.ClickException(str(ve))
+    finally:
+        conn.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"✓ {inserted['students']} alunos, {inserted['alerts']} alertas, "
+          f"{inserted['interventions']} intervenções e {inserted['monthly_stats']} meses gerados em {elapsed:.1f}s")
+
+@app.cli.command('recompute-risk')
+@click.option('--chunk-size', default=RECOMPUTE_CHUNK_SIZE, show_default=True, help='Alunos por lote.')
+def recompute_risk_command(chunk_size):
+    """Recalcula o score de risco de todos os alunos com a fórmula atual."""
+    conn = get_db_connection()
+    try:
+        for progress in recompute_risk_scores(conn, chunk_size=chunk_size):
+            print(f"   {progress['processed']}/{progress['total']} alunos, "
+                  f"{progress['updated']} atualizados ({progress['elapsed']:.1f}s)")
+    except RuntimeError as re:
+        raise click.ClickException(str(re))
+    finally:
+        conn.close()
+    print(f"✓ Recálculo concluído: {progress['updated']} alunos atualizados, {progress['skipped']} ignorados, "
+          f"{progress['alerts']} alertas criados")
+
+@app.cli.command('snapshot')
+@click.option('--month', type=click.DateTime(formats=['%Y-%m', '%Y-%m-%d']), default=None,
+              help='Mês gravado com os totais atuais (padrão: mês corrente).')
+@click.option('--backfill', type=click.File('r', encoding='utf-8'), default=None,
+              help='CSV de histórico por aluno (month, student_id, attendance, grades, participation, absences, socioeconomic).')
+def snapshot_command(month, backfill):
+    """Grava o registro mensal (monthly_stats) a partir dos dados reais."""
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        rows = backfill_from_csv(cur, backfill) if backfill else [snapshot_month(cur, month, baselines=True)]
+        conn.commit()
+        cur.close()
+    except ValueError as ve:
+        raise click.ClickException(str(ve))
+    finally:
+        conn.close()
+    for row in rows:
+        print(f"   {row['month']:%Y-%m}: {row['total_students']} alunos, {row['high_risk']} alto / "
+              f"{row['medium_risk']} médio / {row['low_risk']} baixo risco")
+    print(f"✓ {len(rows)} mês(es) gravado(s) em {time.perf_counter() - started:.1f}s")
+
+@app.cli.command('import-students')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--rejects', type=click.File('w', encoding='utf-8'), default=None,
+              help='Grava as linhas recusadas (com os motivos) neste CSV.')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Linhas validadas por bloco.')
+def import_students_command(file, rejects, chunk_size):
+    """Importa alunos de um CSV (linhas com id atualizam, sem id inserem)."""
+    started = time.perf_counter()
+    shown = []
+    
+    def on_reject(line, errors, row):
+        if len(shown) < 20:
+            shown.append((line, errors))
+    
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        summary = import_students_csv(cur, file, on_reject=RejectsReport(rejects) if rejects else on_reject,
+                                      chunk_size=chunk_size)
+        conn.commit()
+        cur.close()
+    except ValueError as ve:
+        raise click.ClickException(str(ve))
+    finally:
+        conn.close()
+    for line, errors in shown:
+        print(f"   linha {line}: {'; '.join(errors)}")
+    print(f"✓ {summary['read']} linhas lidas em {time.perf_counter() - started:.1f}s: {summary['inserted']} inseridas, "
+          f"{summary['updated']} atualizadas, {summary['unchanged']} sem mudança, {summary['rejected']} recusadas, "
+          f"{summary['alerts']} alertas criados")
+
+@app.cli.command('evaluate-alerts')
+def evaluate_alerts_command():
+    """Avalia as regras de alerta ativas sobre todos os alunos."""
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        result = evaluate_alert_rules(cur)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    for alert_type, created in result['by_rule'].items():
+        print(f"   {alert_type}: {created}")
+    print(f"✓ {result['created']} alertas criados em {time.perf_counter() - started:.1f}s")
 
-# A inicialização é feita pelo frontend através da rota /api/init para garantir que o banco de dados esteja pronto antes de carregar os dados.
-# initialize_app() # Comentado para evitar problemas de concorrência na inicialização do Render.
+@app.cli.command('check-plans')
+@click.option('--students', default=200000, show_default=True, help='Quantidade de alunos sintéticos.')
+def check_plans_command(students):
+    """Falha se alguma consulta frequente usar seq scan em um volume grande."""
+    conn = get_db_connection()
+    try:
+        failures = check_query_plans(conn, students=students)
+    finally:
+        conn.close()
+    if failures:
+        raise click.ClickException(f"{len(failures)} consulta(s) com seq scan")
+    print("✓ Todas as consultas frequentes usam índices")
+
+@app.cli.command('bench-serialization')
+@click.option('--rows', default=10000, show_default=True, help='Alunos lidos por rodada.')
+@click.option('--repeat', default=5, show_default=True, help='Rodadas por variante (vale a melhor).')
+def bench_serialization_command(rows, repeat):
+    """Compara CPU e bytes por 10 mil linhas entre os caminhos de serialização de alunos."""
+    std_json = DefaultJSONProvider(app)
+    fast_json = OrjsonProvider(app) if orjson else std_json
+    fields = list(STUDENT_FIELDS)
+    
+    def legacy(conn):
+        # Caminho antigo: RealDictCursor, DECIMAL convertido linha a linha e json da biblioteca padrão
+        cur = conn.cursor()
+        cur.execute(f"SELECT {', '.join(fields)} FROM students ORDER BY id LIMIT %s", (rows,))
+        students = []
+        for row in cur.fetchall():
+            student = dict(row)
+            for field in STUDENT_DECIMAL_FIELDS:
+                student[field] = float(student[field])
+            student['risk_level'] = str(student['risk_level']).strip()
+            students.append(student)
+        return std_json.response(students)
+    
+    def native_rows(provider, columnar=False):
+        def run(conn):
+            cur = conn.cursor(cursor_factory=extensions.cursor)
+            cur.execute(f"SELECT {student_select_list(fields)} FROM students ORDER BY id LIMIT %s", (rows,))
+            return provider.response(rows_payload(fields, cur.fetchall(), columnar=columnar))
+        return run
+    
+    variants = [
+        ('antigo (Decimal -> float em Python, json)', legacy),
+        ('float8 no SQL + tuplas, json', native_rows(std_json)),
+        (f'float8 no SQL + tuplas, {JSON_ENCODER if orjson else "json"}', native_rows(fast_json)),
+        (f'colunar, {JSON_ENCODER if orjson else "json"}', native_rows(fast_json, columnar=True)),
+    ]
+    with app.app_context(), db_connection() as conn:
+        baseline = None
+        for name, variant in variants:
+            best = None
+            for _ in range(repeat):
+                started = time.process_time()
+                body = variant(conn).get_data()
+                elapsed = time.process_time() - started
+                best = elapsed if best is None else min(best, elapsed)
+            count = min(rows, len(json.loads(body)) if body.startswith(b'[') else len(json.loads(body)['rows']))
+            per_10k = 10000 / max(count, 1)
+            cpu_ms, size_kb = best * 1000 * per_10k, len(body) * per_10k / 1024
+            baseline = baseline or (cpu_ms, size_kb)
+            print(f"   {name:<45} {cpu_ms:8.1f} ms CPU  {size_kb:8.0f} KB  "
+                  f"({cpu_ms / baseline[0]:.0%} CPU, {size_kb / baseline[1]:.0%} bytes) por 10 mil linhas")
 
-# Função de cálculo de risco
-def calculate_risk_score(attendance, grades, participation, absences, socioeconomic):
-    """Calcula o score de risco de evasão com base nos 5 indicadores."""
-    # A fórmula original é:
-    # (100 - attendance) * 0.3 +
-    # (10 - grades) * 10 * 0.25 +
-    # (100 - participation) * 0.2 +
-    # absences * 0.15 +
-    # (6 - socioeconomic) * 4 * 0.1
+@app.cli.command('bench-http')
+@click.option('--sizes', default='10000,100000,1000000', show_default=True, help='Volumes de alunos, separados por vírgula.')
+@click.option('--scenarios', default=None, help='Cenários, separados por vírgula (padrão: todos).')
+@click.option('--concurrency', default=8, show_default=True, help='Clientes simultâneos.')
+@click.option('--duration', default=10.0, show_default=True, help='Segundos medidos por cenário.')
+@click.option('--warmup', default=2.0, show_default=True, help='Segundos de aquecimento por cenário (não medidos).')
+@click.option('--workers', default=2, show_default=True, help='Workers do gunicorn iniciado pelo benchmark.')
+@click.option('--port', default=18000, show_default=True, help='Porta do gunicorn iniciado pelo benchmark.')
+@click.option('--seed', 'seed_value', default=42, show_default=True, help='Semente dos dados e das requisições.')
+@click.option('--database-url', default=None,
+              help='Banco a usar (os dados são apagados); sem ele é criado um banco temporário.')
+@click.option('--url', default=None, help='Servidor já em execução (deve usar o banco de --database-url).')
+@click.option('--no-seed', is_flag=True, help='Mede os dados existentes em --database-url, sem gerar novos.')
+@click.option('--yes', is_flag=True, help='Não pede confirmação para apagar os dados de --database-url.')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default=None, help='Grava o resultado em JSON.')
+@click.option('--compare', 'baseline', type=click.File('r', encoding='utf-8'), default=None,
+              help='Resultado JSON de outro commit para comparar.')
+@click.option('--max-regression', type=float, default=None,
+              help='Falha se o p95 de algum cenário piorar mais que esta porcentagem em relação a --compare.')
+def bench_http_command(sizes, scenarios, concurrency, duration, warmup, workers, port, seed_value,
+                       database_url, url, no_seed, yes, output, baseline, max_regression):
+    """Mede latência, vazão e SQL por requisição das rotas principais sob carga."""
+    # Importado só aqui: os workers do servidor não carregam o benchmark
+    from bench import SCENARIOS, compare_results, run_benchmark, temporary_database
     
-    risk_score = (
-        (100 - attendance) * 0.3 +
-        (10 - grades) * 10 * 0.25 +
-        (100 - participation) * 0.2 +
-        absences * 0.15 +
-        (6 - socioeconomic) * 4 * 0.1
-    )
+    try:
+        sizes = [int(size) for size in sizes.split(',') if size.strip()]
+    except ValueError:
+        raise click.BadParameter('use números separados por vírgula', param_hint='--sizes')
+    scenarios = [name.strip() for name in (scenarios or ','.join(SCENARIOS)).split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise click.BadParameter(f"desconhecido(s): {', '.join(unknown)}", param_hint='--scenarios')
+    if (url or no_seed) and not database_url:
+        raise click.UsageError('--url e --no-seed exigem --database-url')
+    if database_url and not no_seed and not yes:
+        click.confirm('Os dados de --database-url serão apagados. Continuar?', abort=True)
+    # Leituras antes das escritas, na ordem de SCENARIOS
+    scenarios = [name for name in SCENARIOS if name in scenarios]
     
-    risk_level = 'Alto' if risk_score > 60 else 'Médio' if risk_score > 35 else 'Baixo'
+    def prepare(dsn, students):
+        conn = get_db_connection(dsn)
+        try:
+            load_dataset(conn, reset=True, students=students, seed=seed_value)
+        finally:
+            conn.close()
+    
+    options = dict(sizes=sizes, scenarios=scenarios, prepare=None if no_seed else prepare, base_url=url,
+                   port=port, workers=workers, concurrency=concurrency, duration=duration, warmup=warmup,
+                   seed=seed_value)
+    try:
+        if database_url:
+            document = run_benchmark(database_url, **options)
+        else:
+            with temporary_database(DATABASE_URL) as dsn:
+                document = run_benchmark(dsn, **options)
+    except RuntimeError as re:
+        raise click.ClickException(str(re))
     
-    return round(risk_score, 2), risk_level
+    if output:
+        json.dump(document, output, indent=2)
+        output.write('\n')
+    if baseline:
+        lines, regressions = compare_results(json.load(baseline), document, max_regression)
+        print("Comparação com a base:")
+        for line in lines:
+            print(line)
+        if regressions:
+            raise click.ClickException(f"{len(regressions)} cenário(s) com p95 pior que {max_regression}%: "
+                                       + ', '.join(f'{name} ({students})' for students, name in regressions))
+
+@app.cli.command('check-aggregates')
+def check_aggregates_command():
+    """Compara os agregados por turma com os dados de students."""
+    conn = get_db_connection()
+    try:
+        mismatches = check_class_summary(conn)
+    finally:
+        conn.close()
+    for mismatch in mismatches:
+        print(f"   {mismatch['class']}.{mismatch['column']}: gravado {mismatch['stored']}, esperado {mismatch['expected']}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} divergência(s); rode 'flask --app app rebuild-aggregates'")
+    print("✓ Agregados por turma consistentes")
+
+@app.cli.command('maintain-history')
+@click.option('--keep-months', default=HISTORY_RETENTION_MONTHS, show_default=True,
+              help='Meses de histórico mantidos; as partições anteriores são apagadas (0 = não apaga nada).')
+def maintain_history_command(keep_months):
+    """Cria as próximas partições do histórico e, com --keep-months, apaga as vencidas."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        result = maintain_history(cur, keep_months=keep_months)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    for name in result['created']:
+        print(f"   criada: {name}")
+    for name in result['dropped']:
+        print(f"   apagada: {name}")
+    print(f"✓ Histórico: {len(result['created'])} partição(ões) criada(s), {len(result['dropped'])} apagada(s)")
+
+@app.cli.command('rebuild-aggregates')
+def rebuild_aggregates_command():
+    """Recalcula do zero os agregados por turma."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        classes = rebuild_class_summary(cur)
+        publish_change(cur, 'reset')
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    print(f"✓ Agregados recalculados para {classes} turma(s)")
+
+# A inicialização (migrações e dados iniciais, com DDL) roda uma vez por implantação:
+# no gunicorn, pelo master em on_starting; com "flask run", na primeira requisição;
+# com AUTO_INIT_DB=0, apenas no passo de deploy "flask --app app init-db". Importar
+# a app não toca no banco: cada worker só confere o schema, sem DDL (start_worker).
+AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '1') == '1'
+
+def check_schema():
+    """Confere, sem DDL, se o schema está na versão mais recente; retorna a versão"""
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            version = schema_status(cur)
+            cur.close()
+    except Exception as e:
+        print(f"⚠️  Não foi possível conferir o schema: {e}")
+        return None
+    if version < LATEST_VERSION:
+        print(f"⚠️  Schema na versão {version} de {LATEST_VERSION}: execute \"flask --app app init-db\"")
+    return version
+
+def start_worker():
+    """Prepara um processo que atende requisições (post_worker_init do gunicorn)"""
+    check_schema()
+    # Mantém o registro do mês atual em monthly_stats (SNAPSHOT_INTERVAL=0 desliga)
+    if SNAPSHOT_INTERVAL > 0:
+        start_snapshot_scheduler()
+
+_dev_server_started = False
+_dev_server_lock = threading.Lock()
+
+@app.before_request
+def start_dev_server():
+    """Com "flask run" (sem os hooks do gunicorn), inicializa na primeira requisição"""
+    global _dev_server_started
+    if _dev_server_started or not os.environ.get('FLASK_RUN_FROM_CLI'):
+        return
+    with _dev_server_lock:
+        if not _dev_server_started:
+            if AUTO_INIT_DB:
+                initialize_app()
+            start_worker()
+            _dev_server_started = True
 
 # Rotas da API
 @app.route('/')
@@ -329,196 +526,865 @@ def serve_frontend():
 
 def clear_db():
     """Limpa todas as tabelas para forçar a repopulação de dados"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Deleta dados das tabelas filhas primeiro
-        cur.execute('DELETE FROM alerts;')
-        cur.execute('DELETE FROM interventions;')
-        cur.execute('DELETE FROM monthly_stats;')
-        # Deleta dados da tabela pai
-        cur.execute('DELETE FROM students;')
-        conn.commit()
-        cur.close()
-        print("✓ Banco de dados limpo com sucesso.")
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Deleta dados das tabelas filhas primeiro
+            cur.execute('DELETE FROM alerts;')
+            cur.execute('DELETE FROM interventions;')
+            cur.execute('DELETE FROM monthly_stats;')
+            cur.execute('TRUNCATE student_metric_history;')
+            # Deleta dados da tabela pai
+            cur.execute('DELETE FROM students;')
+            rebuild_class_summary(cur)
+            publish_change(cur, 'reset')
+            conn.commit()
+            cur.close()
+            print("✓ Banco de dados limpo com sucesso.")
     except Exception as e:
         print(f"ERRO ao limpar o banco de dados: {e}")
-        if conn:
-            conn.rollback()
         raise e
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/clear_db', methods=['POST'])
 def clear_db_endpoint():
-    """Endpoint temporário para limpar o banco de dados"""
+    """Endpoint temporário para limpar o banco de dados e repopular os dados de teste"""
     try:
         clear_db()
-        return jsonify({'message': 'Banco de dados limpo com sucesso. Recarregue o frontend para repopular.', 'status': 'ok'})
+        setup_database()
+        return jsonify({'message': 'Banco de dados limpo e repopulado com sucesso.', 'status': 'ok'})
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'clear_error'}), 500
 
-@app.route('/api/init', methods=['POST'])
+@app.route('/api/init', methods=['GET', 'POST'])
 def initialize():
-    """Endpoint manual de inicialização (mantido para compatibilidade)"""
+    """Informa se o banco está pronto (mantido para compatibilidade).
+
+    Não executa DDL: as migrações rodam no master do gunicorn ao iniciar ou no
+    passo de deploy "flask --app app init-db".
+    """
     try:
-        init_db()
-        populate_initial_data()
-        return jsonify({'message': 'Banco de dados inicializado com sucesso', 'status': 'ok'})
+        with db_connection() as conn:
+            cur = conn.cursor()
+            version = schema_status(cur)
+            has_data = False
+            if version:
+                cur.execute('SELECT EXISTS (SELECT 1 FROM students) AS has_data')
+                has_data = cur.fetchone()['has_data']
+            cur.close()
+        
+        if version < LATEST_VERSION:
+            return jsonify({
+                'error': 'Migrações pendentes. Execute "flask --app app init-db".',
+                'status': 'pending_migrations',
+                'schema_version': version,
+                'latest_version': LATEST_VERSION
+            }), 503
+        return jsonify({
+            'message': 'Banco de dados inicializado',
+            'status': 'ok',
+            'schema_version': version,
+            'latest_version': LATEST_VERSION,
+            'has_data': has_data
+        })
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'initialization_error'}), 500
 
+# ========================================
+# ROTAS ADMINISTRATIVAS
+# ========================================
+# Se ADMIN_TOKEN estiver definido, as rotas /api/admin exigem o cabeçalho X-Admin-Token
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Linhas recusadas listadas na resposta JSON da importação
+IMPORT_REJECTS_MAX = 1000
+
+def admin_forbidden():
+    """Retorna uma resposta 403 se o token de administrador não conferir"""
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Acesso restrito a administradores', 'status': 'forbidden'}), 403
+    return None
+
+@app.route('/api/admin/recompute-risk', methods=['POST'])
+def recompute_risk_endpoint():
+    """Recalcula o risco de todos os alunos, transmitindo o progresso em NDJSON"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    chunk_size = request.args.get('chunk_size', RECOMPUTE_CHUNK_SIZE, type=int)
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size deve ser positivo', 'status': 'invalid_parameter'}), 400
+    
+    def generate():
+        try:
+            with db_connection() as conn:
+                for progress in recompute_risk_scores(conn, chunk_size=chunk_size):
+                    yield json.dumps(progress) + '\n'
+        except RuntimeError as re:
+            yield json.dumps({'status': 'busy', 'error': str(re)}) + '\n'
+        except Exception as e:
+            yield json.dumps({'status': 'error', 'error': str(e)}) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/admin/evaluate-alerts', methods=['POST'])
+def evaluate_alerts_endpoint():
+    """Avalia as regras de alerta ativas sobre todos os alunos"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            started = time.perf_counter()
+            result = evaluate_alert_rules(cur)
+            conn.commit()
+            cur.close()
+        return jsonify({'status': 'ok', **result, 'elapsed': round(time.perf_counter() - started, 2)})
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'evaluation_error'}), 500
+
+@app.route('/api/admin/alert-rules/<int:rule_id>', methods=['PUT'])
+def update_alert_rule_endpoint(rule_id):
+    """Altera uma regra de alerta (kind, threshold, severity, message, enabled)"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    values, errors = validate_rule_update(request.get_json(silent=True))
+    if errors:
+        return jsonify({'error': '; '.join(errors), 'status': 'invalid_rule'}), 400
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            rule = update_alert_rule(cur, rule_id, values)
+            if rule is None:
+                conn.rollback()
+                return jsonify({'error': 'Regra não encontrada', 'status': 'not_found'}), 404
+            conn.commit()
+            cur.close()
+        return jsonify(rule)
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_rule'}), 400
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'update_error'}), 500
+
+@app.route('/api/admin/import-students', methods=['POST'])
+def import_students_endpoint():
+    """Importa alunos de um CSV enviado como arquivo (campo "file") ou corpo text/csv.
+    
+    O upload é lido em blocos (o Werkzeug guarda arquivos grandes em disco). A
+    resposta traz o resumo e as primeiras IMPORT_REJECTS_MAX linhas recusadas;
+    com ?report=csv, o relatório completo das recusadas vem em CSV.
+    """
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    as_csv = request.args.get('report') == 'csv'
+    # O relatório completo só sai da memória para o disco se crescer
+    report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode='w+', encoding='utf-8', newline='')
+    shown = []
+    
+    def on_reject(line, errors, row):
+        if len(shown) < IMPORT_REJECTS_MAX:
+            shown.append({'line': line, 'errors': errors, 'row': row})
+    
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            summary = import_students_csv(cur, text, on_reject=RejectsReport(report) if as_csv else on_reject)
+            conn.commit()
+            cur.close()
+    except (ValueError, UnicodeDecodeError) as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_file'}), 400
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'import_error'}), 500
+    
+    if as_csv:
+        report.seek(0)
+        response = Response(iter(lambda: report.read(64 * 1024), ''), mimetype='text/csv')
+        response.headers['X-Import-Summary'] = json.dumps(summary)
+        return response
+    return jsonify({'status': 'ok', **summary, 'rejected_rows': shown,
+                    'rejected_truncated': summary['rejected'] > len(shown)})
+
+# ========================================
+# ROTEAMENTO DE LEITURAS (RÉPLICAS)
+# ========================================
+# Depois de uma escrita, o cliente recebe este cookie e suas leituras ficam no
+# primário por DB_STICKY_SECONDS, sem ver uma réplica ainda atrasada
+PRIMARY_COOKIE = 'eduxo_primary_until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+# Rotas POST que só leem (não prendem o cliente ao primário)
+READ_ONLY_ENDPOINTS = {'simulate_risk_endpoint'}
+
+@app.before_request
+def route_reads():
+    """Prende as leituras da requisição ao primário se o cliente escreveu há pouco"""
+    if get_replica_router() is None:
+        return
+    until = request.cookies.get(PRIMARY_COOKIE, type=float)
+    routing = RequestRouting(primary=until is not None and until > time.time())
+    request.environ['eduxo.routing'] = set_request_routing(routing)
+
+@app.after_request
+def stick_to_primary(response):
+    """Marca o cliente que acabou de escrever para ler do primário"""
+    if (get_replica_router() is not None and request.method in WRITE_METHODS
+            and request.endpoint not in READ_ONLY_ENDPOINTS and response.status_code < 400):
+        response.set_cookie(PRIMARY_COOKIE, f'{time.time() + DB_STICKY_SECONDS:.3f}',
+                            max_age=max(1, round(DB_STICKY_SECONDS)), httponly=True, samesite='Lax')
+    return response
+
+@app.teardown_request
+def reset_read_routing(exc):
+    token = request.environ.pop('eduxo.routing', None)
+    if token is not None:
+        reset_request_routing(token)
+
+# ========================================
+# GET CONDICIONAL (ETag / Last-Modified)
+# ========================================
+def check_not_modified(cur):
+    """Lê a versão dos dados e responde 304 se o cliente já tem esta versão.
+
+    Retorna (validadores, resposta 304 ou None). O ETag combina a versão global
+    dos dados com a URL completa, já que os parâmetros mudam o corpo.
+    """
+    version, modified_at = get_data_version(cur)
+    digest = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+    validators = (version, f'{version}-{digest}', modified_at)
+    if is_resource_modified(request.environ, etag=validators[1], last_modified=modified_at):
+        return validators, None
+    cur.close()
+    return validators, add_validators(Response(status=304), validators)
+
+def add_validators(response, validators):
+    """Inclui ETag/Last-Modified e obriga o navegador a revalidar a cada uso"""
+    _, etag, modified_at = validators
+    response.set_etag(etag)
+    if modified_at:
+        response.last_modified = modified_at
+    response.cache_control.no_cache = True
+    return response
+
+# ========================================
+# LISTAGEM PAGINADA DE ALUNOS
+# ========================================
+STUDENT_FIELDS = (
+    'id', 'name', 'class', 'attendance', 'grades', 'participation', 'absences',
+    'socioeconomic', 'risk_score', 'risk_level', 'created_at', 'updated_at'
+)
+STUDENT_DECIMAL_FIELDS = ('attendance', 'grades', 'participation', 'socioeconomic', 'risk_score')
+STUDENT_SORT_FIELDS = ('risk_score', 'name', 'attendance', 'grades', 'participation', 'absences')
+STUDENTS_PAGE_DEFAULT = 50
+STUDENTS_PAGE_MAX = 500
+
+def encode_cursor(values):
+    """Codifica a posição (valor de ordenação, id) de forma opaca para o cliente"""
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodifica um cursor gerado por encode_cursor()"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Cursor inválido') from e
+    if not isinstance(values, list) or len(values) != 2 or not isinstance(values[1], int):
+        raise ValueError('Cursor inválido')
+    return values
+
+def build_student_filters(args):
+    """Monta a cláusula WHERE (e parâmetros) dos filtros risk_level/class/search"""
+    where = ' WHERE 1=1'
+    params = []
+    
+    risk_level = args.get('risk_level')
+    class_name = args.get('class')
+    search = args.get('search')
+    
+    if risk_level:
+        where += ' AND risk_level = %s'
+        params.append(risk_level)
+    
+    if class_name:
+        where += ' AND class = %s'
+        params.append(class_name)
+    
+    if search:
+        where += ' AND LOWER(name) LIKE %s'
+        params.append(f'%{search.lower()}%')
+    
+    return where, params
+
+def student_select_list(fields, http_dates=True):
+    """Lista do SELECT já com tipos nativos do JSON (DECIMAL como float8, nível sem
+    espaços e, com http_dates, datas já formatadas como o jsonify as formataria).
+
+    Os aliases têm o nome da coluna; para ordenar pela coluna original (e usar os
+    índices), qualifique com "students." no ORDER BY.
+    """
+    expressions = []
+    for field in fields:
+        if field in STUDENT_DECIMAL_FIELDS:
+            expressions.append(f'{field}::float8 AS {field}')
+        elif field == 'risk_level':
+            expressions.append('trim(risk_level) AS risk_level')
+        elif http_dates and field in ('created_at', 'updated_at'):
+            expressions.append(f'{sql_http_date(field)} AS {field}')
+        else:
+            expressions.append(field)
+    return ', '.join(expressions)
+
+def parse_student_fields(fields_arg, sort):
+    """Valida a projeção ?fields= (id e a coluna de ordenação são sempre incluídos)"""
+    if not fields_arg:
+        return list(STUDENT_FIELDS)
+    fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+    invalid = [f for f in fields if f not in STUDENT_FIELDS]
+    if invalid:
+        raise ValueError(f"Campos inválidos: {', '.join(invalid)}")
+    for required in (sort, 'id'):
+        if required not in fields:
+            fields.insert(0, required)
+    return fields
+
 @app.route('/api/students')
 def get_students():
-    """Retorna lista de alunos com filtros opcionais"""
-    risk_level = request.args.get('risk_level')
-    class_name = request.args.get('class')
-    search = request.args.get('search')
+    """Retorna uma página de alunos com filtros, projeção e ordenação no servidor.
+
+    Paginação por cursor (keyset) sobre (coluna de ordenação, id): a resposta traz
+    os cabeçalhos X-Next-Cursor (ausente na última página) e X-Total-Count
+    (calculado apenas na primeira página, sem cursor). Com ?format=columns o corpo
+    vem no formato colunar {columns, rows}, mais compacto para listas grandes.
+    """
+    sort = request.args.get('sort', 'risk_score')
+    order = request.args.get('order', 'desc').lower()
+    cursor = request.args.get('cursor')
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        query = 'SELECT * FROM students WHERE 1=1'
-        params = []
-        
-        if risk_level:
-            query += ' AND risk_level = %s'
-            params.append(risk_level)
-        
-        if class_name:
-            query += ' AND class = %s'
-            params.append(class_name)
-        
-        if search:
-            query += ' AND LOWER(name) LIKE %s'
-            params.append(f'%{search.lower()}%')
-        
-        query += ' ORDER BY risk_score DESC'
-        
-        cur.execute(query, params)
-        students_raw = cur.fetchall()
-        
-        # Converte campos numéricos para float para evitar erros de serialização no frontend
-        students = []
-        for s in students_raw:
-            s_converted = dict(s)
-            s_converted['attendance'] = float(s_converted['attendance'])
-            s_converted['grades'] = float(s_converted['grades'])
-            s_converted['participation'] = float(s_converted['participation'])
-            s_converted['socioeconomic'] = float(s_converted['socioeconomic'])
-            s_converted['risk_score'] = float(s_converted['risk_score'])
-            s_converted['risk_level'] = str(s_converted['risk_level']).strip() # Garante que seja string e remove espaços em branco
-            students.append(s_converted)
+        if sort not in STUDENT_SORT_FIELDS:
+            raise ValueError(f"Ordenação inválida: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Direção de ordenação inválida: {order}")
+        limit = int(request.args.get('limit', STUDENTS_PAGE_DEFAULT))
+        if not 1 <= limit <= STUDENTS_PAGE_MAX:
+            raise ValueError(f"limit deve estar entre 1 e {STUDENTS_PAGE_MAX}")
+        fields = parse_student_fields(request.args.get('fields'), sort)
+        after = decode_cursor(cursor) if cursor else None
+        page_format = request.args.get('format', 'objects')
+        if page_format not in ('objects', 'columns'):
+            raise ValueError(f"Formato inválido: {page_format} (use objects ou columns)")
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
             
-        cur.close()
-        return jsonify(students)
+            where, params = build_student_filters(request.args)
+            
+            total = None
+            if after is None:
+                cur.execute('SELECT COUNT(*) as count FROM students' + where, params)
+                total = cur.fetchone()['count']
+            
+            query = f"SELECT {student_select_list(fields)} FROM students" + where
+            page_params = list(params)
+            # NULL ordena como o maior valor (padrão do Postgres e dos índices): primeiro
+            # na ordem desc, por último na asc. O cursor guarda o NULL como null e o
+            # predicado segue a mesma regra, sem pular nem repetir essas linhas
+            if after is not None:
+                value, last_id = after
+                if order == 'desc' and value is None:
+                    query += f' AND ({sort} IS NOT NULL OR id < %s)'
+                    page_params.append(last_id)
+                elif order == 'desc':
+                    query += f' AND ({sort}, id) < (%s, %s)'
+                    page_params.extend(after)
+                elif value is None:
+                    query += f' AND {sort} IS NULL AND id > %s'
+                    page_params.append(last_id)
+                else:
+                    query += f' AND (({sort}, id) > (%s, %s) OR {sort} IS NULL)'
+                    page_params.extend(after)
+            
+            # Busca uma linha a mais para saber se existe próxima página
+            nulls = 'FIRST' if order == 'desc' else 'LAST'
+            query += f' ORDER BY students.{sort} {order.upper()} NULLS {nulls}, id {order.upper()} LIMIT %s'
+            page_params.append(limit + 1)
+            
+            # Os valores já vêm com tipos nativos do JSON: tuplas simples bastam
+            row_cur = conn.cursor(cursor_factory=extensions.cursor)
+            row_cur.execute(query, page_params)
+            rows = row_cur.fetchall()
+            row_cur.close()
+            cur.close()
+            
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            
+            response = jsonify(rows_payload(fields, rows, columnar=page_format == 'columns'))
+            if total is not None:
+                response.headers['X-Total-Count'] = str(total)
+            if has_next:
+                last = rows[-1]
+                response.headers['X-Next-Cursor'] = encode_cursor([last[fields.index(sort)], last[fields.index('id')]])
+            return add_validators(response, validators)
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'query_error'}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ========================================
+# DETALHES DE ALUNOS (UMA ÚNICA CONSULTA)
+# ========================================
+STUDENT_DETAILS_MAX_IDS = 100
+STUDENT_DETAILS_EMBED_DEFAULT = 10
+STUDENT_DETAILS_EMBED_MAX = 100
+
+def sql_http_date(column):
+    """Formata um timestamp no SQL como o jsonify do Flask (RFC 822, GMT)"""
+    return f"""to_char({column}, 'Dy, DD Mon YYYY HH24:MI:SS "GMT"')"""
+
+# Monta o JSON de cada aluno no próprio Postgres (numéricos já como float8), com
+# os alertas e intervenções mais recentes limitados por aluno e os totais, para o
+# cliente saber se a lista veio truncada. LIMIT NULL não limita.
+STUDENT_DETAILS_QUERY = f'''
+    SELECT s.id, json_build_object(
+        'student', json_build_object(
+            'id', s.id, 'name', s.name, 'class', s.class,
+            'attendance', s.attendance::float8, 'grades', s.grades::float8,
+            'participation', s.participation::float8, 'absences', s.absences,
+            'socioeconomic', s.socioeconomic::float8, 'risk_score', s.risk_score::float8,
+            'risk_level', trim(s.risk_level),
+            'created_at', {sql_http_date('s.created_at')}, 'updated_at', {sql_http_date('s.updated_at')}
+        ),
+        'alerts', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', a.id, 'student_id', a.student_id, 'alert_type', a.alert_type,
+                'message', a.message, 'severity', a.severity,
+                'created_at', {sql_http_date('a.created_at')}, 'resolved', a.resolved
+            ) ORDER BY a.created_at DESC)
+            FROM (
+                SELECT * FROM alerts WHERE student_id = s.id
+                ORDER BY created_at DESC LIMIT %(alerts_limit)s
+            ) AS a
+        ), '[]'),
+        'alerts_total', (SELECT COUNT(*) FROM alerts WHERE student_id = s.id),
+        'interventions', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', i.id, 'student_id', i.student_id, 'intervention_type', i.intervention_type,
+                'description', i.description, 'status', i.status,
+                'created_at', {sql_http_date('i.created_at')}, 'completed_at', {sql_http_date('i.completed_at')}
+            ) ORDER BY i.created_at DESC)
+            FROM (
+                SELECT * FROM interventions WHERE student_id = s.id
+                ORDER BY created_at DESC LIMIT %(interventions_limit)s
+            ) AS i
+        ), '[]'),
+        'interventions_total', (SELECT COUNT(*) FROM interventions WHERE student_id = s.id)
+    )::text AS detail
+    FROM unnest(%(ids)s::int[]) WITH ORDINALITY AS requested (id, position)
+    JOIN students s ON s.id = requested.id
+    ORDER BY requested.position
+'''
+
+def parse_embed_limit(name, default):
+    """Valida ?alerts_limit= / ?interventions_limit= (None = sem limite)"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    limit = int(value)
+    if not 0 <= limit <= STUDENT_DETAILS_EMBED_MAX:
+        raise ValueError(f"{name} deve estar entre 0 e {STUDENT_DETAILS_EMBED_MAX}")
+    return limit
+
+def fetch_student_details(cur, ids, alerts_limit=None, interventions_limit=None):
+    """Retorna [(id, JSON do detalhe)] dos alunos encontrados, na ordem de ids"""
+    cur.execute(STUDENT_DETAILS_QUERY, {
+        'ids': ids, 'alerts_limit': alerts_limit, 'interventions_limit': interventions_limit,
+    })
+    return [(row['id'], row['detail']) for row in cur.fetchall()]
 
 @app.route('/api/students/<int:student_id>')
 def get_student(student_id):
-    """Retorna detalhes de um aluno específico"""
-    conn = None
+    """Retorna detalhes de um aluno específico (aluno, alertas e intervenções)"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('SELECT * FROM students WHERE id = %s', (student_id,))
-        student_raw = cur.fetchone()
-        
-        if not student_raw:
-            return jsonify({'error': 'Aluno não encontrado'}), 404
-            
-        # Converte campos numéricos para float para evitar erros de serialização no frontend
-        student = dict(student_raw)
-        student['attendance'] = float(student['attendance'])
-        student['grades'] = float(student['grades'])
-        student['participation'] = float(student['participation'])
-        student['socioeconomic'] = float(student['socioeconomic'])
-        student['risk_score'] = float(student['risk_score'])
-        student['risk_level'] = str(student['risk_level']).strip() # Garante que seja string e remove espaços em branco
-        
-        cur.execute('''
-            SELECT * FROM alerts 
-            WHERE student_id = %s 
-            ORDER BY created_at DESC
-        ''', (student_id,))
-        alerts = cur.fetchall()
-        
-        cur.execute('''
-            SELECT * FROM interventions 
-            WHERE student_id = %s 
-            ORDER BY created_at DESC
-        ''', (student_id,))
-        interventions = cur.fetchall()
+        alerts_limit = parse_embed_limit('alerts_limit', None)
+        interventions_limit = parse_embed_limit('interventions_limit', None)
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            
+            details = fetch_student_details(cur, [student_id], alerts_limit, interventions_limit)
+            cur.close()
+            
+            if not details:
+                return jsonify({'error': 'Aluno não encontrado'}), 404
+            
+            # O corpo já vem serializado do banco
+            return add_validators(Response(details[0][1], mimetype='application/json'), validators)
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'query_error'}), 500
+
+@app.route('/api/students/details')
+def get_students_details():
+    """Retorna os detalhes de vários alunos (?ids=1,2,3) em uma única consulta.
+    
+    Cada aluno traz no máximo alerts_limit alertas e interventions_limit
+    intervenções (padrão STUDENT_DETAILS_EMBED_DEFAULT), mais os totais.
+    Ids inexistentes voltam em not_found.
+    """
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+        if not ids:
+            raise ValueError('Informe ao menos um id em ?ids=')
+        if any(not 0 < student_id < 2**31 for student_id in ids):
+            raise ValueError('ids devem ser inteiros positivos')
+        if len(ids) > STUDENT_DETAILS_MAX_IDS:
+            raise ValueError(f'Máximo de {STUDENT_DETAILS_MAX_IDS} alunos por requisição')
+        alerts_limit = parse_embed_limit('alerts_limit', STUDENT_DETAILS_EMBED_DEFAULT)
+        interventions_limit = parse_embed_limit('interventions_limit', STUDENT_DETAILS_EMBED_DEFAULT)
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            
+            details = fetch_student_details(cur, ids, alerts_limit, interventions_limit)
+            cur.close()
+            
+            found = {student_id for student_id, _ in details}
+            body = '{"students":[%s],"not_found":%s}' % (
+                ','.join(detail for _, detail in details),
+                json.dumps([student_id for student_id in ids if student_id not in found]),
+            )
+            return add_validators(Response(body, mimetype='application/json'), validators)
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'query_error'}), 500
+
+# ========================================
+# EXPORTAÇÃO DE ALUNOS (STREAMING)
+# ========================================
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+def stream_students_export(where, params, fields, export_format):
+    """Gera a exportação em blocos de EXPORT_CHUNK_SIZE linhas.
+    
+    Usa um cursor nomeado (no servidor): só um bloco fica em memória por vez,
+    qualquer que seja o número de alunos. No NDJSON cada linha já vem montada
+    pelo Postgres.
+    """
+    query = f'SELECT {student_select_list(fields, http_dates=False)} FROM students{where} ORDER BY id'
+    if export_format == 'ndjson':
+        query = f'SELECT row_to_json(e)::text FROM ({query}) AS e'
+    
+    with db_connection(readonly=True) as conn:
+        cur = conn.cursor('students_export', cursor_factory=extensions.cursor)
+        cur.itersize = EXPORT_CHUNK_SIZE
+        cur.execute(query, params)
         
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(fields)
+        while True:
+            rows = cur.fetchmany(EXPORT_CHUNK_SIZE)
+            if export_format == 'csv':
+                writer.writerows(rows)
+            else:
+                buffer.writelines(row[0] + '\n' for row in rows)
+            chunk = buffer.getvalue()
+            if chunk:
+                yield chunk
+            if not rows:
+                break
+            buffer.seek(0)
+            buffer.truncate()
         cur.close()
-        
-        return jsonify({
-            'student': student,
-            'alerts': alerts,
-            'interventions': interventions
-        })
+
+@app.route('/api/students/export')
+def export_students():
+    """Exporta os alunos em CSV ou NDJSON (?format=), transmitidos em blocos.
+    
+    Aceita os mesmos filtros (risk_level, class, search) e a mesma projeção
+    (?fields=) de /api/students; as linhas saem ordenadas por id.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato inválido: {export_format} (use csv ou ndjson)")
+        fields = parse_student_fields(request.args.get('fields'), 'id')
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    where, params = build_student_filters(request.args)
+    chunks = stream_students_export(where, params, fields, export_format)
+    try:
+        # O primeiro bloco é lido aqui para que falhas de conexão ou de consulta
+        # ainda virem uma resposta de erro, antes de o streaming começar
+        first = next(chunks)
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'query_error'}), 500
-    finally:
-        if conn:
-            conn.close()
+    
+    def generate():
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            # Os cabeçalhos já foram enviados: o arquivo sai truncado
+            print(f"ERRO na exportação de alunos: {e}")
+    
+    filename = f"alunos_{datetime.now():%Y%m%d_%H%M%S}.{export_format}"
+    response = Response(generate(), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @app.route('/api/students/<int:student_id>', methods=['PUT'])
 def update_student(student_id):
     """Atualiza dados de um aluno"""
-    data = request.json
+    data = request.get_json(silent=True)
+    # Mesma validação do lote: zeros são valores válidos, campos ausentes não
+    values, errors = validate_student_update({**data, 'id': student_id} if isinstance(data, dict) else data)
+    if errors:
+        return jsonify({'error': '; '.join(errors), 'status': 'invalid_student'}), 400
+    attendance, grades, participation, absences, socioeconomic = (values[field] for field in METRIC_FIELDS)
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        attendance = data.get('attendance')
-        grades = data.get('grades')
-        participation = data.get('participation')
-        absences = data.get('absences')
-        socioeconomic = data.get('socioeconomic')
-        
-        if all([attendance, grades, participation, absences, socioeconomic]):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            
             risk_score, risk_level = calculate_risk_score(attendance, grades, participation, absences, socioeconomic)
             
-            cur.execute('''
-                UPDATE students 
-                SET attendance = %s, grades = %s, participation = %s, 
-                    absences = %s, socioeconomic = %s, risk_score = %s, 
-                    risk_level = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
+            # Atualiza o aluno, os agregados da turma e os alertas das regras na mesma instrução
+            cur.execute(f'''
+                WITH changed AS (
+                    UPDATE students AS s
+                    SET attendance = %s, grades = %s, participation = %s, 
+                        absences = %s, socioeconomic = %s, risk_score = %s, 
+                        risk_level = %s, updated_at = CURRENT_TIMESTAMP
+                    FROM (SELECT * FROM students WHERE id = %s FOR NO KEY UPDATE) AS old
+                    WHERE s.id = old.id
+                    RETURNING s.id, s.name, {SUMMARY_RETURNING}
+                ),
+                {SUMMARY_DELTA},
+                {history_cte('update')},
+                {ALERTS_CTE}
+                SELECT (SELECT COUNT(*) FROM changed) AS updated,
+                       (SELECT COALESCE(json_agg(new_alerts ORDER BY id), '[]') FROM new_alerts) AS alerts
             ''', (attendance, grades, participation, absences, socioeconomic, 
                   risk_score, risk_level, student_id))
-        
-        conn.commit()
-        return jsonify({'message': 'Aluno atualizado com sucesso', 'risk_score': risk_score, 'risk_level': risk_level}), 200
+            result = cur.fetchone()
+            if not result['updated']:
+                conn.rollback()
+                return jsonify({'error': 'Aluno não encontrado'}), 404
+            alerts = result['alerts']
+            publish_change(cur, 'student_changed', id=student_id, risk_score=risk_score, risk_level=risk_level,
+                           alerts=len(alerts))
+
+            conn.commit()
+            return jsonify({'message': 'Aluno atualizado com sucesso', 'risk_score': risk_score, 'risk_level': risk_level,
+                            'alerts': alerts}), 200
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'update_error'}), 500
-    finally:
-        if conn:
-            conn.close()
 
+# ========================================
+# ATUALIZAÇÃO EM LOTE DE ALUNOS
+# ========================================
+BULK_UPDATE_MAX_ROWS = int(os.environ.get('BULK_UPDATE_MAX_ROWS', 50000))
+
+def validate_student_update(item):
+    """Valida uma atualização do lote; retorna (valores normalizados, lista de erros)"""
+    if not isinstance(item, dict):
+        return None, ['Cada item deve ser um objeto JSON']
+    errors = []
+    student_id = item.get('id')
+    if isinstance(student_id, bool) or not isinstance(student_id, int) or student_id <= 0:
+        errors.append('id deve ser um inteiro positivo')
+    values = {'id': student_id}
+    for field, (low, high) in METRIC_RANGES.items():
+        value = item.get(field)
+        if value is None:
+            errors.append(f'{field} é obrigatório')
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors.append(f'{field} deve ser numérico')
+        elif field == 'absences' and not float(value).is_integer():
+            errors.append('absences deve ser inteiro')
+        elif not low <= value <= high:
+            errors.append(f'{field} deve estar entre {low} e {high}')
+        else:
+            # Arredondado à escala da coluna, como o banco grava, antes do score
+            values[field] = int(value) if field == 'absences' else round(float(value), METRIC_SCALES[field])
+    return (None if errors else values), errors
+
+def parse_bulk_body():
+    """Lê o corpo como array JSON ou NDJSON (um objeto por linha)"""
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError('O corpo deve ser um array JSON ou NDJSON')
+    return items
 
+def apply_student_updates(conn, updates):
+    """Aplica atualizações já validadas com um único UPDATE ... FROM (VALUES ...).
+
+    Calcula os scores de todas as linhas de uma vez (NumPy). Linhas idênticas ao
+    que já está gravado não são reescritas; as alteradas passam pelas regras de
+    alerta na mesma instrução. Retorna {id: (risk_score, risk_level, alterado,
+    tipos dos alertas criados)} apenas dos alunos encontrados. Não faz commit.
+    """
+    if not updates:
+        return {}
+    columns = {field: np.array([u[field] for u in updates], dtype=float) for field in METRIC_FIELDS}
+    scores, levels = calculate_risk_scores(*(columns[field] for field in METRIC_FIELDS))
+    values = [
+        (u['id'], u['attendance'], u['grades'], u['participation'], u['absences'], u['socioeconomic'], score, level)
+        for u, score, level in zip(updates, scores.tolist(), levels)
+    ]
+    cur = conn.cursor()
+    # "old" trava os alunos em ordem de id e guarda os valores anteriores,
+    # usados para aplicar os deltas em class_summary
+    rows = execute_values(cur, f'''
+        WITH v (id, attendance, grades, participation, absences, socioeconomic, risk_score, risk_level) AS (
+            VALUES %s
+        ),
+        old AS (
+            SELECT st.* FROM students st JOIN v ON v.id = st.id
+            ORDER BY st.id
+            FOR NO KEY UPDATE OF st
+        ),
+        changed AS (
+            UPDATE students AS s
+            SET attendance = v.attendance, grades = v.grades, participation = v.participation,
+                absences = v.absences, socioeconomic = v.socioeconomic, risk_score = v.risk_score,
+                risk_level = v.risk_level, updated_at = CURRENT_TIMESTAMP
+            FROM v, old
+            WHERE s.id = v.id AND old.id = v.id
+              AND (old.attendance, old.grades, old.participation, old.absences, old.socioeconomic, old.risk_score, old.risk_level)
+                  IS DISTINCT FROM
+                  (v.attendance, v.grades, v.participation, v.absences, v.socioeconomic, v.risk_score, v.risk_level)
+            RETURNING s.id, s.name, {SUMMARY_RETURNING}
+        ),
+        {SUMMARY_DELTA},
+        {history_cte('bulk')},
+        {ALERTS_CTE}
+        SELECT old.id, changed.id IS NOT NULL AS changed,
+               (SELECT array_agg(alert_type ORDER BY alert_type) FROM new_alerts WHERE student_id = old.id) AS alerts
+        FROM old
+        LEFT JOIN changed ON changed.id = old.id
+    ''', values, template='(%s, %s::numeric, %s::numeric, %s::numeric, %s::integer, %s::numeric, %s::numeric, %s)',
+        page_size=len(values), fetch=True)
+    cur.close()
+    found = {row['id']: (row['changed'], row['alerts'] or []) for row in rows}
+    return {
+        u['id']: (score, level, *found[u['id']])
+        for u, score, level in zip(updates, scores.tolist(), levels) if u['id'] in found
+    }
+
+@app.route('/api/students/bulk', methods=['POST'])
+def bulk_update_students():
+    """Atualiza os indicadores de vários alunos em uma única transação.
+
+    Aceita um array JSON ou NDJSON com objetos {id, attendance, grades,
+    participation, absences, socioeconomic}. Linhas inválidas não impedem as
+    demais; a resposta traz o resultado de cada linha, na ordem de envio
+    (updated, unchanged, not_found ou invalid).
+    """
+    try:
+        items = parse_bulk_body()
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_body'}), 400
+    if len(items) > BULK_UPDATE_MAX_ROWS:
+        return jsonify({'error': f'Máximo de {BULK_UPDATE_MAX_ROWS} alunos por requisição', 'status': 'too_large'}), 413
+    
+    results = []
+    updates = []
+    seen_ids = set()
+    for index, item in enumerate(items):
+        values, errors = validate_student_update(item)
+        if values and values['id'] in seen_ids:
+            values, errors = None, ['id repetido no lote']
+        result = {'index': index, 'id': item.get('id') if isinstance(item, dict) else None}
+        if errors:
+            result.update(status='invalid', errors=errors)
+        else:
+            seen_ids.add(values['id'])
+            updates.append(values)
+        results.append(result)
+    
+    try:
+        with db_connection() as conn:
+            applied = apply_student_updates(conn, updates)
+            changed_count = sum(1 for _, _, changed, _ in applied.values() if changed)
+            alerts_count = sum(len(alerts) for _, _, _, alerts in applied.values())
+            if changed_count:
+                publish_change(conn.cursor(), 'students_changed', count=changed_count, alerts=alerts_count)
+            conn.commit()
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'update_error'}), 500
+    
+    summary = {'updated': 0, 'unchanged': 0, 'not_found': 0, 'invalid': 0}
+    for result in results:
+        if 'status' not in result:
+            if result['id'] in applied:
+                risk_score, risk_level, changed, alerts = applied[result['id']]
+                result.update(status='updated' if changed else 'unchanged', risk_score=risk_score, risk_level=risk_level)
+                if alerts:
+                    result['alerts'] = alerts
+            else:
+                result['status'] = 'not_found'
+        summary[result['status']] += 1
+    
+    return jsonify({'status': 'ok', **summary, 'alerts': alerts_count, 'results': results})
 
 @app.route('/api/students/<int:student_id>/interventions', methods=['POST'])
 def add_intervention(student_id):
@@ -530,86 +1396,145 @@ def add_intervention(student_id):
     if not all([intervention_type, description]):
         return jsonify({'error': 'Tipo e descrição da intervenção são obrigatórios'}), 400
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            INSERT INTO interventions (student_id, intervention_type, description, status)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, created_at
-        ''', (student_id, intervention_type, description, 'Pendente'))
-        
-        new_intervention = cur.fetchone()
-        conn.commit()
-        cur.close()
-        
-        return jsonify({
-            'message': 'Intervenção adicionada com sucesso',
-            'id': new_intervention['id'],
-            'created_at': new_intervention['created_at'].isoformat()
-        }), 201
+        with db_connection() as conn:
+            cur = conn.cursor()
+            
+            cur.execute('''
+                INSERT INTO interventions (student_id, intervention_type, description, status)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id, created_at
+            ''', (student_id, intervention_type, description, 'Pendente'))
+            
+            new_intervention = cur.fetchone()
+            publish_change(cur, 'intervention_created', id=new_intervention['id'], student_id=student_id)
+            conn.commit()
+            cur.close()
+            
+            return jsonify({
+                'message': 'Intervenção adicionada com sucesso',
+                'id': new_intervention['id'],
+                'created_at': new_intervention['created_at'].isoformat()
+            }), 201
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'insert_error'}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/interventions/<int:intervention_id>/complete', methods=['PUT'])
 def complete_intervention(intervention_id):
     """Marca uma intervenção como concluída"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            UPDATE interventions
-            SET status = %s, completed_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            RETURNING id
-        ''', ('Concluída', intervention_id))
-        
-        if cur.rowcount == 0:
-            return jsonify({'error': 'Intervenção não encontrada'}), 404
+        with db_connection() as conn:
+            cur = conn.cursor()
             
-        conn.commit()
-        cur.close()
-        
-        return jsonify({'message': 'Intervenção marcada como concluída com sucesso', 'id': intervention_id}), 200
+            cur.execute('''
+                UPDATE interventions
+                SET status = %s, completed_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING id
+            ''', ('Concluída', intervention_id))
+            
+            if cur.rowcount == 0:
+                return jsonify({'error': 'Intervenção não encontrada'}), 404
+            
+            publish_change(cur, 'intervention_completed', id=intervention_id)
+            conn.commit()
+            cur.close()
+            
+            return jsonify({'message': 'Intervenção marcada como concluída com sucesso', 'id': intervention_id}), 200
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'update_error'}), 500
-    finally:
-        if conn:
-            conn.close()
+# Resultado do dashboard por worker, invalidado pela versão dos dados no banco
+dashboard_cache = VersionedCache(DASHBOARD_CACHE_TTL)
+
+# Consultas independentes do dashboard, executadas em paralelo (run_parallel)
+DASHBOARD_QUERIES = {
+    # Totais e médias a partir dos agregados por turma (uma linha por turma)
+    'stats': ('one', '''
+        SELECT 
+            SUM(students) as total_students,
+            SUM(high_risk) as high_risk,
+            SUM(medium_risk) as medium_risk,
+            SUM(low_risk) as low_risk,
+            SUM(attendance_sum) / NULLIF(SUM(attendance_count), 0) as avg_attendance,
+            SUM(grades_sum) / NULLIF(SUM(grades_count), 0) as avg_grades,
+            SUM(risk_score_sum) / NULLIF(SUM(risk_score_count), 0) as avg_risk_score
+        FROM class_summary
+    '''),
+    'alerts': ('one', 'SELECT COUNT(*) as count FROM alerts WHERE resolved = FALSE'),
+    'classes': ('all', '''
+        SELECT 
+            class,
+            students as total_students,
+            high_risk,
+            medium_risk,
+            low_risk,
+            risk_score_sum / NULLIF(risk_score_count, 0) as avg_risk,
+            attendance_sum / NULLIF(attendance_count, 0) as avg_attendance,
+            grades_sum / NULLIF(grades_count, 0) as avg_grades
+        FROM class_summary
+        WHERE students > 0
+        ORDER BY class
+    '''),
+    # Mesmos tipos de /api/trends (float8, não Decimal) e só as colunas do gráfico
+    'trends': ('all', '''
+        SELECT
+            month,
+            TO_CHAR(month, 'YYYY-MM') as month_label,
+            total_students,
+            high_risk,
+            medium_risk,
+            low_risk,
+            avg_attendance::float8 AS avg_attendance,
+            avg_grades::float8 AS avg_grades
+        FROM monthly_stats
+        ORDER BY month ASC
+    '''),
+}
+
+def query_task(fetch, query):
+    """Tarefa para run_parallel: executa a consulta e busca uma linha ou todas"""
+    def task(cur):
+        cur.execute(query)
+        return cur.fetchone() if fetch == 'one' else cur.fetchall()
+    return task
+
+def server_timing(timings):
+    """Cabeçalho Server-Timing com as durações (ms) de cada etapa"""
+    return ', '.join(f'{name};dur={elapsed}' for name, elapsed in timings.items())
+
 @app.route('/api/dashboard')
 def get_dashboard():
-    """Retorna dados agregados para o dashboard"""
-    conn = None
+    """Retorna dados agregados para o dashboard (em cache até a próxima escrita).
+    
+    As consultas independentes rodam ao mesmo tempo, cada uma com uma conexão do
+    pool; a duração de cada uma vai no cabeçalho Server-Timing.
+    """
+    started = time.perf_counter()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            SELECT 
-                COUNT(*) as total_students,
-            SUM(CASE WHEN risk_level = 'Alto' THEN 1 ELSE 0 END) as high_risk,
-            SUM(CASE WHEN risk_level = 'Médio' THEN 1 ELSE 0 END) as medium_risk,
-            SUM(CASE WHEN risk_level = 'Baixo' THEN 1 ELSE 0 END) as low_risk,
-                AVG(attendance) as avg_attendance,
-                AVG(grades) as avg_grades,
-                AVG(risk_score) as avg_risk_score
-            FROM students
-        ''')
-        stats = cur.fetchone()
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            # A versão é lida antes dos dados: uma escrita concorrente no meio
+            # apenas faz a próxima requisição recalcular
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            cur.close()
+        version = validators[0]
+        body = dashboard_cache.get('dashboard', version)
+        if body is not None:
+            response = Response(body, mimetype='application/json', headers={'X-Cache': 'HIT'})
+            return add_validators(response, validators)
         
-        cur.execute('SELECT COUNT(*) as count FROM alerts WHERE resolved = FALSE')
-        unresolved_alerts = cur.fetchone()['count']
+        # A conexão da verificação já voltou ao pool: cada consulta usa a sua
+        results, timings = run_parallel({
+            name: query_task(fetch, query) for name, (fetch, query) in DASHBOARD_QUERIES.items()
+        }, readonly=True)
+        stats = results['stats']
+        unresolved_alerts = results['alerts']['count']
         
         stats_data = {
             'total_students': int(stats['total_students'] or 0),
@@ -622,24 +1547,8 @@ def get_dashboard():
             'unresolved_alerts': int(unresolved_alerts or 0)
         }
         
-        cur.execute('''
-            SELECT 
-                class,
-                COUNT(*) as total_students,
-                SUM(CASE WHEN risk_level = 'Alto' THEN 1 ELSE 0 END) as high_risk,
-                SUM(CASE WHEN risk_level = 'Médio' THEN 1 ELSE 0 END) as medium_risk,
-                SUM(CASE WHEN risk_level = 'Baixo' THEN 1 ELSE 0 END) as low_risk,
-                AVG(risk_score) as avg_risk,
-                AVG(attendance) as avg_attendance,
-                AVG(grades) as avg_grades
-            FROM students
-            GROUP BY class
-            ORDER BY class
-        ''')
-        classes_raw = cur.fetchall()
-        
         classes_data = []
-        for cls in classes_raw:
+        for cls in results['classes']:
             classes_data.append({
                 'class': cls['class'],
                 'total_students': int(cls['total_students'] or 0),
@@ -650,171 +1559,537 @@ def get_dashboard():
                 'avg_attendance': round(float(cls['avg_attendance'] or 0), 1),
                 'avg_grades': round(float(cls['avg_grades'] or 0), 1)
             })
-            
-        cur.execute('''
-            SELECT * FROM monthly_stats
-            ORDER BY month ASC
-        ''')
-        trends_data = cur.fetchall()
-        
-        cur.close()
         
-        return jsonify({
+        body = app.json.dumps({
             'stats': stats_data,
             'classes': classes_data,
-            'trends': trends_data
+            'trends': results['trends']
+        })
+        dashboard_cache.set('dashboard', version, body)
+        timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+        response = Response(body, mimetype='application/json', headers={
+            'X-Cache': 'MISS', 'Server-Timing': server_timing(timings)
         })
+        return add_validators(response, validators)
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'query_error'}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/trends')
 def get_trends():
     """Retorna dados históricos de risco (monthly_stats) para análise de tendência."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            SELECT 
-                TO_CHAR(month, 'YYYY-MM') as month_label,
-                high_risk,
-                medium_risk,
-                low_risk,
-                avg_attendance,
-                avg_grades
-            FROM monthly_stats
-            ORDER BY month ASC
-        ''')
-        trends = cur.fetchall()
-        
-        # Converte valores decimais para float para JSON
-        for trend in trends:
-            trend['avg_attendance'] = float(trend['avg_attendance'])
-            trend['avg_grades'] = float(trend['avg_grades'])
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
             
-        cur.close()
-        return jsonify(trends)
+            cur.execute('''
+                SELECT 
+                    TO_CHAR(month, 'YYYY-MM') as month_label,
+                    high_risk,
+                    medium_risk,
+                    low_risk,
+                    avg_attendance::float8 AS avg_attendance,
+                    avg_grades::float8 AS avg_grades
+                FROM monthly_stats
+                ORDER BY month ASC
+            ''')
+            trends = cur.fetchall()
+            cur.close()
+            return add_validators(jsonify(trends), validators)
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'query_error'}), 500
-    finally:
-        if conn:
-            conn.close()
     
+# ========================================
+# SIMULAÇÃO DE PESOS E LIMITES DE RISCO
+# ========================================
+@app.route('/api/risk/simulate', methods=['POST'])
+def simulate_risk_endpoint():
+    """Simula a distribuição de risco com outros pesos e limites, sem alterar os scores.
+    
+    Corpo: {"candidates": [{"name", "weights": {...}, "thresholds": {"high", "medium"}}],
+    "changes_limit": N}. Pesos e limites omitidos ficam com os valores atuais. Para
+    cada candidato retorna a distribuição total e por turma, as transições de
+    nível e os alunos que mudariam de nível (os N de maior variação de score).
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'O corpo deve ser um objeto JSON', 'status': 'invalid_body'}), 400
+    items = body.get('candidates')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'candidates deve ser um array não vazio', 'status': 'invalid_body'}), 400
+    if len(items) > SIMULATION_MAX_CANDIDATES:
+        return jsonify({'error': f'Máximo de {SIMULATION_MAX_CANDIDATES} candidatos por requisição', 'status': 'too_large'}), 413
+    changes_limit = body.get('changes_limit', SIMULATION_CHANGES_DEFAULT)
+    if isinstance(changes_limit, bool) or not isinstance(changes_limit, int) or not 0 <= changes_limit <= SIMULATION_CHANGES_MAX:
+        return jsonify({'error': f'changes_limit deve ser um inteiro entre 0 e {SIMULATION_CHANGES_MAX}', 'status': 'invalid_parameter'}), 400
+    
+    candidates = []
+    invalid = []
+    for index, item in enumerate(items):
+        candidate, errors = parse_candidate(item, index)
+        if errors:
+            invalid.append({'index': index, 'errors': errors})
+        candidates.append(candidate)
+    if invalid:
+        return jsonify({'error': 'Candidatos inválidos', 'status': 'invalid_candidates', 'candidates': invalid}), 400
+    
+    started = time.perf_counter()
+    try:
+        with db_connection(readonly=True) as conn:
+            result = simulate_risk(conn, candidates, changes_limit)
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return jsonify(result)
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'simulation_error'}), 500
+
+# ========================================
+# HISTÓRICO DE INDICADORES (student_metric_history)
+# ========================================
+# Janela padrão (dias) quando ?from= não é informado
+HISTORY_WINDOW_DEFAULT_DAYS = 365
+HISTORY_POINTS_DEFAULT = 500
+HISTORY_POINTS_MAX = 5000
+HISTORY_BUCKETS = ('day', 'week', 'month')
+
+def parse_history_window(args):
+    """Lê ?from= e ?to= (AAAA-MM-DD, ambos inclusivos); retorna (início, fim exclusivo).
+
+    Os limites chegam ao SQL como constantes, então o planejador só abre as
+    partições dos meses da janela.
+    """
+    try:
+        end = datetime.fromisoformat(args['to']) + timedelta(days=1) if args.get('to') else None
+        start = datetime.fromisoformat(args['from']) if args.get('from') else None
+    except ValueError:
+        raise ValueError('from e to devem estar no formato AAAA-MM-DD')
+    end = end or datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    start = start or end - timedelta(days=HISTORY_WINDOW_DEFAULT_DAYS)
+    if start >= end:
+        raise ValueError('from deve ser anterior a to')
+    return start, end
+
+@app.route('/api/students/<int:student_id>/history')
+def get_student_history(student_id):
+    """Retorna a evolução dos indicadores de um aluno na janela (?from=, ?to=).
+
+    Pontos em ordem cronológica; com mais de ?limit= pontos, ficam os mais
+    recentes e truncated vem true.
+    """
+    try:
+        start, end = parse_history_window(request.args)
+        limit = int(request.args.get('limit', HISTORY_POINTS_DEFAULT))
+        if not 1 <= limit <= HISTORY_POINTS_MAX:
+            raise ValueError(f"limit deve estar entre 1 e {HISTORY_POINTS_MAX}")
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            
+            cur.execute('''
+                SELECT recorded_at, class, attendance::float8 AS attendance, grades::float8 AS grades,
+                       risk_score::float8 AS risk_score, trim(risk_level) AS risk_level, source
+                FROM student_metric_history
+                WHERE student_id = %s AND recorded_at >= %s AND recorded_at < %s
+                ORDER BY recorded_at DESC
+                LIMIT %s
+            ''', (student_id, start, end, limit + 1))
+            points = cur.fetchall()
+            if not points:
+                cur.execute('SELECT EXISTS (SELECT 1 FROM students WHERE id = %s) AS found', (student_id,))
+                if not cur.fetchone()['found']:
+                    cur.close()
+                    return jsonify({'error': 'Aluno não encontrado'}), 404
+            cur.close()
+            
+            truncated = len(points) > limit
+            return add_validators(jsonify({
+                'student_id': student_id,
+                'from': start.date().isoformat(),
+                'to': (end - timedelta(days=1)).date().isoformat(),
+                'points': points[:limit][::-1],
+                'truncated': truncated
+            }), validators)
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'query_error'}), 500
+
+@app.route('/api/classes/<class_name>/history')
+def get_class_history(class_name):
+    """Retorna as mudanças de indicadores de uma turma agrupadas por ?bucket= (day, week, month).
+
+    Cada período traz quantas mudanças e alunos houve, as médias dos valores
+    gravados e quantas mudanças deixaram o aluno em risco Alto. Os pontos de
+    partida (source = 'baseline') não entram.
+    """
+    bucket = request.args.get('bucket', 'day')
+    try:
+        if bucket not in HISTORY_BUCKETS:
+            raise ValueError(f"bucket deve ser um de: {', '.join(HISTORY_BUCKETS)}")
+        start, end = parse_history_window(request.args)
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            
+            cur.execute('''
+                SELECT date_trunc(%s, recorded_at)::date AS period,
+                       COUNT(*) AS changes,
+                       COUNT(DISTINCT student_id) AS students,
+                       ROUND(AVG(attendance), 2)::float8 AS avg_attendance,
+                       ROUND(AVG(grades), 2)::float8 AS avg_grades,
+                       ROUND(AVG(risk_score), 2)::float8 AS avg_risk_score,
+                       COUNT(*) FILTER (WHERE risk_level = 'Alto') AS high_risk
+                FROM student_metric_history
+                WHERE class = %s AND recorded_at >= %s AND recorded_at < %s AND source <> 'baseline'
+                GROUP BY 1
+                ORDER BY 1
+            ''', (bucket, class_name, start, end))
+            periods = cur.fetchall()
+            cur.close()
+            for period in periods:
+                period['period'] = period['period'].isoformat()
+            return add_validators(jsonify(periods), validators)
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'query_error'}), 500
+
+# ========================================
+# FEED DE ALERTAS E RESOLUÇÃO EM LOTE
+# ========================================
+ALERTS_PAGE_DEFAULT = 50
+ALERTS_PAGE_MAX = 500
+BULK_RESOLVE_MAX_IDS = int(os.environ.get('BULK_RESOLVE_MAX_IDS', 50000))
+# Máximo de alertas resolvidos por filtro em uma requisição (acima disso, nada é resolvido)
+BULK_RESOLVE_MAX_ROWS = int(os.environ.get('BULK_RESOLVE_MAX_ROWS', BULK_RESOLVE_MAX_IDS))
+# Filtros aceitos pelo feed e pela resolução em lote: parâmetro -> coluna
+ALERT_FILTERS = {
+    'severity': 'a.severity',
+    'type': 'a.alert_type',
+    'class': 's.class',
+}
+
+def build_alert_filters(args):
+    """Monta a cláusula WHERE (e parâmetros) dos alertas não resolvidos com os
+    filtros severity/type/class (sobre alerts a JOIN students s)"""
+    where = ' WHERE a.resolved = FALSE'
+    params = []
+    for name, column in ALERT_FILTERS.items():
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        if not isinstance(value, str):
+            raise ValueError(f'{name} deve ser um texto')
+        where += f' AND {column} = %s'
+        params.append(value)
+    return where, params
+
 @app.route('/api/alerts')
 def get_alerts():
-    """Retorna alertas recentes"""
-    conn = None
+    """Retorna uma página de alertas não resolvidos, mais recentes primeiro.
+    
+    Filtros severity, type (alert_type) e class. Paginação por cursor sobre
+    (created_at, id), com os mesmos cabeçalhos X-Next-Cursor e X-Total-Count
+    da listagem de alunos.
+    """
+    cursor = request.args.get('cursor')
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            SELECT a.*, s.name as student_name, s.class
-            FROM alerts a
-            JOIN students s ON a.student_id = s.id
-            WHERE a.resolved = FALSE
-            ORDER BY a.created_at DESC
-            LIMIT 50
-        ''')
-        
-        alerts = cur.fetchall()
-        cur.close()
-        return jsonify(alerts)
+        limit = int(request.args.get('limit', ALERTS_PAGE_DEFAULT))
+        if not 1 <= limit <= ALERTS_PAGE_MAX:
+            raise ValueError(f"limit deve estar entre 1 e {ALERTS_PAGE_MAX}")
+        after = decode_cursor(cursor) if cursor else None
+        where, params = build_alert_filters(request.args)
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_parameter'}), 400
+    
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            
+            from_clause = ' FROM alerts a JOIN students s ON a.student_id = s.id' + where
+            total = None
+            if after is None:
+                # Sem filtro por turma, a contagem dispensa o JOIN; alertas sem aluno
+                # (student_id é opcional) ficam de fora, como no JOIN da página
+                count_from = (from_clause if request.args.get('class')
+                              else ' FROM alerts a' + where + ' AND a.student_id IS NOT NULL')
+                cur.execute('SELECT COUNT(*) as count' + count_from, params)
+                total = cur.fetchone()['count']
+            
+            query = 'SELECT a.*, s.name as student_name, s.class' + from_clause
+            page_params = list(params)
+            if after is not None:
+                query += ' AND (a.created_at, a.id) < (%s::timestamp, %s)'
+                page_params.extend(after)
+            
+            # Busca uma linha a mais para saber se existe próxima página
+            query += ' ORDER BY a.created_at DESC, a.id DESC LIMIT %s'
+            page_params.append(limit + 1)
+            cur.execute(query, page_params)
+            alerts = cur.fetchall()
+            cur.close()
+            
+            has_next = len(alerts) > limit
+            alerts = alerts[:limit]
+            
+            response = jsonify(alerts)
+            if total is not None:
+                response.headers['X-Total-Count'] = str(total)
+            if has_next:
+                last = alerts[-1]
+                response.headers['X-Next-Cursor'] = encode_cursor([last['created_at'].isoformat(), last['id']])
+            return add_validators(response, validators)
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'query_error'}), 500
+
+@app.route('/api/alerts/resolve', methods=['POST'])
+def resolve_alerts():
+    """Resolve vários alertas em um único UPDATE.
+    
+    O corpo traz {"ids": [...]} ou {"filter": {"severity", "type", "class"}}
+    (os mesmos filtros do feed, com pelo menos um preenchido; resolver todos os
+    abertos exige {"filter": {}, "all": true}). Por filtro, no máximo
+    BULK_RESOLVE_MAX_ROWS alertas: acima disso nada é resolvido (413).
+    Os alertas são travados em ordem de id, então resoluções concorrentes que
+    se sobrepõem não entram em deadlock. Retorna quantos foram resolvidos.
+    """
+    data = request.get_json(silent=True)
+    try:
+        if not isinstance(data, dict) or ('ids' in data) == ('filter' in data):
+            raise ValueError('Informe "ids" ou "filter" no corpo')
+        if 'ids' in data:
+            ids = data['ids']
+            if not isinstance(ids, list) or not ids:
+                raise ValueError('ids deve ser uma lista não vazia')
+            if any(isinstance(i, bool) or not isinstance(i, int) or not 0 < i < 2**31 for i in ids):
+                raise ValueError('ids devem ser inteiros positivos')
+            if len(ids) > BULK_RESOLVE_MAX_IDS:
+                raise ValueError(f'Máximo de {BULK_RESOLVE_MAX_IDS} alertas por requisição')
+            where, params = ' WHERE a.resolved = FALSE AND a.id = ANY(%s)', [ids]
+            max_rows = BULK_RESOLVE_MAX_IDS
+        else:
+            if not isinstance(data['filter'], dict):
+                raise ValueError('filter deve ser um objeto')
+            unknown = set(data['filter']) - set(ALERT_FILTERS)
+            if unknown:
+                raise ValueError(f"Filtros desconhecidos: {', '.join(sorted(unknown))}")
+            where, params = build_alert_filters(data['filter'])
+            if not params and data.get('all') is not True:
+                raise ValueError('Informe ao menos um filtro (ou "all": true para resolver todos os abertos)')
+            max_rows = BULK_RESOLVE_MAX_ROWS
+    except ValueError as ve:
+        return jsonify({'error': str(ve), 'status': 'invalid_body'}), 400
+    
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f'''
+                WITH target AS (
+                    SELECT a.id FROM alerts a JOIN students s ON a.student_id = s.id
+                    {where}
+                    ORDER BY a.id
+                    LIMIT %s
+                    FOR NO KEY UPDATE OF a
+                )
+                UPDATE alerts SET resolved = TRUE
+                FROM target
+                WHERE alerts.id = target.id AND alerts.resolved = FALSE
+            ''', params + [max_rows + 1])
+            resolved = cur.rowcount
+            if resolved > max_rows:
+                conn.rollback()
+                cur.close()
+                return jsonify({
+                    'error': f'O filtro alcança mais de {max_rows} alertas; refine o filtro ou resolva em partes',
+                    'status': 'too_large'
+                }), 413
+            if resolved:
+                publish_change(cur, 'alerts_resolved', count=resolved)
+            conn.commit()
+            cur.close()
+            return jsonify({'status': 'ok', 'resolved': resolved})
+    except ConnectionError as ce:
+        return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'update_error'}), 500
+
+@app.route('/api/alert-rules')
+def get_alert_rules():
+    """Retorna as regras de alerta configuradas"""
+    try:
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            validators, not_modified = check_not_modified(cur)
+            if not_modified:
+                return not_modified
+            
+            rules = list_alert_rules(cur)
+            cur.close()
+            return add_validators(jsonify(rules), validators)
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'query_error'}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/alerts/<int:alert_id>/resolve', methods=['POST'])
 def resolve_alert(alert_id):
     """Marca um alerta como resolvido"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('UPDATE alerts SET resolved = TRUE WHERE id = %s', (alert_id,))
-        conn.commit()
-        cur.close()
-        return jsonify({'message': 'Alerta resolvido com sucesso'})
+        with db_connection() as conn:
+            cur = conn.cursor()
+            
+            cur.execute('UPDATE alerts SET resolved = TRUE WHERE id = %s', (alert_id,))
+            if cur.rowcount:
+                publish_change(cur, 'alert_resolved', id=alert_id)
+            conn.commit()
+            cur.close()
+            return jsonify({'message': 'Alerta resolvido com sucesso'})
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
-        if conn:
-            conn.rollback()
         return jsonify({'error': str(e), 'status': 'update_error'}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/interventions', methods=['POST'])
 def create_intervention():
     """Cria uma nova intervenção"""
     data = request.json
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            INSERT INTO interventions (student_id, intervention_type, description, status)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id
-        ''', (
-            data['student_id'],
-            data['intervention_type'],
-            data.get('description', ''),
-            data.get('status', 'Pendente')
-        ))
-        
-        intervention_id = cur.fetchone()['id']
-        conn.commit()
-        cur.close()
-        return jsonify({'id': intervention_id, 'message': 'Intervenção criada com sucesso'}), 201
+        with db_connection() as conn:
+            cur = conn.cursor()
+            
+            cur.execute('''
+                INSERT INTO interventions (student_id, intervention_type, description, status)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+            ''', (
+                data['student_id'],
+                data['intervention_type'],
+                data.get('description', ''),
+                data.get('status', 'Pendente')
+            ))
+            
+            intervention_id = cur.fetchone()['id']
+            publish_change(cur, 'intervention_created', id=intervention_id, student_id=data['student_id'])
+            conn.commit()
+            cur.close()
+            return jsonify({'id': intervention_id, 'message': 'Intervenção criada com sucesso'}), 201
     except ConnectionError as ce:
         return jsonify({'error': str(ce), 'status': 'connection_error'}), 500
     except Exception as e:
-        if conn:
-            conn.rollback()
         return jsonify({'error': str(e), 'status': 'insert_error'}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ========================================
+# EVENTOS EM TEMPO REAL (SSE)
+# ========================================
+@app.route('/api/events')
+def stream_events():
+    """Transmite eventos de mudança (alertas, intervenções, risco) em text/event-stream.
+
+    Todos os clientes do worker compartilham uma única conexão LISTEN. Ao conectar,
+    o cliente recebe 'hello' com a versão atual dos dados; se ele informar um
+    Last-Event-ID diferente (reconexão), recebe também 'resync'.
+    """
+    listener = get_listener()
+    # Inscreve antes de ler a versão para não perder eventos entre as duas coisas
+    subscription = listener.subscribe()
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            version, _ = get_data_version(cur)
+            cur.close()
+    except Exception as e:
+        listener.unsubscribe(subscription)
+        return jsonify({'error': str(e), 'status': 'connection_error'}), 500
+    last_event_id = request.headers.get('Last-Event-ID')
+
+    def generate():
+        try:
+            yield 'retry: 5000\n' + sse_frame('hello', {'version': version}, event_id=version)
+            if last_event_id and last_event_id != str(version):
+                yield sse_frame('resync', {'reason': 'stale'})
+            while True:
+                try:
+                    yield subscription.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    # Comentário de keep-alive: mantém proxies abertos e detecta clientes desconectados
+                    yield ': ping\n\n'
+        finally:
+            listener.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 @app.route('/health')
 def health():
     """Endpoint de health check"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT 1')
-        cur.execute('SELECT COUNT(*) as count FROM students')
-        student_count = cur.fetchone()['count']
-        cur.close()
-        return jsonify({
-            'status': 'ok', 
-            'database': 'connected',
-            'students_in_db': student_count
-        })
+        with db_connection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.execute('SELECT COUNT(*) as count FROM students')
+            student_count = cur.fetchone()['count']
+            cur.close()
+            return jsonify({
+                'status': 'ok', 
+                'database': 'connected',
+                'students_in_db': student_count,
+                'pool': get_pool().stats(),
+                'read_replicas': get_replica_router().stats() if get_replica_router() else None,
+                'dashboard_cache': dashboard_cache.stats(),
+                'events': get_listener().stats()
+            })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+        return jsonify({'status': 'error', 'message': str(e), 'pool': get_pool().stats()}), 500
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de todos os workers no formato texto do Prometheus"""
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/admin/slow-queries')
+def slow_queries():
+    """Consultas mais lentas de todos os workers (com SLOW_QUERY_MS > 0)"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    limit = min(max(request.args.get('limit', SLOW_QUERY_BUFFER, type=int), 1), SLOW_QUERY_BUFFER * 10)
+    return jsonify({
+        'enabled': SLOW_QUERY_MS > 0,
+        'threshold_ms': SLOW_QUERY_MS,
+        'explain_rate': SLOW_QUERY_EXPLAIN_RATE,
+        'queries': collect_slow_queries(limit)
+    })
 
 if __name__ == '__main__':
+    if AUTO_INIT_DB:
+        initialize_app()
+    start_worker()
     port = int(os.environ.get('PORT', 10000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,385 @@
+"""Benchmark HTTP de ponta a ponta ("flask --app app bench-http").
+
+Para cada volume (10 mil, 100 mil, 1 milhão de alunos) o banco é populado com o
+gerador determinístico de seed.py e um gunicorn local é exercitado por um
+gerador de carga em malha fechada (N clientes com conexões keep-alive, cada um
+enviando a próxima requisição assim que recebe a resposta). Cada cenário roda
+isolado e reporta latência p50/p95/p99, vazão e instruções SQL por requisição
+(diferença do histograma eduxo_http_request_db_statements de /metrics antes e
+depois do cenário). O resultado em JSON pode ser comparado com o de outro commit
+(compare_results).
+
+Sem --database-url o benchmark cria um banco temporário no mesmo servidor de
+DATABASE_URL e o apaga no final; os dados de desenvolvimento não são tocados.
+"""
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import numpy as np
+import psycopg2
+from psycopg2 import extensions, sql
+
+RESULTS_VERSION = 1
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Intervalo de gravação das métricas do gunicorn iniciado pelo benchmark
+BENCH_METRICS_FLUSH_INTERVAL = 0.5
+SERVER_START_TIMEOUT = 60
+REQUEST_TIMEOUT = 60
+BULK_BENCH_ROWS = 100
+
+
+def _metrics_payload(rng):
+    """Indicadores válidos e não nulos (PUT exige todos os campos preenchidos)"""
+    return {
+        'attendance': round(rng.uniform(40, 100), 2),
+        'grades': round(rng.uniform(2, 10), 2),
+        'participation': round(rng.uniform(30, 100), 2),
+        'absences': rng.randint(1, 40),
+        'socioeconomic': round(rng.uniform(1, 5), 1),
+    }
+
+
+# nome -> (método, rota do Flask (label de /metrics), função (rng, ids dos alunos) -> (caminho, corpo)).
+# Executados nesta ordem: leituras primeiro, pois as escritas alteram os dados medidos
+SCENARIOS = {
+    'students_list': ('GET', '/api/students', lambda rng, ids: ('/api/students?limit=50', None)),
+    'students_list_class': ('GET', '/api/students', lambda rng, ids: (
+        f"/api/students?limit=50&class={rng.choice(('1A', '2B', '3C'))}&sort=name&order=asc", None)),
+    'student_detail': ('GET', '/api/students/<int:student_id>', lambda rng, ids: (
+        f'/api/students/{rng.choice(ids)}', None)),
+    'dashboard': ('GET', '/api/dashboard', lambda rng, ids: ('/api/dashboard', None)),
+    'alerts': ('GET', '/api/alerts', lambda rng, ids: ('/api/alerts?limit=50', None)),
+    'student_update': ('PUT', '/api/students/<int:student_id>', lambda rng, ids: (
+        f'/api/students/{rng.choice(ids)}', _metrics_payload(rng))),
+    'students_bulk': ('POST', '/api/students/bulk', lambda rng, ids: ('/api/students/bulk', [
+        {'id': student_id, **_metrics_payload(rng)}
+        for student_id in rng.sample(ids, min(BULK_BENCH_ROWS, len(ids)))
+    ])),
+    'intervention_create': ('POST', '/api/students/<int:student_id>/interventions', lambda rng, ids: (
+        f'/api/students/{rng.choice(ids)}/interventions',
+        {'intervention_type': 'Acompanhamento', 'description': 'Criada pelo benchmark'})),
+}
+
+
+# ========================================
+# BANCO E SERVIDOR
+# ========================================
+@contextmanager
+def temporary_database(dsn):
+    """Cria um banco vazio no servidor de `dsn` e o apaga ao sair; produz o dsn dele"""
+    name = f'eduxo_bench_{os.getpid()}_{int(time.time())}'
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    try:
+        admin.cursor().execute(sql.SQL('CREATE DATABASE {}').format(sql.Identifier(name)))
+        print(f"✓ Banco temporário {name} criado")
+        yield extensions.make_dsn(dsn, dbname=name)
+    finally:
+        try:
+            admin.cursor().execute(sql.SQL('DROP DATABASE IF EXISTS {} WITH (FORCE)').format(sql.Identifier(name)))
+            print(f"✓ Banco temporário {name} removido")
+        finally:
+            admin.close()
+
+
+def database_info(dsn):
+    """Versão do PostgreSQL e ids dos alunos (sorteados pelos cenários); também roda VACUUM ANALYZE.
+
+    Depois de uma carga com COPY o mapa de visibilidade ainda está vazio; o VACUUM
+    deixa as tabelas no estado estável que os index-only scans encontram em produção.
+    """
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute('VACUUM ANALYZE')
+        cur.execute('SHOW server_version')
+        version = cur.fetchone()[0]
+        cur.execute('SELECT id FROM students ORDER BY id')
+        ids = [row[0] for row in cur]
+        return {'server_version': version, 'ids': ids, 'students': len(ids)}
+    finally:
+        conn.close()
+
+
+@contextmanager
+def gunicorn_server(dsn, port, workers, env=None):
+    """Inicia "gunicorn app:app" apontando para `dsn` e espera /health responder"""
+    metrics_dir = tempfile.mkdtemp(prefix='eduxo-bench-metrics-')
+    server_env = {
+        **os.environ, **(env or {}),
+        'DATABASE_URL': dsn, 'PORT': str(port), 'WEB_CONCURRENCY': str(workers),
+        'AUTO_INIT_DB': '0', 'SNAPSHOT_INTERVAL': '0', 'METRICS_ENABLED': '1',
+        'METRICS_DIR': metrics_dir, 'METRICS_FLUSH_INTERVAL': str(BENCH_METRICS_FLUSH_INTERVAL),
+    }
+    server_env.pop('FLASK_RUN_FROM_CLI', None)
+    log = tempfile.NamedTemporaryFile(prefix='eduxo-bench-gunicorn-', suffix='.log', delete=False)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app'], cwd=BACKEND_DIR, env=server_env,
+        stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"O gunicorn terminou ao iniciar (código {process.returncode}); veja {log.name}")
+            try:
+                if _get(base_url, '/health')[0] == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"O gunicorn não respondeu em {SERVER_START_TIMEOUT}s; veja {log.name}")
+            time.sleep(0.2)
+        print(f"✓ gunicorn com {workers} worker(s) em {base_url} (log em {log.name})")
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        log.close()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def _get(base_url, path):
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=REQUEST_TIMEOUT)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+# ========================================
+# GERADOR DE CARGA
+# ========================================
+_SAMPLE = re.compile(r'^eduxo_http_request_db_statements_(sum|count)\{route="((?:[^"\\]|\\.)*)"\} (\S+)$', re.MULTILINE)
+
+
+def db_statement_totals(base_url):
+    """{rota: [soma, quantidade]} do histograma de instruções SQL por requisição"""
+    status, body = _get(base_url, '/metrics')
+    if status != 200:
+        return {}
+    totals = {}
+    for kind, route, value in _SAMPLE.findall(body.decode()):
+        entry = totals.setdefault(route.replace('\\"', '"').replace('\\\\', '\\'), [0.0, 0.0])
+        entry[0 if kind == 'sum' else 1] = float(value)
+    return totals
+
+
+class LoadClient(threading.Thread):
+    """Cliente em malha fechada com uma conexão keep-alive própria."""
+
+    def __init__(self, base_url, build, method, ids, seed, warmup_until, stop_at):
+        super().__init__(daemon=True)
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.build, self.method, self.ids = build, method, ids
+        self.rng = random.Random(seed)
+        self.warmup_until, self.stop_at = warmup_until, stop_at
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.finished_at = None   # fim da última requisição medida
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        try:
+            while True:
+                started = time.perf_counter()
+                if started >= self.stop_at:
+                    break
+                path, body = self.build(self.rng, self.ids)
+                try:
+                    conn.request(self.method, path, body=None if body is None else json.dumps(body), headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+                    status = None
+                elapsed = time.perf_counter() - started
+                if started < self.warmup_until:
+                    continue
+                if status is None or status >= 400:
+                    self.errors += 1
+                key = str(status) if status is not None else 'connection_error'
+                self.statuses[key] = self.statuses.get(key, 0) + 1
+                self.latencies.append(elapsed)
+                self.finished_at = started + elapsed
+        finally:
+            conn.close()
+
+
+def run_scenario(base_url, name, ids, concurrency, duration, warmup, seed, metrics_wait):
+    """Executa um cenário e retorna latência, vazão e instruções SQL por requisição"""
+    method, route, build = SCENARIOS[name]
+    # O aquecimento não entra nas latências; as métricas são lidas depois dele
+    warmup_until = time.perf_counter() + warmup
+    stop_at = warmup_until + duration
+    clients = [
+        LoadClient(base_url, build, method, ids, seed * 1000 + index, warmup_until, stop_at)
+        for index in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    time.sleep(max(0.0, warmup_until - time.perf_counter()))
+    # Requisições do aquecimento ainda em andamento terminam (e são gravadas) antes da leitura
+    time.sleep(metrics_wait)
+    before = db_statement_totals(base_url).get(route, [0.0, 0.0])
+    for client in clients:
+        client.join()
+    # A janela medida vai até a última requisição concluída (os clientes seguem
+    # enviando durante a espera pelas métricas)
+    finished = [client.finished_at for client in clients if client.finished_at is not None]
+    elapsed = max(finished) - warmup_until if finished else 0.0
+    time.sleep(metrics_wait)
+    after = db_statement_totals(base_url).get(route, [0.0, 0.0])
+
+    latencies = np.array([latency for client in clients for latency in client.latencies]) * 1000
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    counted = after[1] - before[1]
+    result = {
+        'scenario': name,
+        'method': method,
+        'route': route,
+        'requests': int(len(latencies)),
+        'errors': sum(client.errors for client in clients),
+        'status': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        'latency_ms': None,
+        'db_statements_per_request': round((after[0] - before[0]) / counted, 2) if counted > 0 else None,
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result['latency_ms'] = {
+            'p50': round(float(p50), 2), 'p95': round(float(p95), 2), 'p99': round(float(p99), 2),
+            'mean': round(float(latencies.mean()), 2), 'max': round(float(latencies.max()), 2),
+        }
+    return result
+
+
+# ========================================
+# EXECUÇÃO E COMPARAÇÃO
+# ========================================
+def _git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def format_result(students, result):
+    latency = result['latency_ms'] or {}
+    db = result['db_statements_per_request']
+    return (f"   {students:>9} {result['scenario']:<20} {result['throughput_rps'] or 0:>8.1f} req/s  "
+            f"p50 {latency.get('p50', 0):>8.2f}  p95 {latency.get('p95', 0):>8.2f}  "
+            f"p99 {latency.get('p99', 0):>8.2f} ms  SQL/req {'-' if db is None else db:>5}  "
+            f"erros {result['errors']}")
+
+
+def run_benchmark(dsn, sizes, scenarios, prepare=None, base_url=None, port=18000, workers=2,
+                  concurrency=8, duration=10.0, warmup=2.0, seed=42, metrics_wait=None):
+    """Popula cada volume com prepare(dsn, alunos) e mede os cenários.
+
+    Sem base_url inicia um gunicorn local; sem prepare mede os dados existentes
+    (sizes é ignorado).
+    Retorna o documento JSON com meta e results.
+    """
+    commit, dirty = _git_revision()
+    document = {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'commit': commit, 'dirty': dirty,
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'workers': None if base_url else workers, 'concurrency': concurrency,
+            'duration_s': duration, 'warmup_s': warmup, 'seed': seed, 'server_version': None,
+        },
+        'results': [],
+    }
+    if metrics_wait is None:
+        # Servidor externo: espera o intervalo padrão de gravação das métricas dos workers
+        metrics_wait = BENCH_METRICS_FLUSH_INTERVAL * 2 if not base_url else 6.0
+
+    with ExitStack() as stack:
+        url = base_url
+        for students in (sizes if prepare else [None]):
+            if prepare:
+                started = time.perf_counter()
+                prepare(dsn, students)
+                print(f"✓ {students} alunos carregados em {time.perf_counter() - started:.1f}s")
+            info = database_info(dsn)
+            document['meta']['server_version'] = info['server_version']
+            if url is None:
+                # Iniciado depois da primeira carga, com o schema já migrado
+                url = stack.enter_context(gunicorn_server(dsn, port, workers))
+            if not info['students']:
+                print("⚠️  Nenhum aluno no banco; volume ignorado")
+                continue
+            for name in scenarios:
+                result = run_scenario(url, name, info['ids'], concurrency, duration, warmup, seed, metrics_wait)
+                result['students'] = info['students']
+                document['results'].append(result)
+                print(format_result(info['students'], result))
+    return document
+
+
+def compare_results(baseline, current, max_regression=None):
+    """Linhas comparando dois resultados por (alunos, cenário) e a lista de regressões.
+
+    Uma regressão é um p95 pior que o da base em mais de max_regression %.
+    """
+    base = {(result['students'], result['scenario']): result for result in baseline['results']}
+    lines, regressions = [], []
+
+    def change(old, new):
+        if not old or new is None:
+            return '     -'
+        return f'{(new - old) / old:+6.0%}'
+
+    for result in current['results']:
+        key = (result['students'], result['scenario'])
+        old = base.get(key)
+        if old is None or not old['latency_ms'] or not result['latency_ms']:
+            continue
+        p95_change = (result['latency_ms']['p95'] - old['latency_ms']['p95']) / old['latency_ms']['p95']
+        lines.append(
+            f"   {key[0]:>9} {key[1]:<20} p50 {change(old['latency_ms']['p50'], result['latency_ms']['p50'])}  "
+            f"p95 {change(old['latency_ms']['p95'], result['latency_ms']['p95'])}  "
+            f"p99 {change(old['latency_ms']['p99'], result['latency_ms']['p99'])}  "
+            f"vazão {change(old['throughput_rps'], result['throughput_rps'])}  "
+            f"SQL/req {old['db_statements_per_request']} -> {result['db_statements_per_request']}"
+        )
+        if max_regression is not None and p95_change * 100 > max_regression:
+            regressions.append(key)
+    return lines, regressions
@@ -0,0 +1,88 @@
+"""Cache em memória (por worker) invalidado por um contador de versão gravado no Postgres.
+
+Toda transação que altera dados chama events.publish_change() antes do commit: ela
+incrementa o contador (bump_data_version()) e avisa os assinantes do SSE com
+pg_notify. Não chame bump_data_version() direto em uma escrita, ou os clientes
+conectados em /api/events não ficam sabendo da mudança. Como o contador fica no
+banco, todos os workers do gunicorn enxergam a mesma versão e descartam seus
+resultados assim que qualquer um deles grava algo.
+"""
+import os
+import threading
+import time
+
+# Tempo máximo (s) que um resultado fica em cache mesmo sem mudança de versão
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', 300))
+
+
+def bump_data_version(cur):
+    """Incrementa a versão dos dados na transação atual e retorna o novo valor.
+
+    O incremento só fica visível para os outros workers após o commit, junto
+    com os dados alterados. Chame o mais perto possível do commit: a linha do
+    contador fica bloqueada até o fim da transação.
+    """
+    cur.execute('UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP RETURNING version')
+    return cur.fetchone()['version']
+
+
+def get_data_version(cur):
+    """Retorna (versão, momento da última escrita) dos dados.
+
+    Leia antes de consultar os dados que serão guardados em cache.
+    """
+    cur.execute('SELECT version, updated_at::timestamptz AS updated_at FROM data_version')
+    row = cur.fetchone()
+    return (row['version'], row['updated_at']) if row else (0, None)
+
+
+class VersionedCache:
+    """Guarda um valor por chave, válido enquanto a versão não mudar e o TTL não vencer."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}    # chave -> (versão, guardado_em, valor)
+        self._counters = {'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0}
+
+    def get(self, key, version):
+        """Retorna o valor guardado para a versão informada, ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            cached_version, stored_at, value = entry
+            if cached_version != version:
+                self._counters['stale'] += 1
+            elif self.ttl <= 0 or time.monotonic() - stored_at > self.ttl:
+                self._counters['expired'] += 1
+            else:
+                self._counters['hits'] += 1
+                return value
+            self._counters['misses'] += 1
+            del self._entries[key]
+            return None
+
+    def set(self, key, version, value):
+        with self._lock:
+            current = self._entries.get(key)
+            # Uma requisição lenta não sobrescreve um resultado mais novo
+            if current is None or current[0] <= version:
+                self._entries[key] = (version, time.monotonic(), value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores expostos em /health (por worker)"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'pid': os.getpid(),
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                **self._counters,
+                'hit_ratio': round(self._counters['hits'] / lookups, 3) if lookups else None,
+            }
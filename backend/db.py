@@ -0,0 +1,478 @@
+"""Camada de acesso ao banco de dados: conexões diretas e pool por worker.
+
+Com DATABASE_REPLICA_URLS, as rotas somente leitura (db_connection(readonly=True))
+usam as réplicas em rodízio, pulando as que falharem por DB_REPLICA_RETRY_AFTER
+segundos; sem réplica disponível, a leitura vai para o primário. As escritas
+ficam sempre no primário, assim como as leituras de uma requisição marcada com
+RequestRouting(primary=True) (logo depois de uma escrita do mesmo cliente).
+"""
+import contextvars
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+
+from metrics import METRICS_ENABLED, TimedConnection
+
+# Configuração do banco de dados
+DATABASE_URL = os.environ.get('DATABASE_URL', 'postgresql://localhost/evasao_escolar')
+if DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+# Réplicas de leitura (URLs separadas por vírgula; vazio = tudo no primário)
+DATABASE_REPLICA_URLS = [
+    url.strip().replace('postgres://', 'postgresql://', 1) if url.strip().startswith('postgres://') else url.strip()
+    for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()
+]
+# Tempo (s) que uma réplica que falhou fica fora do rodízio
+DB_REPLICA_RETRY_AFTER = float(os.environ.get('DB_REPLICA_RETRY_AFTER', 30))
+# Tempo (s) em que as leituras de um cliente ficam no primário depois de uma escrita dele
+DB_STICKY_SECONDS = float(os.environ.get('DB_STICKY_SECONDS', 5))
+
+# Configuração do pool (por processo/worker do gunicorn)
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+# Tempo máximo (s) esperando uma conexão livre quando o pool está no limite
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Conexões ociosas há mais que isso (s) recebem um SELECT 1 antes de serem entregues
+DB_POOL_CHECK_IDLE = float(os.environ.get('DB_POOL_CHECK_IDLE', 30))
+# Conexões mais antigas que isso (s) são recicladas na devolução (0 = nunca)
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+# Consultas independentes executadas ao mesmo tempo por processo (1 = em série)
+DB_PARALLEL_QUERIES = int(os.environ.get('DB_PARALLEL_QUERIES', 4))
+
+
+def get_db_connection(dsn=None):
+    """Cria uma conexão dedicada (fora do pool) com tratamento de erro.
+
+    Com METRICS_ENABLED, as instruções de todos os cursores são contadas e cronometradas.
+    """
+    try:
+        conn = psycopg2.connect(
+            dsn or DATABASE_URL, cursor_factory=RealDictCursor,
+            connection_factory=TimedConnection if METRICS_ENABLED else None
+        )
+        return conn
+    except Exception as e:
+        print(f"ERRO DE CONEXÃO COM O BANCO DE DADOS: {e}")
+        # Usamos a exceção original do psycopg2 para manter o rastreamento, mas garantimos que a rota a capture
+        raise ConnectionError("Falha ao conectar com o banco de dados. Verifique DATABASE_URL e a disponibilidade do serviço.") from e
+
+
+class PoolTimeout(ConnectionError):
+    """Nenhuma conexão do pool ficou livre a tempo (o banco em si pode estar bem)."""
+
+
+class ConnectionPool:
+    """Pool de conexões thread-safe com limite, espera e health check na retirada."""
+
+    def __init__(self, dsn, minconn, maxconn, timeout, check_idle, max_lifetime):
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []       # [(conn, devolvida_em)]
+        self._created = {}    # id(conn) -> criada_em
+        self._in_use = 0
+        self._opening = 0     # vagas reservadas para conexões sendo abertas
+        self._closed = False
+        self._counters = {
+            'checkouts': 0,
+            'connections_opened': 0,
+            'connections_discarded': 0,
+            'failed_health_checks': 0,
+            'timeouts': 0,
+            'waits': 0,
+        }
+        for _ in range(self.minconn):
+            try:
+                self._idle.append((self._open(), time.monotonic()))
+            except ConnectionError:
+                # O banco pode ainda não estar disponível; as conexões serão abertas sob demanda
+                break
+
+    @property
+    def size(self):
+        return len(self._created)
+
+    def _open(self):
+        conn = get_db_connection(self.dsn)
+        self._created[id(conn)] = time.monotonic()
+        self._counters['connections_opened'] += 1
+        return conn
+
+    def _forget(self, conn):
+        """Tira a conexão da contagem do pool (sob o lock); o fechamento fica com o chamador"""
+        self._created.pop(id(conn), None)
+        self._counters['connections_discarded'] += 1
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        self._forget(conn)
+        self._close(conn)
+
+    def _is_healthy(self, conn, idle_since):
+        """Verifica se a conexão ainda está utilizável antes de entregá-la"""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reserve(self, deadline):
+        """Reserva, sob o lock, uma conexão ociosa ou uma vaga para abrir uma nova.
+
+        Retorna (conexão, ociosa_desde), ou (None, None) para uma vaga. Espera
+        até o prazo se o pool estiver no limite.
+        """
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise ConnectionError("Pool de conexões encerrado.")
+                if self._idle:
+                    self._in_use += 1
+                    return self._idle.pop()
+                if self.size + self._opening < self.maxconn:
+                    self._in_use += 1
+                    self._opening += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Tempo esgotado aguardando conexão livre no pool (máximo de {self.maxconn} conexões)."
+                    )
+                if not waited:
+                    self._counters['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+    def getconn(self):
+        """Retira uma conexão saudável do pool, abrindo uma nova se houver espaço.
+
+        O lock só protege a reserva: a conexão nova e o health check acontecem
+        fora dele, sem bloquear as demais retiradas e devoluções do worker.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, idle_since = self._reserve(deadline)
+            if conn is None:
+                try:
+                    conn = get_db_connection(self.dsn)
+                except BaseException:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._created[id(conn)] = time.monotonic()
+                    self._counters['connections_opened'] += 1
+                    self._counters['checkouts'] += 1
+                return conn
+            if self._is_healthy(conn, idle_since):
+                with self._cond:
+                    self._counters['checkouts'] += 1
+                return conn
+            with self._cond:
+                self._in_use -= 1
+                self._counters['failed_health_checks'] += 1
+                self._forget(conn)
+                self._cond.notify()
+            self._close(conn)
+
+    def putconn(self, conn, discard=False):
+        """Devolve a conexão ao pool, descartando-a se estiver quebrada ou velha demais"""
+        # O rollback de uma transação aberta é feito fora do lock
+        try:
+            if not discard and not conn.closed:
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        broken = discard or conn.closed
+        with self._cond:
+            self._in_use -= 1
+            age = time.monotonic() - self._created.get(id(conn), time.monotonic())
+            if self.max_lifetime and age > self.max_lifetime and self.size > self.minconn:
+                discard = True
+            discard = discard or conn.closed or self._closed
+            if discard:
+                if broken and not self._closed:
+                    # Uma conexão quebrada costuma indicar reinício do servidor:
+                    # força o health check das demais conexões ociosas
+                    self._idle = [(idle_conn, float('-inf')) for idle_conn, _ in self._idle]
+                self._forget(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+            self._cond.notify_all()
+
+    def stats(self):
+        """Estatísticas do pool expostas em /health"""
+        with self._cond:
+            return {
+                'pid': self.pid,
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                **self._counters,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retorna o pool do processo atual, recriando-o após um fork (workers do gunicorn)"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            # Conexões herdadas do processo pai não podem ser compartilhadas; simplesmente as abandonamos
+            _pool = ConnectionPool(
+                DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX,
+                DB_POOL_TIMEOUT, DB_POOL_CHECK_IDLE, DB_POOL_MAX_LIFETIME
+            )
+        return _pool
+
+
+class RequestRouting:
+    """Roteamento das leituras de uma requisição (compartilhado com as consultas paralelas)."""
+
+    __slots__ = ('primary', 'replica')
+
+    def __init__(self, primary=False):
+        self.primary = primary   # leituras no primário (escrita recente do cliente)
+        self.replica = None      # réplica escolhida na primeira leitura (mesma visão nas demais)
+
+
+_request_routing = contextvars.ContextVar('eduxo_request_routing', default=None)
+
+
+def set_request_routing(routing):
+    """Define o roteamento do contexto atual; retorna o token para reset_request_routing"""
+    return _request_routing.set(routing)
+
+
+def reset_request_routing(token):
+    _request_routing.reset(token)
+
+
+class ReplicaRouter:
+    """Pools das réplicas de leitura de um processo, em rodízio com failover."""
+
+    def __init__(self, urls):
+        self.pid = os.getpid()
+        self.urls = urls
+        self.pools = [
+            ConnectionPool(url, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_CHECK_IDLE, DB_POOL_MAX_LIFETIME)
+            for url in urls
+        ]
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        self._down_until = [0.0] * len(urls)
+        self._counters = {'replica_checkouts': 0, 'failovers': 0, 'primary_fallbacks': 0}
+
+    def mark_down(self, index):
+        """Tira a réplica do rodízio por DB_REPLICA_RETRY_AFTER segundos"""
+        with self._lock:
+            self._down_until[index] = time.monotonic() + DB_REPLICA_RETRY_AFTER
+            self._counters['failovers'] += 1
+        print(f"⚠️  Réplica {index} fora do rodízio por {DB_REPLICA_RETRY_AFTER:.0f}s")
+
+    def getconn(self, routing=None):
+        """Retorna (pool, índice da réplica ou None, conexão).
+
+        Começa pela réplica já escolhida na requisição ou pela próxima do rodízio;
+        réplicas fora do ar são puladas e, se nenhuma responder, a conexão vem do
+        primário.
+        """
+        now = time.monotonic()
+        count = len(self.pools)
+        start = routing.replica if routing is not None and routing.replica is not None else next(self._next) % count
+        for offset in range(count):
+            index = (start + offset) % count
+            if self._down_until[index] > now:
+                continue
+            try:
+                conn = self.pools[index].getconn()
+            except PoolTimeout:
+                # Réplica saturada, não fora do ar: tenta a próxima sem tirá-la do rodízio
+                continue
+            except ConnectionError:
+                self.mark_down(index)
+                continue
+            with self._lock:
+                self._counters['replica_checkouts'] += 1
+            if routing is not None:
+                routing.replica = index
+            return self.pools[index], index, conn
+        with self._lock:
+            self._counters['primary_fallbacks'] += 1
+        pool = get_pool()
+        return pool, None, pool.getconn()
+
+    def stats(self):
+        """Estado das réplicas exposto em /health (sem credenciais)"""
+        now = time.monotonic()
+        replicas = []
+        for index, (url, pool) in enumerate(zip(self.urls, self.pools)):
+            params = extensions.parse_dsn(url)
+            replicas.append({
+                'index': index,
+                'host': params.get('host'),
+                'port': params.get('port'),
+                'dbname': params.get('dbname'),
+                'available': self._down_until[index] <= now,
+                'pool': pool.stats(),
+            })
+        with self._lock:
+            return {'replicas': replicas, **self._counters}
+
+
+_router = None
+
+
+def get_replica_router():
+    """Retorna o roteador de réplicas do processo atual (None sem DATABASE_REPLICA_URLS)"""
+    global _router
+    if not DATABASE_REPLICA_URLS:
+        return None
+    router = _router
+    if router is not None and router.pid == os.getpid():
+        return router
+    with _pool_lock:
+        if _router is None or _router.pid != os.getpid():
+            _router = ReplicaRouter(DATABASE_REPLICA_URLS)
+        return _router
+
+
+@contextmanager
+def db_connection(readonly=False):
+    """Empresta uma conexão do pool e a devolve ao final do bloco.
+
+    Com readonly=True a conexão pode vir de uma réplica de leitura (ver
+    ReplicaRouter), exceto quando a requisição atual está presa ao primário.
+    Em caso de erro a transação é desfeita; se a conexão caiu, ela é descartada
+    em vez de voltar ao pool (e a réplica sai do rodízio).
+    """
+    router = get_replica_router() if readonly else None
+    routing = _request_routing.get()
+    if router is not None and not (routing is not None and routing.primary):
+        pool, replica, conn = router.getconn(routing)
+    else:
+        pool, replica = get_pool(), None
+        conn = pool.getconn()
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        if replica is not None:
+            router.mark_down(replica)
+            if routing is not None:
+                routing.replica = None
+        raise
+    except BaseException:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Threads (greenlets, com gevent) das consultas paralelas do processo atual"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=DB_PARALLEL_QUERIES, thread_name_prefix='eduxo-db')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _timed_query(task, readonly):
+    """Executa task(cur) com uma conexão do pool; retorna (resultado, duração em ms)"""
+    started = time.perf_counter()
+    with db_connection(readonly) as conn:
+        cur = conn.cursor()
+        result = task(cur)
+        cur.close()
+        # Encerra a transação aqui, sem esperar o lock do pool na devolução
+        conn.rollback()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def run_parallel(tasks, readonly=False):
+    """Executa consultas independentes ao mesmo tempo, cada uma com sua conexão.
+
+    tasks é um dicionário {nome: função(cur) -> resultado}. As conexões vêm do
+    pool, uma por consulta, e nenhuma tarefa segura duas ao mesmo tempo; o
+    executor limita a DB_PARALLEL_QUERIES as consultas simultâneas do processo.
+    Cada consulta vê seu próprio snapshot. Retorna ({nome: resultado},
+    {nome: duração em ms}); a primeira exceção é propagada. Com readonly=True as
+    consultas vão para a réplica escolhida pela requisição (db_connection).
+    """
+    if DB_PARALLEL_QUERIES <= 1:
+        outcomes = {name: _timed_query(task, readonly) for name, task in tasks.items()}
+    else:
+        executor = _get_executor()
+        # Cada tarefa leva o contexto da requisição (métricas e roteamento das leituras)
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, _timed_query, task, readonly)
+            for name, task in tasks.items()
+        }
+        outcomes = {name: future.result() for name, future in futures.items()}
+    results = {name: result for name, (result, _) in outcomes.items()}
+    timings = {name: round(elapsed, 2) for name, (_, elapsed) in outcomes.items()}
+    return results, timings
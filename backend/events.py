@@ -0,0 +1,156 @@
+"""Eventos de mudança via LISTEN/NOTIFY, repassados aos clientes SSE.
+
+As escritas chamam publish_change(), que incrementa a versão dos dados e faz o
+NOTIFY na mesma transação; o Postgres só entrega a notificação após o commit.
+Cada worker mantém uma única conexão LISTEN (ChangeListener) e distribui os
+eventos para as filas dos clientes conectados em /api/events.
+"""
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+from cache import bump_data_version
+from db import DATABASE_URL, get_db_connection
+
+EVENTS_CHANNEL = 'eduxo_changes'
+# Intervalo (s) dos comentários de keep-alive enviados a clientes ociosos
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))
+# Eventos pendentes por cliente; um cliente lento que estoura a fila recebe 'resync'
+SSE_CLIENT_QUEUE = int(os.environ.get('SSE_CLIENT_QUEUE', 100))
+# Tempo máximo (s) entre tentativas de reconectar o LISTEN
+LISTEN_RECONNECT_MAX = 30
+
+
+def notify_change(cur, event, version, **data):
+    """Publica um evento de mudança, entregue aos ouvintes apenas após o commit"""
+    payload = json.dumps({'event': event, 'version': version, **data}, default=str)
+    cur.execute('SELECT pg_notify(%s, %s)', (EVENTS_CHANNEL, payload))
+
+
+def publish_change(cur, event, **data):
+    """Incrementa a versão dos dados e publica o evento na mesma transação"""
+    version = bump_data_version(cur)
+    notify_change(cur, event, version, **data)
+    return version
+
+
+def sse_frame(event, data, event_id=None):
+    """Formata um evento no protocolo text/event-stream"""
+    frame = f'event: {event}\n'
+    if event_id is not None:
+        frame += f'id: {event_id}\n'
+    return frame + f'data: {json.dumps(data, default=str)}\n\n'
+
+
+class ChangeListener:
+    """Uma conexão LISTEN por processo, compartilhada por todos os clientes SSE."""
+
+    def __init__(self, dsn, channel):
+        self.dsn = dsn
+        self.channel = channel
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._connected = False
+        self._counters = {'notifications': 0, 'reconnects': 0, 'overflows': 0}
+
+    def subscribe(self):
+        """Registra um cliente e retorna a fila de onde ele lê os eventos"""
+        subscription = queue.Queue(maxsize=SSE_CLIENT_QUEUE)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='eduxo-listen', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _broadcast(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(frame)
+            except queue.Full:
+                # Cliente atrasado: descarta o que está pendente e pede recarga completa
+                self._counters['overflows'] += 1
+                while True:
+                    try:
+                        subscription.get_nowait()
+                    except queue.Empty:
+                        break
+                subscription.put_nowait(sse_frame('resync', {'reason': 'overflow'}))
+
+    def _run(self):
+        delay = 1
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = get_db_connection(self.dsn)
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {self.channel}')
+                if not first:
+                    # Eventos podem ter sido perdidos enquanto estávamos desconectados
+                    self._broadcast(sse_frame('resync', {'reason': 'reconnect'}))
+                first = False
+                self._connected = True
+                delay = 1
+                while True:
+                    # select() coopera com o gevent (monkey patch) e com threads comuns
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self._counters['notifications'] += 1
+                        try:
+                            message = json.loads(notification.payload)
+                        except ValueError:
+                            continue
+                        event = message.pop('event', 'change')
+                        self._broadcast(sse_frame(event, message, event_id=message.get('version')))
+            except Exception as e:
+                print(f"⚠️  LISTEN {self.channel} interrompido: {e}")
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+            if not first:
+                self._counters['reconnects'] += 1
+            self._connected = False
+            time.sleep(delay)
+            delay = min(delay * 2, LISTEN_RECONNECT_MAX)
+
+    def stats(self):
+        """Estatísticas expostas em /health (por worker)"""
+        with self._lock:
+            return {
+                'pid': self.pid,
+                'connected': self._connected,
+                'clients': len(self._subscribers),
+                **self._counters,
+            }
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    """Retorna o ouvinte do processo atual, recriando-o após um fork"""
+    global _listener
+    listener = _listener
+    if listener is not None and listener.pid == os.getpid():
+        return listener
+    with _listener_lock:
+        if _listener is None or _listener.pid != os.getpid():
+            _listener = ChangeListener(DATABASE_URL, EVENTS_CHANNEL)
+        return _listener
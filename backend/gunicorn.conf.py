@@ -0,0 +1,79 @@
+"""Configuração do gunicorn (carregada automaticamente por "gunicorn app:app" nesta pasta).
+
+Os workers gevent atendem cada requisição em uma greenlet: milhares de clientes
+ociosos em /api/events não ocupam threads nem conexões do pool.
+"""
+import glob
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+# Conexões simultâneas por worker gevent (inclui os streams SSE abertos)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+
+def post_fork(server, worker):
+    """Torna o psycopg2 cooperativo com o gevent (consultas não bloqueiam o worker)"""
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    """Depois do fork, com o gevent ativo e a app carregada: confere o schema (sem
+    DDL) e inicia o agendador de snapshots deste worker"""
+    from app import start_worker
+    start_worker()
+
+
+def worker_exit(server, worker):
+    """Grava as métricas finais do worker, somadas pelo master em child_exit"""
+    from metrics import flush_metrics
+    try:
+        flush_metrics()
+    except OSError as e:
+        print(f"⚠️  Falha ao gravar as métricas finais do worker: {e}")
+
+
+def child_exit(server, worker):
+    """No master: soma os contadores do worker encerrado em retired.json e apaga o arquivo dele"""
+    # Roda no tratamento de SIGCHLD: outro SIGCHLD no meio da leitura e gravação
+    # de retired.json perderia uma das somas, então fica pendente até o fim
+    blocked = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGCHLD})
+    try:
+        server.metrics.retire_worker(worker.pid)
+    except OSError as e:
+        print(f"⚠️  Falha ao consolidar as métricas do worker {worker.pid}: {e}")
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, blocked)
+
+
+def on_starting(server):
+    """Cria a pasta onde os workers gravam as métricas somadas em /metrics"""
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        # Arquivos de uma execução anterior não entram na soma
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            os.remove(path)
+    else:
+        os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='eduxo-metrics-')
+    # Migrações e dados iniciais uma única vez, antes dos workers, em um processo à
+    # parte: o master não importa a app (nem o banco, nem os locks) antes do fork
+    if os.environ.get('AUTO_INIT_DB', '1') == '1':
+        result = subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if result.returncode != 0:
+            print("⚠️  A inicialização do banco falhou; a API fica indisponível até \"flask --app app init-db\"")
+    # Importado aqui, já com METRICS_DIR definido e antes de existir qualquer
+    # worker: child_exit roda no tratamento de SIGCHLD e não pode importar nada
+    import metrics
+    server.metrics = metrics
@@ -0,0 +1,159 @@
+"""Histórico dos indicadores de cada aluno (student_metric_history, só inserções).
+
+A tabela é particionada por mês em recorded_at (student_metric_history_AAAAMM),
+com índice BRIN no tempo e B-tree (student_id, recorded_at) para o histórico de
+um aluno. As escritas em students registram as mudanças com a CTE de
+history_cte(), na mesma instrução que altera os alunos (um aluno, um lote ou um
+bloco do recálculo), a partir da CTE "changed" de aggregates.py. As partições
+dos próximos meses são criadas com antecedência (ensure_history_partitions);
+linhas fora delas caem na partição padrão e são movidas quando a partição do mês
+é criada. A limpeza é opcional e só roda pelo comando "flask --app app
+maintain-history": com HISTORY_RETENTION_MONTHS (ou --keep-months) definido,
+partições mais antigas são apagadas inteiras (prune_history), sem DELETE linha a
+linha. O agendador de snapshots apenas cria partições, nunca apaga histórico.
+"""
+import os
+from datetime import date
+
+from psycopg2 import sql
+
+HISTORY_TABLE = 'student_metric_history'
+HISTORY_DEFAULT_PARTITION = 'student_metric_history_default'
+# Meses mantidos por "maintain-history" (0 = nunca apaga; a limpeza precisa ser ligada)
+HISTORY_RETENTION_MONTHS = int(os.environ.get('HISTORY_RETENTION_MONTHS', 0))
+# Partições criadas à frente do mês atual
+HISTORY_PARTITIONS_AHEAD = int(os.environ.get('HISTORY_PARTITIONS_AHEAD', 2))
+# Origem de cada registro
+HISTORY_SOURCES = ('baseline', 'update', 'bulk', 'import', 'recompute')
+
+HISTORY_COLUMNS = ('student_id', 'class', 'attendance', 'grades', 'risk_score', 'risk_level', 'source')
+
+
+def history_cte(source):
+    """CTE que grava no histórico as linhas de "changed" cujos indicadores mudaram"""
+    if source not in HISTORY_SOURCES:
+        raise ValueError(f"Origem de histórico inválida: {source}")
+    return f'''
+    history AS (
+        INSERT INTO {HISTORY_TABLE} ({', '.join(HISTORY_COLUMNS)})
+        SELECT id, class, attendance, grades, risk_score, risk_level, '{source}'
+        FROM changed
+        WHERE old_class IS NULL
+           OR (class, attendance, grades, risk_score, risk_level)
+              IS DISTINCT FROM (old_class, old_attendance, old_grades, old_risk_score, old_risk_level)
+    )
+'''
+
+
+def record_history_baseline(cur):
+    """Grava os indicadores atuais dos alunos ainda sem histórico como ponto de partida"""
+    cur.execute(f'''
+        INSERT INTO {HISTORY_TABLE} ({', '.join(HISTORY_COLUMNS)})
+        SELECT id, class, attendance, grades, risk_score, risk_level, 'baseline'
+        FROM students AS s
+        WHERE NOT EXISTS (SELECT 1 FROM {HISTORY_TABLE} AS h WHERE h.student_id = s.id)
+    ''')
+    return cur.rowcount
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{HISTORY_TABLE}_{month:%Y%m}'
+
+
+def history_partitions(cur):
+    """Partições mensais existentes: [(primeiro dia do mês, nome)], em ordem"""
+    cur.execute('''
+        SELECT c.relname AS name
+        FROM pg_inherits AS i
+        JOIN pg_class AS c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    ''', (HISTORY_TABLE,))
+    partitions = []
+    for row in cur.fetchall():
+        suffix = row['name'][len(HISTORY_TABLE) + 1:]
+        if suffix.isdigit() and len(suffix) == 6:
+            partitions.append((date(int(suffix[:4]), int(suffix[4:]), 1), row['name']))
+    return sorted(partitions)
+
+
+def create_history_partition(cur, month):
+    """Cria a partição do mês, movendo para ela as linhas que caíram na partição padrão"""
+    month = month.replace(day=1)
+    name, end = partition_name(month), _add_months(month, 1)
+    cur.execute(
+        sql.SQL('SELECT EXISTS (SELECT 1 FROM {} WHERE recorded_at >= %s AND recorded_at < %s) AS pending')
+        .format(sql.Identifier(HISTORY_DEFAULT_PARTITION)), (month, end)
+    )
+    if not cur.fetchone()['pending']:
+        cur.execute(
+            sql.SQL('CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)')
+            .format(sql.Identifier(name), sql.Identifier(HISTORY_TABLE)), (month, end)
+        )
+        return name
+    # Com linhas do mês na partição padrão, a partição nova não pode ser criada
+    # diretamente: ela é montada à parte, recebe as linhas e só então é anexada
+    cur.execute(
+        sql.SQL('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        .format(sql.Identifier(name), sql.Identifier(HISTORY_TABLE))
+    )
+    cur.execute(
+        sql.SQL('''
+            WITH moved AS (
+                DELETE FROM {default} WHERE recorded_at >= %s AND recorded_at < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        ''').format(default=sql.Identifier(HISTORY_DEFAULT_PARTITION), name=sql.Identifier(name)),
+        (month, end)
+    )
+    moved = cur.rowcount
+    cur.execute(
+        sql.SQL('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)')
+        .format(sql.Identifier(HISTORY_TABLE), sql.Identifier(name)), (month, end)
+    )
+    print(f"✓ {moved} registro(s) de histórico movidos da partição padrão para {name}")
+    return name
+
+
+def ensure_history_partitions(cur, today=None, ahead=HISTORY_PARTITIONS_AHEAD):
+    """Garante as partições do mês atual e dos `ahead` seguintes; retorna as criadas.
+
+    Não faz commit.
+    """
+    current = (today or date.today()).replace(day=1)
+    existing = {month for month, _ in history_partitions(cur)}
+    created = []
+    for offset in range(ahead + 1):
+        month = _add_months(current, offset)
+        if month not in existing:
+            created.append(create_history_partition(cur, month))
+    return created
+
+
+def prune_history(cur, keep_months=HISTORY_RETENTION_MONTHS, today=None):
+    """Apaga as partições inteiramente anteriores aos últimos keep_months meses.
+
+    Cada partição sai com um DROP TABLE, em tempo constante, sem varrer as
+    linhas. Não faz commit; retorna os nomes apagados.
+    """
+    if keep_months <= 0:
+        return []
+    cutoff = _add_months((today or date.today()).replace(day=1), -keep_months + 1)
+    dropped = []
+    for month, name in history_partitions(cur):
+        if month < cutoff:
+            cur.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier(name)))
+            dropped.append(name)
+    return dropped
+
+
+def maintain_history(cur, keep_months=HISTORY_RETENTION_MONTHS, today=None):
+    """Cria as próximas partições e apaga as vencidas; retorna {created, dropped}"""
+    return {
+        'created': ensure_history_partitions(cur, today),
+        'dropped': prune_history(cur, keep_months, today),
+    }
@@ -0,0 +1,275 @@
+"""Importação de alunos a partir de CSV ("flask --app app import-students" ou
+POST /api/admin/import-students).
+
+O arquivo é lido em blocos: cada bloco é validado e tem o risco calculado com
+NumPy, e as linhas válidas vão por COPY para uma tabela temporária. No fim, um
+único INSERT ... ON CONFLICT (id) grava tudo em students (linhas sem id são
+inseridas, com id são atualizadas), aplicando os deltas em class_summary e as
+regras de alerta.
+Nada fica inteiro em memória, qualquer que seja o tamanho do arquivo.
+"""
+import csv
+import io
+import itertools
+
+import numpy as np
+
+from aggregates import SUMMARY_DELTA, SUMMARY_RETURNING
+from alert_rules import ALERTS_CTE
+from events import publish_change
+from history import history_cte
+from risk import METRIC_FIELDS, METRIC_RANGES, METRIC_SCALES, calculate_risk_scores, round_like_python
+
+IMPORT_CHUNK_SIZE = 20000
+# Colunas obrigatórias; "id" é opcional (presente = atualizar aluno existente)
+IMPORT_COLUMNS = ('name', 'class') + METRIC_FIELDS
+IMPORT_STAGING_COLUMNS = ('line', 'id') + IMPORT_COLUMNS + ('risk_score', 'risk_level')
+NAME_MAX_LENGTH = 200
+CLASS_MAX_LENGTH = 10
+MAX_ID = 2**31 - 1
+
+
+def _parse_numbers(values):
+    """Converte um bloco de textos em float64; valores inválidos viram NaN"""
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        pass
+    numbers = np.empty(len(values))
+    for i, value in enumerate(values):
+        try:
+            numbers[i] = float(value)
+        except ValueError:
+            numbers[i] = np.nan
+    return numbers
+
+
+def _copy_text(values):
+    """Escapa textos para o formato text do COPY (barras; tabulações e quebras viram espaço)"""
+    return [
+        value.replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+        for value in values
+    ]
+
+
+def _validate_chunk(columns, has_id):
+    """Valida um bloco (colunas já transpostas).
+
+    Retorna (máscara de linhas válidas, ids (0 = sem id), nomes, turmas, métricas
+    float64 na ordem de METRIC_FIELDS, erros por linha inválida {posição: [mensagens]}).
+    """
+    size = len(columns['name'])
+    errors = {}
+
+    def reject(mask, message):
+        for i in np.flatnonzero(mask).tolist():
+            errors.setdefault(i, []).append(message)
+
+    names = np.array([name.strip() for name in columns['name']], dtype=object)
+    classes = np.array([name.strip() for name in columns['class']], dtype=object)
+    name_lengths = np.fromiter(map(len, names), dtype=int, count=size)
+    class_lengths = np.fromiter(map(len, classes), dtype=int, count=size)
+    reject(name_lengths == 0, 'name é obrigatório')
+    reject(name_lengths > NAME_MAX_LENGTH, f'name deve ter no máximo {NAME_MAX_LENGTH} caracteres')
+    reject(class_lengths == 0, 'class é obrigatório')
+    reject(class_lengths > CLASS_MAX_LENGTH, f'class deve ter no máximo {CLASS_MAX_LENGTH} caracteres')
+
+    ids = np.zeros(size, dtype=np.int64)
+    if has_id:
+        raw_ids = [value.strip() for value in columns['id']]
+        present = np.array([value != '' for value in raw_ids])
+        parsed = _parse_numbers([value if value else '0' for value in raw_ids])
+        invalid = present & (np.isnan(parsed) | (parsed != np.floor(parsed)) | (parsed < 1) | (parsed > MAX_ID))
+        reject(invalid, 'id deve ser um inteiro positivo')
+        ids = np.where(present & ~invalid, parsed, 0).astype(np.int64)
+
+    metrics = []
+    for field in METRIC_FIELDS:
+        low, high = METRIC_RANGES[field]
+        values = _parse_numbers(columns[field])
+        missing = np.array([value.strip() == '' for value in columns[field]])
+        reject(missing, f'{field} é obrigatório')
+        not_numeric = np.isnan(values) & ~missing
+        reject(not_numeric, f'{field} deve ser numérico')
+        out_of_range = ~np.isnan(values) & ((values < low) | (values > high))
+        reject(out_of_range, f'{field} deve estar entre {low} e {high}')
+        if field == 'absences':
+            reject(~np.isnan(values) & ~out_of_range & (values != np.floor(values)), 'absences deve ser inteiro')
+        metrics.append(values)
+
+    valid = np.ones(size, dtype=bool)
+    valid[list(errors)] = False
+    return valid, ids, names, classes, np.array(metrics), errors
+
+
+def import_students_csv(cur, file, on_reject=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Importa alunos de um CSV (texto) para students, em uma transação.
+
+    on_reject(line, errors, row) é chamado para cada linha recusada (row é o
+    dicionário das colunas do arquivo). Ids repetidos no arquivo valem pela
+    última linha; ids que não existem em students são recusados.
+    Não faz commit; retorna o resumo {read, inserted, updated, unchanged, rejected, alerts}.
+    """
+    reader = csv.reader(file)
+    header = [column.strip().lower() for column in next(reader, [])]
+    missing = [column for column in IMPORT_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Colunas ausentes no CSV: {', '.join(missing)}")
+    has_id = 'id' in header
+    positions = {column: header.index(column) for column in ('id',) + IMPORT_COLUMNS if column in header}
+    summary = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0, 'alerts': 0}
+
+    def rejected(line, errors, row):
+        summary['rejected'] += 1
+        if on_reject:
+            on_reject(line, errors, row)
+
+    cur.execute('''
+        CREATE TEMP TABLE student_import (
+            line BIGINT, id INTEGER, name TEXT, class TEXT,
+            attendance NUMERIC, grades NUMERIC, participation NUMERIC, absences INTEGER,
+            socioeconomic NUMERIC, risk_score NUMERIC, risk_level TEXT
+        ) ON COMMIT DROP
+    ''')
+    line = 1
+    while True:
+        rows = list(itertools.islice(reader, chunk_size))
+        if not rows:
+            break
+        first_line = line + 1
+        line += len(rows)
+        summary['read'] += len(rows)
+
+        # Linhas com menos colunas que o cabeçalho são recusadas antes da transposição
+        lines = np.arange(first_line, line + 1)
+        short = [i for i, row in enumerate(rows) if len(row) < len(header)]
+        if short:
+            for i in short:
+                rejected(first_line + i, ['quantidade de colunas menor que a do cabeçalho'], dict(zip(header, rows[i])))
+            keep = np.ones(len(rows), dtype=bool)
+            keep[short] = False
+            rows = [row for row, ok in zip(rows, keep) if ok]
+            lines = lines[keep]
+            if not rows:
+                continue
+
+        transposed = list(zip(*rows))
+        columns = {column: transposed[position] for column, position in positions.items()}
+        valid, ids, names, classes, metrics, errors = _validate_chunk(columns, has_id)
+        for i in sorted(errors):
+            rejected(int(lines[i]), errors[i], dict(zip(header, rows[i])))
+        if not valid.any():
+            continue
+
+        # Arredondados à escala das colunas: o score é o que o recálculo obteria dos valores gravados
+        metrics = np.array([
+            round_like_python(metrics[i, valid], METRIC_SCALES[field]) for i, field in enumerate(METRIC_FIELDS)
+        ])
+        scores, levels = calculate_risk_scores(*metrics)
+        values = [
+            lines[valid].astype(str),
+            np.where(ids[valid] > 0, ids[valid].astype(str), '\\N'),
+            _copy_text(names[valid]),
+            _copy_text(classes[valid]),
+            *(metrics[i].astype(np.int64 if field == 'absences' else float).astype(str) for i, field in enumerate(METRIC_FIELDS)),
+            scores.astype(str),
+            levels,
+        ]
+        buffer = io.StringIO('\n'.join(map('\t'.join, zip(*values))) + '\n')
+        cur.copy_expert(f"COPY student_import ({', '.join(IMPORT_STAGING_COLUMNS)}) FROM STDIN", buffer)
+
+    cur.execute('ANALYZE student_import')
+
+    # Ids repetidos no arquivo: vale a última linha
+    cur.execute('''
+        DELETE FROM student_import AS earlier
+        USING student_import AS later
+        WHERE earlier.id = later.id AND earlier.line < later.line
+        RETURNING earlier.*
+    ''')
+    for row in cur.fetchall():
+        rejected(row['line'], ['id repetido no arquivo (vale a última linha)'], _staged_row(row))
+
+    # Trava os alunos a atualizar (em ordem de id) e recusa ids inexistentes
+    cur.execute('''
+        SELECT COUNT(*) AS locked FROM (
+            SELECT 1 FROM students st JOIN student_import v ON v.id = st.id
+            ORDER BY st.id
+            FOR NO KEY UPDATE OF st
+        ) AS locked
+    ''')
+    cur.execute('''
+        DELETE FROM student_import AS v
+        WHERE v.id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM students WHERE id = v.id)
+        RETURNING v.*
+    ''')
+    for row in cur.fetchall():
+        rejected(row['line'], ['id não encontrado'], _staged_row(row))
+
+    # "old" guarda os valores anteriores (mesmo snapshot, antes do upsert) para os
+    # deltas em class_summary; linhas idênticas ao que já está gravado não mudam
+    cur.execute(f'''
+        WITH old AS (
+            SELECT st.* FROM students st JOIN student_import v ON v.id = st.id
+        ),
+        upserted AS (
+            INSERT INTO students AS s (id, name, class, attendance, grades, participation,
+                                       absences, socioeconomic, risk_score, risk_level)
+            SELECT COALESCE(v.id, nextval(pg_get_serial_sequence('students', 'id'))), v.name, v.class,
+                   v.attendance, v.grades, v.participation, v.absences, v.socioeconomic,
+                   v.risk_score, v.risk_level
+            FROM student_import v
+            ORDER BY v.line
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name, class = EXCLUDED.class,
+                attendance = EXCLUDED.attendance, grades = EXCLUDED.grades,
+                participation = EXCLUDED.participation, absences = EXCLUDED.absences,
+                socioeconomic = EXCLUDED.socioeconomic, risk_score = EXCLUDED.risk_score,
+                risk_level = EXCLUDED.risk_level, updated_at = CURRENT_TIMESTAMP
+            WHERE (s.name, s.class, s.attendance, s.grades, s.participation, s.absences,
+                   s.socioeconomic, s.risk_score, s.risk_level)
+                  IS DISTINCT FROM
+                  (EXCLUDED.name, EXCLUDED.class, EXCLUDED.attendance, EXCLUDED.grades,
+                   EXCLUDED.participation, EXCLUDED.absences, EXCLUDED.socioeconomic,
+                   EXCLUDED.risk_score, EXCLUDED.risk_level)
+            RETURNING s.*
+        ),
+        changed AS (
+            SELECT s.id, s.name, {SUMMARY_RETURNING}
+            FROM upserted AS s
+            LEFT JOIN old ON old.id = s.id
+        ),
+        {SUMMARY_DELTA},
+        {history_cte('import')},
+        {ALERTS_CTE}
+        SELECT COUNT(*) FILTER (WHERE old_class IS NULL) AS inserted,
+               COUNT(*) FILTER (WHERE old_class IS NOT NULL) AS updated,
+               (SELECT COUNT(*) FROM student_import) AS staged,
+               (SELECT COUNT(*) FROM new_alerts) AS alerts
+        FROM changed
+    ''')
+    result = cur.fetchone()
+    summary['inserted'] = result['inserted']
+    summary['updated'] = result['updated']
+    summary['unchanged'] = result['staged'] - result['inserted'] - result['updated']
+    summary['alerts'] = result['alerts']
+    if result['inserted'] or result['updated']:
+        publish_change(cur, 'students_changed', count=result['inserted'] + result['updated'], alerts=result['alerts'])
+    return summary
+
+
+def _staged_row(row):
+    """Linha da tabela temporária no formato das colunas do arquivo (para o relatório)"""
+    return {column: row[column] for column in ('id',) + IMPORT_COLUMNS}
+
+
+class RejectsReport:
+    """Relatório das linhas recusadas em CSV (line, errors e as colunas do arquivo)."""
+
+    def __init__(self, file, columns=('id',) + IMPORT_COLUMNS):
+        self.columns = list(columns)
+        self.writer = csv.DictWriter(file, ['line', 'errors'] + self.columns, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def __call__(self, line, errors, row):
+        self.writer.writerow({**row, 'line': line, 'errors': '; '.join(errors)})
@@ -0,0 +1,467 @@
+"""Métricas da aplicação no formato texto do Prometheus (GET /metrics).
+
+Cada requisição registra latência (histograma por rota), código de status e
+requisições em andamento; o cursor instrumentado (TimedConnection) conta e
+cronometra as instruções SQL de cada requisição. Os valores ficam em memória,
+por worker, e são gravados periodicamente em METRICS_DIR (um arquivo por pid);
+/metrics soma os arquivos de todos os workers do gunicorn. Quando um worker sai,
+o master soma seus contadores em retired.json e apaga o arquivo dele
+(retire_worker), então os totais não diminuem nem com pids reaproveitados. Sem METRICS_DIR
+(flask run, um único processo) apenas as métricas do próprio processo aparecem.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import request
+from psycopg2 import extensions
+
+from slow_queries import SLOW_QUERY_MS, get_slow_log, record_slow_query
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Pasta compartilhada pelos workers (o gunicorn.conf.py cria uma ao iniciar)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+# Intervalo (s) entre gravações das métricas do worker em METRICS_DIR
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# Totais acumulados dos workers encerrados, em METRICS_DIR
+RETIRED_FILE = 'retired.json'
+# Workers encerrados lembrados em retired.json (só importam enquanto o arquivo deles some)
+RETIRED_WORKERS_KEPT = 100
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites superiores (s ou quantidade) dos baldes de cada histograma
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+STATEMENT_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# nome -> (tipo, descrição, baldes)
+METRICS = {
+    'eduxo_http_requests_total': ('counter', 'Requisições HTTP por método, rota e status', None),
+    'eduxo_http_request_duration_seconds': ('histogram', 'Latência das requisições HTTP por rota', LATENCY_BUCKETS),
+    'eduxo_http_requests_in_flight': ('gauge', 'Requisições HTTP em andamento', None),
+    'eduxo_db_statements_total': ('counter', 'Instruções SQL executadas, por rota', None),
+    'eduxo_db_statement_duration_seconds': ('histogram', 'Duração das instruções SQL, por rota', SQL_BUCKETS),
+    'eduxo_http_request_db_statements': ('histogram', 'Instruções SQL por requisição, por rota', STATEMENT_COUNT_BUCKETS),
+}
+# Rota das instruções executadas fora de uma requisição (agendador, ouvinte)
+NO_ROUTE = '(background)'
+UNMATCHED_ROUTE = '(unmatched)'
+
+
+class MetricsRegistry:
+    """Contadores, gauges e histogramas de um processo, protegidos por um lock."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        # Distingue um pid reaproveitado por um worker novo
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._values = {}      # (nome, labels) -> número (counter/gauge)
+        self._histograms = {}  # (nome, labels) -> [contagens por balde..., +Inf], soma
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        """Registra um valor no histograma (chame com o lock adquirido)"""
+        key = (name, labels)
+        entry = self._histograms.get(key)
+        if entry is None:
+            entry = self._histograms[key] = [[0] * (len(METRICS[name][2]) + 1), 0.0]
+        entry[0][bisect_left(METRICS[name][2], value)] += 1
+        entry[1] += value
+
+    def record_request(self, method, route, status, elapsed, statements):
+        """Registra uma requisição concluída com uma única aquisição do lock"""
+        with self._lock:
+            key = ('eduxo_http_requests_total', (('method', method), ('route', route), ('status', str(status))))
+            self._values[key] = self._values.get(key, 0) + 1
+            self._observe('eduxo_http_request_duration_seconds', (('method', method), ('route', route)), elapsed)
+            self._observe('eduxo_http_request_db_statements', (('route', route),), statements)
+
+    def record_statement(self, route, elapsed):
+        with self._lock:
+            key = ('eduxo_db_statements_total', (('route', route),))
+            self._values[key] = self._values.get(key, 0) + 1
+            self._observe('eduxo_db_statement_duration_seconds', (('route', route),), elapsed)
+
+    def snapshot(self):
+        """Estado serializável em JSON (gravado em METRICS_DIR)"""
+        with self._lock:
+            return {
+                'pid': self.pid,
+                'started': self.started,
+                'values': [[name, labels, value] for (name, labels), value in self._values.items()],
+                'histograms': [
+                    [name, labels, list(counts), total] for (name, labels), (counts, total) in self._histograms.items()
+                ],
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+_flusher_started = None
+
+
+def get_registry():
+    """Retorna o registro do processo atual, recriando-o após um fork"""
+    global _registry
+    registry = _registry
+    if registry is not None and registry.pid == os.getpid():
+        return registry
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            _registry = MetricsRegistry()
+        return _registry
+
+
+# ========================================
+# CURSOR INSTRUMENTADO
+# ========================================
+class RequestMetrics:
+    """Instruções SQL da requisição atual (compartilhado com as consultas paralelas)."""
+
+    __slots__ = ('route', 'statements', 'status')
+
+    def __init__(self, route):
+        self.route = route
+        self.statements = 0
+        self.status = 500
+
+
+_current_request = ContextVar('eduxo_request_metrics', default=None)
+
+
+def _record_statement(elapsed):
+    """Conta a instrução na rota atual; retorna a rota"""
+    current = _current_request.get()
+    if current is not None:
+        current.statements += 1
+    route = current.route if current else NO_ROUTE
+    get_registry().record_statement(route, elapsed)
+    return route
+
+
+class TimedCursorMixin:
+    """Cronometra execute/executemany/callproc/copy_expert de qualquer cursor.
+
+    Com SLOW_QUERY_MS, as execuções bem-sucedidas acima do limite vão para o log
+    de consultas lentas (slow_queries.py); o plano só é capturado em execute()
+    de cursores comuns (um cursor nomeado não pode ser executado de novo).
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except BaseException:
+            _record_statement(time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        route = _record_statement(elapsed)
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            record_slow_query(self, query, vars, elapsed, route, explainable=self.name is None)
+        return result
+
+    def _statement_done(self, query, vars, started):
+        """Fechamento comum de executemany/callproc/copy_expert (sem plano)"""
+        elapsed = time.perf_counter() - started
+        route = _record_statement(elapsed)
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            record_slow_query(self, query, vars, elapsed, route, explainable=False)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except BaseException:
+            _record_statement(time.perf_counter() - started)
+            raise
+        self._statement_done(query, vars_list, started)
+        return result
+
+    def callproc(self, procname, parameters=None):
+        started = time.perf_counter()
+        try:
+            result = super().callproc(procname, parameters)
+        except BaseException:
+            _record_statement(time.perf_counter() - started)
+            raise
+        self._statement_done(procname, parameters, started)
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            result = super().copy_expert(sql, file, size)
+        except BaseException:
+            _record_statement(time.perf_counter() - started)
+            raise
+        self._statement_done(sql, None, started)
+        return result
+
+
+_timed_classes = {}
+
+
+def timed_cursor_class(factory):
+    """Subclasse cronometrada de uma classe de cursor (criada uma vez por classe)"""
+    timed = _timed_classes.get(factory)
+    if timed is None:
+        timed = _timed_classes[factory] = type(f'Timed{factory.__name__}', (TimedCursorMixin, factory), {})
+    return timed
+
+
+class TimedConnection(extensions.connection):
+    """Conexão cujos cursores (de qualquer cursor_factory) são cronometrados."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+# ========================================
+# INTEGRAÇÃO COM O FLASK
+# ========================================
+def _before_request():
+    rule = request.url_rule
+    current = RequestMetrics(rule.rule if rule else UNMATCHED_ROUTE)
+    request.environ['eduxo.metrics'] = (current, _current_request.set(current), time.perf_counter())
+    get_registry().inc('eduxo_http_requests_in_flight', ())
+    _start_flusher()
+
+
+def _after_request(response):
+    state = request.environ.get('eduxo.metrics')
+    if state:
+        state[0].status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    state = request.environ.pop('eduxo.metrics', None)
+    if state is None:
+        return
+    current, token, started = state
+    registry = get_registry()
+    registry.inc('eduxo_http_requests_in_flight', (), -1)
+    registry.record_request(request.method, current.route, current.status,
+                            time.perf_counter() - started, current.statements)
+    _current_request.reset(token)
+
+
+def init_metrics(app):
+    """Registra os ganchos que medem cada requisição (se METRICS_ENABLED)"""
+    if METRICS_ENABLED:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+
+
+# ========================================
+# AGREGAÇÃO ENTRE WORKERS E EXPOSIÇÃO
+# ========================================
+def flush_metrics():
+    """Grava as métricas do worker em METRICS_DIR/<pid>.json (troca atômica)"""
+    if not METRICS_DIR:
+        return
+    registry = get_registry()
+    _write_json(os.path.join(METRICS_DIR, f'{registry.pid}.json'), _process_snapshot())
+
+
+def _process_snapshot():
+    """Métricas do processo atual mais as suas consultas lentas"""
+    snapshot = get_registry().snapshot()
+    snapshot['slow_queries'] = get_slow_log().entries()
+    return snapshot
+
+
+def _start_flusher():
+    """Inicia (uma vez por processo) a thread que grava as métricas periodicamente"""
+    global _flusher_started
+    if not METRICS_DIR or _flusher_started == os.getpid():
+        return
+    with _registry_lock:
+        if _flusher_started == os.getpid():
+            return
+        _flusher_started = os.getpid()
+
+    def loop():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                flush_metrics()
+            except OSError as e:
+                print(f"⚠️  Falha ao gravar as métricas: {e}")
+
+    threading.Thread(target=loop, name='eduxo-metrics', daemon=True).start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_json(path, data):
+    """Grava com troca atômica: quem lê nunca vê um arquivo pela metade"""
+    with open(path + '.tmp', 'w') as file:
+        json.dump(data, file)
+    os.replace(path + '.tmp', path)
+
+
+def _load_retired():
+    try:
+        return _read_json(os.path.join(METRICS_DIR, RETIRED_FILE))
+    except (OSError, ValueError):
+        return {'pid': None, 'values': [], 'histograms': [], 'workers': []}
+
+
+def retire_worker(pid):
+    """Soma os contadores e histogramas de um worker encerrado em retired.json e
+    apaga o arquivo dele (chamado pelo master do gunicorn, em child_exit).
+
+    Gauges e consultas lentas do worker são descartados.
+    """
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f'{pid}.json')
+    try:
+        snapshot = _read_json(path)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        os.remove(path)
+        return
+    retired = _load_retired()
+    values = {(name, tuple(map(tuple, labels))): value for name, labels, value in retired['values']}
+    histograms = {
+        (name, tuple(map(tuple, labels))): [counts, total] for name, labels, counts, total in retired['histograms']
+    }
+    for name, labels, value in snapshot['values']:
+        if name in METRICS and METRICS[name][0] == 'counter':
+            key = (name, tuple(map(tuple, labels)))
+            values[key] = values.get(key, 0) + value
+    for name, labels, counts, total in snapshot['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        entry = histograms.setdefault(key, [[0] * len(counts), 0.0])
+        entry[0] = [a + b for a, b in zip(entry[0], counts)]
+        entry[1] += total
+    retired = {
+        'pid': None,
+        'values': [[name, labels, value] for (name, labels), value in values.items()],
+        'histograms': [[name, labels, counts, total] for (name, labels), (counts, total) in histograms.items()],
+        'workers': (retired['workers'] + [[pid, snapshot.get('started')]])[-RETIRED_WORKERS_KEPT:],
+    }
+    # Primeiro o total novo, depois o arquivo do worker: quem lê entre as duas
+    # etapas reconhece o worker em "workers" e não o conta duas vezes
+    _write_json(os.path.join(METRICS_DIR, RETIRED_FILE), retired)
+    os.remove(path)
+
+
+def collect_snapshots():
+    """Snapshots de todos os workers: o atual ao vivo, os demais de METRICS_DIR,
+    mais o total dos workers encerrados"""
+    own = _process_snapshot()
+    snapshots = [own]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        workers = []
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.endswith('.json') or filename in (f"{own['pid']}.json", RETIRED_FILE):
+                continue
+            try:
+                workers.append(_read_json(os.path.join(METRICS_DIR, filename)))
+            except (OSError, ValueError):
+                continue
+        # Lido por último: um worker somado depois da leitura do arquivo dele é ignorado aqui
+        retired = _load_retired()
+        folded = {tuple(worker) for worker in retired['workers']}
+        snapshots.extend(worker for worker in workers if (worker['pid'], worker.get('started')) not in folded)
+        snapshots.append(retired)
+    return snapshots
+
+
+def collect_slow_queries(limit=None):
+    """Consultas lentas de todos os workers, da mais lenta para a mais rápida"""
+    entries = [entry for snapshot in collect_snapshots() for entry in snapshot.get('slow_queries', [])]
+    entries.sort(key=lambda entry: entry['duration_ms'], reverse=True)
+    return entries[:limit] if limit else entries
+
+
+def _escape(value):
+    """Escapa o valor de um label (barra invertida, aspas e quebra de linha)"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """Soma as métricas de todos os workers no formato texto do Prometheus.
+
+    Contadores e histogramas de workers encerrados continuam somando (os totais
+    não diminuem); gauges só contam os workers vivos.
+    """
+    values, histograms = {}, {}
+    for snapshot in collect_snapshots():
+        pid = snapshot['pid']
+        alive = pid is not None and (pid == os.getpid() or _pid_alive(pid))
+        for name, labels, value in snapshot['values']:
+            if name not in METRICS or (METRICS[name][0] == 'gauge' and not alive):
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            values[key] = values.get(key, 0) + value
+        for name, labels, counts, total in snapshot['histograms']:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            entry = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        else:
+            samples = [(labels, value) for (metric, labels), value in sorted(values.items()) if metric == name]
+            if kind == 'gauge' and not samples:
+                samples = [((), 0)]
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,497 @@
+"""Migrações versionadas do schema e verificação dos planos das consultas frequentes."""
+import json
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+# Cada migração roda uma única vez, na ordem, e fica registrada em schema_version.
+# Instruções em 'optional' dependem de recursos que podem não existir no servidor
+# (ex.: extensões); se alguma falhar, o grupo inteiro é ignorado com um aviso.
+MIGRATIONS = [
+    {
+        'version': 1,
+        'description': 'tabelas iniciais',
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS students (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                class VARCHAR(10) NOT NULL,
+                attendance DECIMAL(5,2) DEFAULT 0,
+                grades DECIMAL(5,2) DEFAULT 0,
+                participation DECIMAL(5,2) DEFAULT 0,
+                absences INTEGER DEFAULT 0,
+                socioeconomic DECIMAL(3,1) DEFAULT 3.0,
+                risk_score DECIMAL(5,2) DEFAULT 0,
+                risk_level VARCHAR(20) DEFAULT 'Baixo',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS alerts (
+                id SERIAL PRIMARY KEY,
+                student_id INTEGER REFERENCES students(id),
+                alert_type VARCHAR(50) NOT NULL,
+                message TEXT NOT NULL,
+                severity VARCHAR(20) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                resolved BOOLEAN DEFAULT FALSE
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS interventions (
+                id SERIAL PRIMARY KEY,
+                student_id INTEGER REFERENCES students(id),
+                intervention_type VARCHAR(100) NOT NULL,
+                description TEXT,
+                status VARCHAR(50) DEFAULT 'Pendente',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS monthly_stats (
+                id SERIAL PRIMARY KEY,
+                month DATE NOT NULL,
+                total_students INTEGER,
+                high_risk INTEGER,
+                medium_risk INTEGER,
+                low_risk INTEGER,
+                avg_attendance DECIMAL(5,2),
+                avg_grades DECIMAL(5,2),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ],
+    },
+    {
+        'version': 2,
+        'description': 'índices para as consultas de alunos, alertas e intervenções',
+        'statements': [
+            # /api/students: ordenação padrão e paginação por cursor (risk_score, id)
+            'CREATE INDEX IF NOT EXISTS idx_students_risk_score_id ON students (risk_score DESC, id DESC)',
+            # /api/students?risk_level=... e ?class=... mantendo a mesma ordenação
+            'CREATE INDEX IF NOT EXISTS idx_students_risk_level_score ON students (risk_level, risk_score DESC, id DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_students_class_score ON students (class, risk_score DESC, id DESC)',
+            # /api/students/<id>: alertas e intervenções do aluno, mais recentes primeiro
+            'CREATE INDEX IF NOT EXISTS idx_alerts_student_created ON alerts (student_id, created_at DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_interventions_student_created ON interventions (student_id, created_at DESC)',
+            # /api/alerts e contagem do dashboard: apenas alertas não resolvidos
+            'CREATE INDEX IF NOT EXISTS idx_alerts_unresolved_created ON alerts (created_at DESC) WHERE resolved = FALSE',
+            # Tendências do dashboard ordenadas por mês
+            'CREATE INDEX IF NOT EXISTS idx_monthly_stats_month ON monthly_stats (month)',
+        ],
+        'optional': [
+            # Busca por nome (LOWER(name) LIKE '%termo%') só usa índice com pg_trgm
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX IF NOT EXISTS idx_students_name_trgm ON students USING gin (LOWER(name) gin_trgm_ops)',
+        ],
+    },
+    {
+        'version': 3,
+        'description': 'contador de versão dos dados para invalidar caches',
+        'statements': [
+            # Linha única, incrementada por toda transação que altera dados
+            '''
+            CREATE TABLE IF NOT EXISTS data_version (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                version BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            'INSERT INTO data_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING',
+        ],
+    },
+    {
+        'version': 4,
+        'description': 'agregados de risco por turma mantidos incrementalmente',
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS class_summary (
+                class VARCHAR(10) PRIMARY KEY,
+                students BIGINT NOT NULL DEFAULT 0,
+                high_risk BIGINT NOT NULL DEFAULT 0,
+                medium_risk BIGINT NOT NULL DEFAULT 0,
+                low_risk BIGINT NOT NULL DEFAULT 0,
+                attendance_sum NUMERIC NOT NULL DEFAULT 0,
+                attendance_count BIGINT NOT NULL DEFAULT 0,
+                grades_sum NUMERIC NOT NULL DEFAULT 0,
+                grades_count BIGINT NOT NULL DEFAULT 0,
+                risk_score_sum NUMERIC NOT NULL DEFAULT 0,
+                risk_score_count BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            # Carga inicial a partir dos alunos já existentes
+            '''
+            INSERT INTO class_summary (class, students, high_risk, medium_risk, low_risk,
+                                       attendance_sum, attendance_count, grades_sum, grades_count,
+                                       risk_score_sum, risk_score_count)
+            SELECT class, COUNT(*),
+                   COUNT(*) FILTER (WHERE risk_level = 'Alto'),
+                   COUNT(*) FILTER (WHERE risk_level = 'Médio'),
+                   COUNT(*) FILTER (WHERE risk_level = 'Baixo'),
+                   COALESCE(SUM(attendance), 0), COUNT(attendance),
+                   COALESCE(SUM(grades), 0), COUNT(grades),
+                   COALESCE(SUM(risk_score), 0), COUNT(risk_score)
+            FROM students
+            GROUP BY class
+            ON CONFLICT (class) DO NOTHING
+            ''',
+        ],
+    },
+    {
+        'version': 5,
+        'description': 'monthly_stats com um registro por mês',
+        'statements': [
+            # Meses passam a ser gravados sempre como o primeiro dia; duplicatas mantêm o mais recente
+            "UPDATE monthly_stats SET month = date_trunc('month', month)::date WHERE month <> date_trunc('month', month)::date",
+            'DELETE FROM monthly_stats AS m USING monthly_stats AS newer WHERE newer.month = m.month AND newer.id > m.id',
+            'ALTER TABLE monthly_stats ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
+            'CREATE UNIQUE INDEX IF NOT EXISTS uq_monthly_stats_month ON monthly_stats (month)',
+            'DROP INDEX IF EXISTS idx_monthly_stats_month',
+        ],
+    },
+    {
+        'version': 6,
+        'description': 'regras de alerta, referência por aluno e um alerta aberto por regra',
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS alert_rules (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(50) NOT NULL UNIQUE,
+                kind VARCHAR(30) NOT NULL CHECK (kind IN (
+                    'attendance_below', 'grades_below', 'risk_score_above',
+                    'attendance_drop', 'grades_drop', 'became_high_risk'
+                )),
+                threshold NUMERIC,
+                severity VARCHAR(20) NOT NULL DEFAULT 'Alta',
+                message TEXT NOT NULL,
+                enabled BOOLEAN NOT NULL DEFAULT TRUE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            # Regras padrão; os nomes viram o alert_type (os três primeiros são os do seed)
+            '''
+            INSERT INTO alert_rules (name, kind, threshold, severity, message) VALUES
+                ('Frequência Crítica', 'attendance_below', 60, 'Alta', '{name} tem frequência de apenas {value}%'),
+                ('Notas Baixas', 'grades_below', 4, 'Alta', '{name} está com média {value}'),
+                ('Risco de Evasão', 'became_high_risk', NULL, 'Alta', '{name} passou para risco Alto (score {value})'),
+                ('Queda nas Notas', 'grades_drop', 2, 'Média', '{name} caiu {value} pontos na média desde o último snapshot')
+            ON CONFLICT (name) DO NOTHING
+            ''',
+            # Indicadores de cada aluno no último snapshot (base das regras de queda)
+            '''
+            CREATE TABLE IF NOT EXISTS student_snapshots (
+                student_id INTEGER PRIMARY KEY REFERENCES students(id) ON DELETE CASCADE,
+                attendance DECIMAL(5,2),
+                grades DECIMAL(5,2),
+                risk_score DECIMAL(5,2),
+                risk_level VARCHAR(20),
+                taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            INSERT INTO student_snapshots (student_id, attendance, grades, risk_score, risk_level)
+            SELECT id, attendance, grades, risk_score, risk_level FROM students
+            ON CONFLICT (student_id) DO NOTHING
+            ''',
+            # Alertas abertos repetidos (mesmo aluno e tipo): fica aberto só o mais recente
+            '''
+            UPDATE alerts AS a SET resolved = TRUE
+            FROM alerts AS newer
+            WHERE NOT a.resolved AND NOT newer.resolved
+              AND newer.student_id = a.student_id AND newer.alert_type = a.alert_type AND newer.id > a.id
+            ''',
+            'CREATE UNIQUE INDEX IF NOT EXISTS uq_alerts_open_student_type ON alerts (student_id, alert_type) WHERE resolved = FALSE',
+        ],
+    },
+    {
+        'version': 7,
+        'description': 'índices parciais do feed paginado de alertas não resolvidos',
+        'statements': [
+            # /api/alerts: paginação por cursor (created_at, id), sem filtro ou por classe
+            'CREATE INDEX IF NOT EXISTS idx_alerts_unresolved_feed ON alerts (created_at DESC, id DESC) WHERE resolved = FALSE',
+            # /api/alerts?severity=... e ?type=... mantendo a mesma ordenação
+            'CREATE INDEX IF NOT EXISTS idx_alerts_unresolved_severity ON alerts (severity, created_at DESC, id DESC) WHERE resolved = FALSE',
+            'CREATE INDEX IF NOT EXISTS idx_alerts_unresolved_type ON alerts (alert_type, created_at DESC, id DESC) WHERE resolved = FALSE',
+            # Substituído por idx_alerts_unresolved_feed
+            'DROP INDEX IF EXISTS idx_alerts_unresolved_created',
+        ],
+    },
+    {
+        'version': 8,
+        'description': 'histórico dos indicadores por aluno, particionado por mês',
+        'statements': [
+            # Só inserções; sem FK para students (a carga não paga a checagem por linha)
+            '''
+            CREATE TABLE IF NOT EXISTS student_metric_history (
+                student_id INTEGER NOT NULL,
+                class VARCHAR(10) NOT NULL,
+                recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                attendance DECIMAL(5,2),
+                grades DECIMAL(5,2),
+                risk_score DECIMAL(5,2),
+                risk_level VARCHAR(20),
+                source VARCHAR(20) NOT NULL
+            ) PARTITION BY RANGE (recorded_at)
+            ''',
+            # Recebe as linhas de meses sem partição até history.ensure_history_partitions criá-la
+            'CREATE TABLE IF NOT EXISTS student_metric_history_default PARTITION OF student_metric_history DEFAULT',
+            # Índices no pai valem para todas as partições, inclusive as futuras
+            'CREATE INDEX IF NOT EXISTS idx_history_recorded_brin ON student_metric_history USING brin (recorded_at)',
+            'CREATE INDEX IF NOT EXISTS idx_history_student_recorded ON student_metric_history (student_id, recorded_at)',
+            # Partições do mês atual e dos dois seguintes
+            '''
+            DO $$
+            DECLARE
+                m DATE;
+            BEGIN
+                FOR m IN SELECT generate_series(date_trunc('month', CURRENT_DATE),
+                                                date_trunc('month', CURRENT_DATE) + INTERVAL '2 months',
+                                                INTERVAL '1 month')::date
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF student_metric_history FOR VALUES FROM (%L) TO (%L)',
+                        'student_metric_history_' || to_char(m, 'YYYYMM'), m, (m + INTERVAL '1 month')::date
+                    );
+                END LOOP;
+            END
+            $$
+            ''',
+            # Ponto de partida: os indicadores atuais de cada aluno
+            '''
+            INSERT INTO student_metric_history (student_id, class, attendance, grades, risk_score, risk_level, source)
+            SELECT id, class, attendance, grades, risk_score, risk_level, 'baseline' FROM students
+            ''',
+        ],
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]['version']
+
+
+# Chave do advisory lock que serializa migrações/carga inicial entre processos
+MIGRATION_LOCK_KEY = 720411300
+
+
+@contextmanager
+def migration_lock(conn):
+    """Segura um advisory lock de sessão: um processo migra, os demais esperam.
+
+    O bloco deve fazer seus próprios commits; trabalho pendente em uma
+    transação com erro é desfeito antes de liberar o lock.
+    """
+    cur = conn.cursor()
+    cur.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+    conn.commit()
+    try:
+        yield
+    finally:
+        # Se a conexão caiu, o servidor já liberou o lock junto com a sessão
+        if not conn.closed:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,))
+            conn.commit()
+        cur.close()
+
+
+def schema_status(cur):
+    """Versão aplicada do schema sem executar DDL (0 se nunca migrado)"""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL AS exists")
+    if not cur.fetchone()['exists']:
+        return 0
+    cur.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version')
+    return cur.fetchone()['version']
+
+
+def current_version(cur):
+    """Retorna a versão atual do schema (0 se nenhuma migração foi aplicada)"""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version')
+    return cur.fetchone()['version']
+
+
+def apply_migrations(cur):
+    """Aplica as migrações pendentes no cursor informado, sem fazer commit.
+
+    Retorna a lista de versões aplicadas.
+    """
+    version = current_version(cur)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration['version'] <= version:
+            continue
+        for statement in migration['statements']:
+            cur.execute(statement)
+        if migration.get('optional'):
+            cur.execute('SAVEPOINT optional_statements')
+            try:
+                for statement in migration['optional']:
+                    cur.execute(statement)
+                cur.execute('RELEASE SAVEPOINT optional_statements')
+            except psycopg2.Error as e:
+                cur.execute('ROLLBACK TO SAVEPOINT optional_statements')
+                error = (e.pgerror or str(e)).strip().splitlines()[0]
+                print(f"⚠️  Migração {migration['version']}: instruções opcionais ignoradas ({error})")
+        cur.execute(
+            'INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+            (migration['version'], migration['description'])
+        )
+        applied.append(migration['version'])
+        print(f"✓ Migração {migration['version']} aplicada: {migration['description']}")
+    return applied
+
+
+def run_migrations(conn):
+    """Aplica as migrações pendentes em uma única transação"""
+    cur = conn.cursor()
+    try:
+        applied = apply_migrations(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return applied
+
+
+# ========================================
+# VERIFICAÇÃO DE PLANOS (EXPLAIN)
+# ========================================
+PLAN_CHECK_SCHEMA = 'eduxo_plan_check'
+PLAN_CHECK_TABLES = ('students', 'alerts', 'interventions')
+
+# Consultas quentes de get_students, get_student/get_students_details, get_alerts e
+# get_dashboard, com parâmetros representativos. Agregações sobre a tabela inteira (estatísticas
+# e turmas do dashboard) não entram: para elas o seq scan é o plano correto.
+PLAN_CHECK_QUERIES = [
+    # Como em get_students: colunas convertidas com alias e ORDER BY na coluna original
+    ('get_students (página inicial)',
+     'SELECT id, risk_score::float8 AS risk_score FROM students WHERE 1=1 '
+     'ORDER BY students.risk_score DESC NULLS FIRST, id DESC LIMIT 51', ()),
+    ('get_students (cursor)',
+     'SELECT id, risk_score::float8 AS risk_score FROM students WHERE 1=1 AND (risk_score, id) < (%s, %s) '
+     'ORDER BY students.risk_score DESC NULLS FIRST, id DESC LIMIT 51', (50, 1000)),
+    ('get_students (risk_level)',
+     'SELECT id, risk_score::float8 AS risk_score FROM students WHERE 1=1 AND risk_level = %s '
+     'ORDER BY students.risk_score DESC NULLS FIRST, id DESC LIMIT 51', ('Alto',)),
+    ('get_students (class)',
+     'SELECT id, risk_score::float8 AS risk_score FROM students WHERE 1=1 AND class = %s '
+     'ORDER BY students.risk_score DESC NULLS FIRST, id DESC LIMIT 51', ('2B',)),
+    ('get_student / details (aluno, alertas e intervenções)',
+     'SELECT s.id, '
+     '(SELECT json_agg(a) FROM (SELECT * FROM alerts WHERE student_id = s.id '
+     'ORDER BY created_at DESC LIMIT %s) AS a), '
+     '(SELECT COUNT(*) FROM alerts WHERE student_id = s.id), '
+     '(SELECT json_agg(i) FROM (SELECT * FROM interventions WHERE student_id = s.id '
+     'ORDER BY created_at DESC LIMIT %s) AS i), '
+     '(SELECT COUNT(*) FROM interventions WHERE student_id = s.id) '
+     'FROM unnest(%s::int[]) WITH ORDINALITY AS requested (id, position) '
+     'JOIN students s ON s.id = requested.id ORDER BY requested.position',
+     (10, 10, list(range(4200, 4300)))),
+    # Como em get_alerts: feed de não resolvidos por (created_at, id), com e sem filtros
+    ('get_alerts (página inicial)',
+     'SELECT a.*, s.name as student_name, s.class FROM alerts a JOIN students s ON a.student_id = s.id '
+     'WHERE a.resolved = FALSE ORDER BY a.created_at DESC, a.id DESC LIMIT 51', ()),
+    ('get_alerts (cursor)',
+     'SELECT a.*, s.name as student_name, s.class FROM alerts a JOIN students s ON a.student_id = s.id '
+     'WHERE a.resolved = FALSE AND (a.created_at, a.id) < (%s::timestamp, %s) '
+     'ORDER BY a.created_at DESC, a.id DESC LIMIT 51', ('2020-01-01', 1000)),
+    ('get_alerts (severity)',
+     'SELECT a.*, s.name as student_name, s.class FROM alerts a JOIN students s ON a.student_id = s.id '
+     'WHERE a.resolved = FALSE AND a.severity = %s ORDER BY a.created_at DESC, a.id DESC LIMIT 51', ('Alta',)),
+    ('get_alerts (type)',
+     'SELECT a.*, s.name as student_name, s.class FROM alerts a JOIN students s ON a.student_id = s.id '
+     'WHERE a.resolved = FALSE AND a.alert_type = %s ORDER BY a.created_at DESC, a.id DESC LIMIT 51',
+     ('Risco de Evasão',)),
+    ('get_alerts (class)',
+     'SELECT a.*, s.name as student_name, s.class FROM alerts a JOIN students s ON a.student_id = s.id '
+     'WHERE a.resolved = FALSE AND s.class = %s ORDER BY a.created_at DESC, a.id DESC LIMIT 51', ('2B',)),
+    ('get_dashboard (alertas não resolvidos)',
+     'SELECT COUNT(*) as count FROM alerts WHERE resolved = FALSE', ()),
+]
+
+
+def _populate_plan_check_data(cur, students):
+    """Gera um volume sintético grande direto no servidor (generate_series)"""
+    cur.execute('''
+        INSERT INTO students (name, class, attendance, grades, participation, absences, socioeconomic, risk_score, risk_level)
+        SELECT
+            'Aluno ' || g,
+            (ARRAY['1A','1B','1C','2A','2B','2C','3A','3B','3C'])[1 + g %% 9],
+            round((30 + random() * 68)::numeric, 2),
+            round((2 + random() * 8)::numeric, 2),
+            round((10 + random() * 85)::numeric, 2),
+            (random() * 50)::int,
+            round((1 + random() * 4)::numeric, 1),
+            round((random() * 90)::numeric, 2),
+            CASE WHEN g %% 10 = 0 THEN 'Alto' WHEN g %% 10 < 4 THEN 'Médio' ELSE 'Baixo' END
+        FROM generate_series(1, %s) AS g
+    ''', (students,))
+    cur.execute('''
+        INSERT INTO alerts (student_id, alert_type, message, severity, created_at, resolved)
+        SELECT s.id, 'Risco de Evasão', 'Alerta sintético', 'Alta',
+               CURRENT_TIMESTAMP - (random() * INTERVAL '365 days'),
+               random() > 0.05
+        FROM students s
+    ''')
+    cur.execute('''
+        INSERT INTO interventions (student_id, intervention_type, description, created_at)
+        SELECT s.id, 'Reunião com responsáveis', 'Intervenção sintética',
+               CURRENT_TIMESTAMP - (random() * INTERVAL '365 days')
+        FROM students s
+        WHERE s.id % 2 = 0
+    ''')
+    for table in PLAN_CHECK_TABLES + ('monthly_stats',):
+        cur.execute(f'ANALYZE {table}')
+
+
+def _seq_scans(plan):
+    """Lista as tabelas lidas por Seq Scan em um plano EXPLAIN (FORMAT JSON)"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in PLAN_CHECK_TABLES:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def check_query_plans(conn, students=200000):
+    """Roda EXPLAIN nas consultas quentes sobre um volume sintético grande.
+
+    Tudo acontece em um schema temporário dentro de uma transação que é desfeita
+    ao final, então o banco real não é alterado. Retorna a lista de falhas
+    (consulta, tabelas com seq scan); lista vazia significa sucesso.
+    """
+    cur = conn.cursor()
+    failures = []
+    try:
+        cur.execute(f'CREATE SCHEMA {PLAN_CHECK_SCHEMA}')
+        cur.execute(f'SET LOCAL search_path TO {PLAN_CHECK_SCHEMA}, public')
+        apply_migrations(cur)
+        _populate_plan_check_data(cur, students)
+        for name, query, params in PLAN_CHECK_QUERIES:
+            cur.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+            plan = cur.fetchone()['QUERY PLAN']
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = _seq_scans(plan[0]['Plan'])
+            status = '✓' if not scans else '❌'
+            print(f"{status} {name}" + (f" — seq scan em {', '.join(scans)}" if scans else ''))
+            if scans:
+                failures.append((name, scans))
+    finally:
+        conn.rollback()
+        cur.close()
+    return failures
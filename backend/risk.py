@@ -0,0 +1,213 @@
+"""Cálculo do score de risco de evasão: versão escalar e versão vetorizada (NumPy)."""
+import time
+
+import numpy as np
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+
+from aggregates import SUMMARY_DELTA, SUMMARY_RETURNING
+from alert_rules import ALERTS_CTE
+from events import publish_change
+from history import history_cte
+
+# Limites (exclusivos) dos níveis de risco
+HIGH_RISK_THRESHOLD = 60
+MEDIUM_RISK_THRESHOLD = 35
+
+# Faixas válidas (inclusive) de cada indicador, na ordem dos argumentos de calculate_risk_score
+METRIC_RANGES = {
+    'attendance': (0, 100),
+    'grades': (0, 10),
+    'participation': (0, 100),
+    'absences': (0, 999),
+    'socioeconomic': (1, 5),
+}
+METRIC_FIELDS = tuple(METRIC_RANGES)
+# Casas decimais de cada indicador nas colunas de students; o score é calculado
+# sobre os valores já arredondados, como ficam gravados
+METRIC_SCALES = {
+    'attendance': 2,
+    'grades': 2,
+    'participation': 2,
+    'absences': 0,
+    'socioeconomic': 1,
+}
+
+# Peso de cada indicador no score (sobre os fatores de risk_factors)
+RISK_WEIGHTS = {
+    'attendance': 0.3,
+    'grades': 0.25,
+    'participation': 0.2,
+    'absences': 0.15,
+    'socioeconomic': 0.1,
+}
+
+# Chave do advisory lock que impede dois recálculos em lote simultâneos
+RECOMPUTE_LOCK_KEY = 720411301
+RECOMPUTE_CHUNK_SIZE = 50000
+
+
+def risk_factors(attendance, grades, participation, absences, socioeconomic):
+    """Fatores de risco de cada indicador, antes dos pesos (escalares ou arrays)"""
+    return (
+        100 - attendance,
+        (10 - grades) * 10,
+        100 - participation,
+        absences,
+        (6 - socioeconomic) * 4,
+    )
+
+
+def weighted_risk_score(factors, weights=RISK_WEIGHTS):
+    """Soma ponderada dos fatores, sempre na ordem de METRIC_FIELDS.
+
+    A ordem fixa das operações faz as versões escalar e vetorizada (e a
+    simulação, com os pesos atuais) chegarem ao mesmo valor, bit a bit.
+    """
+    score = factors[0] * weights[METRIC_FIELDS[0]]
+    for factor, field in zip(factors[1:], METRIC_FIELDS[1:]):
+        # Com arrays a soma é feita no lugar, sem um array novo por termo
+        score += factor * weights[field]
+    return score
+
+
+# Função de cálculo de risco
+def calculate_risk_score(attendance, grades, participation, absences, socioeconomic):
+    """Calcula o score de risco de evasão com base nos 5 indicadores."""
+    # A fórmula original é:
+    # (100 - attendance) * 0.3 +
+    # (10 - grades) * 10 * 0.25 +
+    # (100 - participation) * 0.2 +
+    # absences * 0.15 +
+    # (6 - socioeconomic) * 4 * 0.1
+
+    risk_score = weighted_risk_score(risk_factors(attendance, grades, participation, absences, socioeconomic))
+
+    risk_level = 'Alto' if risk_score > HIGH_RISK_THRESHOLD else 'Médio' if risk_score > MEDIUM_RISK_THRESHOLD else 'Baixo'
+
+    return round(risk_score, 2), risk_level
+
+
+def round_like_python(values, ndigits=2):
+    """round(x, ndigits) do Python aplicado a um array, com resultado idêntico.
+
+    np.round multiplica por 10**ndigits antes de arredondar, o que pode divergir
+    do round() do Python (que arredonda o valor binário exato) quando o valor
+    fica a um erro de ponto flutuante de um empate; esses poucos casos são
+    refeitos com round().
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in near_tie:
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+
+def calculate_risk_scores(attendance, grades, participation, absences, socioeconomic):
+    """Versão vetorizada de calculate_risk_score() para arrays float64.
+
+    A ordem das operações é a mesma da versão escalar, então os resultados são
+    bit a bit iguais. Retorna (scores arredondados, array de níveis).
+    """
+    risk_score = weighted_risk_score(risk_factors(attendance, grades, participation, absences, socioeconomic))
+    risk_level = np.where(
+        risk_score > HIGH_RISK_THRESHOLD, 'Alto',
+        np.where(risk_score > MEDIUM_RISK_THRESHOLD, 'Médio', 'Baixo')
+    ).astype(object)
+    return round_like_python(risk_score), risk_level
+
+
+def recompute_risk_scores(conn, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """Recalcula o score e o nível de todos os alunos em lotes, gerando o progresso.
+
+    Lê os alunos em blocos ordenados por id, calcula os scores com NumPy e grava
+    apenas as linhas alteradas com um único UPDATE ... FROM (VALUES ...) por bloco,
+    com commit a cada bloco; as linhas alteradas passam pelas regras de alerta na
+    mesma instrução. Alunos com indicadores nulos são ignorados.
+    Gera um resumo após cada bloco (o último com status 'done'); levanta
+    RuntimeError se outro recálculo estiver em andamento.
+    """
+    cur = conn.cursor(cursor_factory=extensions.cursor)
+    cur.execute('SELECT pg_try_advisory_lock(%s)', (RECOMPUTE_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        cur.close()
+        conn.rollback()
+        raise RuntimeError('Já existe um recálculo de risco em andamento')
+
+    summary = {'status': 'running', 'total': 0, 'processed': 0, 'updated': 0, 'skipped': 0, 'alerts': 0, 'elapsed': 0.0}
+    started = time.perf_counter()
+    try:
+        cur.execute('SELECT COUNT(*) FROM students')
+        summary['total'] = cur.fetchone()[0]
+        conn.commit()
+        yield dict(summary)
+
+        last_id = 0
+        while True:
+            cur.execute('''
+                SELECT id, attendance::float8, grades::float8, participation::float8,
+                       absences::float8, socioeconomic::float8, risk_score::float8, risk_level
+                FROM students
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            ''', (last_id, chunk_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            summary['processed'] += len(rows)
+
+            columns = list(zip(*rows))
+            ids = np.array(columns[0])
+            metrics = np.array(columns[1:6], dtype=float)
+            complete = ~np.isnan(metrics).any(axis=0)
+            summary['skipped'] += int((~complete).sum())
+
+            scores, levels = calculate_risk_scores(*metrics)
+            # Só vão para o banco as linhas cujo score ou nível realmente mudou
+            current_scores = np.array(columns[6], dtype=float)
+            current_levels = np.array(columns[7], dtype=object)
+            changed = complete & ((scores != current_scores) | (levels != current_levels))
+            if changed.any():
+                values = list(zip(ids[changed].tolist(), scores[changed].tolist(), levels[changed]))
+                # Os agregados por turma recebem os deltas na mesma instrução
+                updated, alerts = execute_values(cur, f'''
+                    WITH v (id, risk_score, risk_level) AS (VALUES %s),
+                    old AS (
+                        SELECT st.* FROM students st JOIN v ON v.id = st.id
+                        ORDER BY st.id
+                        FOR NO KEY UPDATE OF st
+                    ),
+                    changed AS (
+                        UPDATE students AS s
+                        SET risk_score = v.risk_score, risk_level = v.risk_level, updated_at = CURRENT_TIMESTAMP
+                        FROM v, old
+                        WHERE s.id = v.id AND old.id = v.id
+                          AND (old.risk_score IS DISTINCT FROM v.risk_score OR old.risk_level IS DISTINCT FROM v.risk_level)
+                        RETURNING s.id, s.name, {SUMMARY_RETURNING}
+                    ),
+                    {SUMMARY_DELTA},
+                    {history_cte('recompute')},
+                    {ALERTS_CTE}
+                    SELECT (SELECT COUNT(*) FROM changed), (SELECT COUNT(*) FROM new_alerts)
+                ''', values, template='(%s, %s::numeric, %s)', page_size=len(values), fetch=True)[0]
+                summary['updated'] += updated
+                summary['alerts'] += alerts
+                if updated:
+                    publish_change(conn.cursor(), 'students_changed', count=updated, alerts=alerts)
+            conn.commit()
+
+            summary['elapsed'] = round(time.perf_counter() - started, 2)
+            yield dict(summary)
+    finally:
+        if not conn.closed:
+            conn.rollback()
+            cur.execute('SELECT pg_advisory_unlock(%s)', (RECOMPUTE_LOCK_KEY,))
+            conn.commit()
+        cur.close()
+
+    summary['status'] = 'done'
+    summary['elapsed'] = round(time.perf_counter() - started, 2)
+    yield summary
@@ -0,0 +1,318 @@
+"""Gerador determinístico de dados sintéticos, carregados em lote com COPY.
+
+Usado tanto na carga inicial (200 alunos) quanto em testes de carga com
+milhões de alunos: "flask --app app seed --students 1000000 --seed 42 --reset".
+"""
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from aggregates import rebuild_class_summary
+from risk import calculate_risk_scores
+
+# Lista expandida de nomes brasileiros
+NOMES_MASCULINOS = [
+    'Miguel Silva', 'Davi Santos', 'Gabriel Oliveira', 'Arthur Costa', 'Lucas Souza',
+    'Matheus Ferreira', 'Pedro Rodrigues', 'Guilherme Almeida', 'Gustavo Lima', 'Rafael Pereira',
+    'Felipe Carvalho', 'Bernardo Ribeiro', 'Enzo Martins', 'Nicolas Araújo', 'João Pedro Dias',
+    'Cauã Fernandes', 'Vitor Gomes', 'Eduardo Cardoso', 'Daniel Rocha', 'Henrique Barbosa',
+    'Murilo Castro', 'Vinicius Nascimento', 'Samuel Moreira', 'Pietro Pinto', 'João Vitor Monteiro',
+    'Leonardo Freitas', 'Caio Duarte', 'Heitor Teixeira', 'Lorenzo Barros', 'Isaac Cavalcanti',
+    'Lucca Azevedo', 'Thiago Mendes', 'João Gabriel Correia', 'João Moraes', 'Alexandre Nunes',
+    'Bruno Rezende', 'Benício Campos', 'Ryan Cardoso', 'Emanuel Farias', 'Fernando Vieira',
+    'Joaquim Ramos', 'André Nogueira', 'Tomás Cunha', 'Francisco Batista', 'Rodrigo Melo',
+    'Igor Peixoto', 'Otávio Lopes', 'Augusto Torres', 'Marcelo Santana', 'Fábio Cruz',
+    'Benjamin Lima', 'Elias Santos', 'Theo Oliveira', 'Gael Costa', 'Noah Souza',
+    'Luan Ferreira', 'Breno Rodrigues', 'Ian Almeida', 'Caleb Lima', 'Levi Pereira',
+    'Raul Carvalho', 'Diego Ribeiro', 'Yuri Martins', 'Renan Araújo', 'Erick Dias',
+    'Victor Fernandes', 'Bryan Gomes', 'Kauã Cardoso', 'Arthur Rocha', 'Luiz Barbosa',
+    'Antônio Castro', 'Benício Nascimento', 'Erick Moreira', 'Felipe Pinto', 'Giovanni Monteiro',
+    'Hugo Freitas', 'Israel Duarte', 'Júlio Teixeira', 'Kevin Barros', 'Léo Cavalcanti',
+    'Marcos Azevedo', 'Nathan Mendes', 'Oliver Correia', 'Paulo Moraes', 'Quentin Nunes',
+    'Rian Rezende', 'Saulo Campos', 'Téo Cardoso', 'Uriel Farias', 'Wallace Vieira',
+    'Xavier Ramos', 'Yago Nogueira', 'Zion Cunha', 'Alan Batista', 'Bento Melo',
+    'César Peixoto', 'Davi Lopes', 'Erick Torres', 'Fábio Santana', 'Gael Cruz'
+]
+
+NOMES_FEMININOS = [
+    'Sophia Oliveira', 'Alice Santos', 'Julia Silva', 'Isabella Costa', 'Manuela Souza',
+    'Laura Ferreira', 'Luiza Rodrigues', 'Valentina Almeida', 'Giovanna Lima', 'Maria Eduarda Pereira',
+    'Helena Carvalho', 'Beatriz Ribeiro', 'Maria Luiza Martins', 'Lara Araújo', 'Mariana Dias',
+    'Nicole Fernandes', 'Rafaela Gomes', 'Heloísa Cardoso', 'Isadora Rocha', 'Lívia Barbosa',
+    'Maria Clara Castro', 'Ana Clara Nascimento', 'Lorena Moreira', 'Gabriela Pinto', 'Yasmin Monteiro',
+    'Isabelly Freitas', 'Sarah Duarte', 'Ana Julia Teixeira', 'Letícia Barros', 'Ana Luiza Cavalcanti',
+    'Melissa Azevedo', 'Marina Mendes', 'Clara Correia', 'Cecília Moraes', 'Esther Nunes',
+    'Emanuelly Rezende', 'Rebeca Campos', 'Ana Beatriz Cardoso', 'Lavínia Farias', 'Vitória Vieira',
+    'Bianca Ramos', 'Catarina Nogueira', 'Larissa Cunha', 'Maria Fernanda Batista', 'Fernanda Melo',
+    'Amanda Peixoto', 'Alícia Lopes', 'Carolina Torres', 'Agatha Santana', 'Gabrielly Cruz',
+    'Elisa Lima', 'Maya Santos', 'Ayla Oliveira', 'Aurora Costa', 'Stella Souza',
+    'Pietra Ferreira', 'Milena Rodrigues', 'Liz Almeida', 'Antonella Lima', 'Maitê Pereira',
+    'Eliza Carvalho', 'Eloá Ribeiro', 'Maria Alice Martins', 'Luna Araújo', 'Duda Dias',
+    'Bella Fernandes', 'Sophie Gomes', 'Aurora Cardoso', 'Maria Vitória Rocha', 'Olívia Barbosa',
+    'Maria Helena Castro', 'Helena Nascimento', 'Laís Moreira', 'Maria Cecília Pinto', 'Brenda Monteiro',
+    'Evelyn Freitas', 'Hadassa Duarte', 'Maria Júlia Teixeira', 'Alana Barros', 'Elisa Cavalcanti',
+    'Jade Azevedo', 'Joana Mendes', 'Lorena Correia', 'Maria Luísa Moraes', 'Nina Nunes',
+    'Pérola Rezende', 'Stella Campos', 'Valentina Cardoso', 'Yasmin Farias', 'Zoe Vieira',
+    'Ana Ramos', 'Bárbara Nogueira', 'Camila Cunha', 'Diana Batista', 'Emilly Melo',
+    'Flávia Peixoto', 'Gisele Lopes', 'Ingrid Torres', 'Jéssica Santana', 'Kelly Cruz'
+]
+
+CLASSES = ['1A', '1B', '1C', '2A', '2B', '2C', '3A', '3B', '3C']
+RISK_LEVELS = ('Alto', 'Médio', 'Baixo')
+# Proporção padrão: 10% Alto, 30% Médio, 60% Baixo (20/60/120 para 200 alunos)
+DEFAULT_RISK_MIX = (0.1, 0.3, 0.6)
+
+# Faixas (mín, máx) de cada indicador por perfil de risco, na ordem de RISK_LEVELS.
+# O perfil só orienta o sorteio: score e nível gravados vêm de calculate_risk_scores
+# (as faixas foram escolhidas para que quase todo aluno caia no nível do seu perfil)
+PROFILE_RANGES = {
+    'attendance':    ((20, 45), (50, 68), (75, 98)),
+    'grades':        ((1.0, 3.5), (3.8, 5.8), (6.5, 10)),
+    'participation': ((5, 25), (30, 55), (65, 95)),
+    'absences':      ((30, 55), (12, 25), (0, 10)),
+    'socioeconomic': ((1.0, 1.8), (2.0, 3.0), (3.5, 5.0)),
+}
+
+# Alertas criados para alunos de alto risco (os primeiros N modelos, como na carga original)
+ALERT_TEMPLATES = [
+    ('Frequência Crítica', '{name} tem frequência de apenas {attendance:.1f}%', 'Alta'),
+    ('Notas Baixas', '{name} está com média {grades:.1f}', 'Alta'),
+    ('Risco de Evasão', '{name} apresenta múltiplos indicadores de risco', 'Alta'),
+]
+
+INTERVENTION_TYPES = ['Aconselhamento', 'Reunião Familiar', 'Encaminhamento Psicológico', 'Plano de Estudos', 'Outro']
+
+STUDENT_COPY_COLUMNS = (
+    'students (id, name, class, attendance, grades, participation, absences, socioeconomic, risk_score, risk_level)'
+)
+
+
+def _level_counts(students, risk_mix):
+    """Divide o total de alunos entre os níveis de risco (maiores restos)"""
+    mix = np.asarray(risk_mix, dtype=float)
+    if mix.shape != (3,) or (mix < 0).any() or mix.sum() <= 0:
+        raise ValueError('risk_mix deve ter 3 proporções não negativas (Alto, Médio, Baixo)')
+    exact = mix / mix.sum() * students
+    counts = np.floor(exact).astype(int)
+    remainder = students - counts.sum()
+    counts[np.argsort(-(exact - counts), kind='stable')[:remainder]] += 1
+    return counts
+
+
+def _uniform_by_level(rng, field, levels):
+    ranges = np.asarray(PROFILE_RANGES[field], dtype=float)
+    low, high = ranges[levels, 0], ranges[levels, 1]
+    return low + rng.random(len(levels)) * (high - low)
+
+
+def _reserve_student_ids(cur, students):
+    """Reserva um bloco contínuo de ids na sequência de students"""
+    cur.execute('LOCK TABLE students IN SHARE ROW EXCLUSIVE MODE')
+    cur.execute('''
+        SELECT setval(pg_get_serial_sequence('students', 'id'),
+                      nextval(pg_get_serial_sequence('students', 'id')) + %s - 1) AS last_id
+    ''', (students,))
+    return cur.fetchone()['last_id'] - students + 1
+
+
+# Tabelas carregadas pelo gerador; em cargas grandes sobre tabelas vazias seus índices
+# secundários e chaves estrangeiras são recriados de uma vez ao final
+BULK_TABLES = ['students', 'alerts', 'interventions']
+BULK_REBUILD_THRESHOLD = 10000
+
+
+def _drop_secondary_indexes(cur, tables):
+    """Remove índices secundários e FKs das tabelas, devolvendo o DDL para recriá-los"""
+    cur.execute('''
+        SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname) AS name,
+               pg_get_indexdef(i.indexrelid) AS ddl
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.indrelid = ANY(%s::regclass[])
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+    ''', (tables,))
+    indexes = cur.fetchall()
+    cur.execute('''
+        SELECT conrelid::regclass::text AS table_name, quote_ident(conname) AS name,
+               pg_get_constraintdef(oid) AS ddl
+        FROM pg_constraint
+        WHERE contype = 'f' AND (conrelid = ANY(%s::regclass[]) OR confrelid = ANY(%s::regclass[]))
+    ''', (tables, tables))
+    foreign_keys = cur.fetchall()
+    for fk in foreign_keys:
+        cur.execute(f"ALTER TABLE {fk['table_name']} DROP CONSTRAINT {fk['name']}")
+    for index in indexes:
+        cur.execute(f"DROP INDEX {index['name']}")
+    return [index['ddl'] for index in indexes] + [
+        f"ALTER TABLE {fk['table_name']} ADD CONSTRAINT {fk['name']} {fk['ddl']}" for fk in foreign_keys
+    ]
+
+
+def _copy(cur, table_columns, buffer):
+    buffer.seek(0)
+    cur.copy_expert(f'COPY {table_columns} FROM STDIN', buffer)
+
+
+def _months_before(day, months):
+    """Primeiro dia do mês que fica `months` meses antes de `day`"""
+    index = day.year * 12 + day.month - 1 - months
+    return day.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def reset_tables(cur):
+    """Apaga todos os dados e reinicia as sequências de ids"""
+    cur.execute('TRUNCATE alerts, interventions, monthly_stats, class_summary, student_snapshots, student_metric_history, students RESTART IDENTITY CASCADE')
+
+
+def generate_dataset(conn, students=200, classes=None, risk_mix=DEFAULT_RISK_MIX,
+                     alerts_per_student=2, interventions_per_student=0.0, months=6,
+                     seed=None, chunk_size=50000, now=None, progress=None):
+    """Gera e carrega alunos, alertas, intervenções e histórico mensal.
+
+    - risk_mix: proporção dos perfis (Alto, Médio, Baixo) usados no sorteio dos indicadores;
+      o nível gravado é o da fórmula, então a distribuição final fica próxima, não exata
+    - alerts_per_student: máximo de alertas por aluno de Alto risco (sorteado entre 1 e o máximo,
+      limitado a um de cada tipo de ALERT_TEMPLATES)
+    - interventions_per_student: média (Poisson) de intervenções por aluno, espalhadas em `months`
+    - months: meses de histórico nas datas das intervenções; os N-1 meses anteriores ao
+      atual recebem registros sintéticos em monthly_stats (meses já gravados são mantidos)
+
+    Com a mesma semente (e o mesmo chunk_size) os dados gerados são idênticos.
+    Não faz commit; retorna as quantidades inseridas por tabela.
+    """
+    classes = np.asarray(classes or CLASSES, dtype=object)
+    now = (now or datetime.now()).replace(microsecond=0)
+    rng = np.random.default_rng(seed)
+    names = np.asarray(NOMES_MASCULINOS + NOMES_FEMININOS, dtype=object)
+    cur = conn.cursor()
+    inserted = {'students': 0, 'alerts': 0, 'interventions': 0, 'monthly_stats': 0}
+
+    counts = _level_counts(students, risk_mix)
+    # Perfis na proporção pedida, em ordem aleatória
+    all_levels = rng.permutation(np.repeat(np.arange(3), counts))
+    # Nomes únicos enquanto houver nomes suficientes; depois, repetidos
+    if students <= len(names):
+        all_names = names[rng.permutation(len(names))[:students]]
+    else:
+        all_names = names[rng.integers(0, len(names), students)]
+
+    first_id = _reserve_student_ids(cur, students) if students else 0
+
+    # Manter índices e checar FKs linha a linha custa mais que a própria carga;
+    # em tabelas vazias é bem mais rápido reconstruí-los uma vez no final
+    rebuild = []
+    if students >= BULK_REBUILD_THRESHOLD:
+        cur.execute('SELECT NOT EXISTS (SELECT 1 FROM students) AS empty')
+        if cur.fetchone()['empty']:
+            rebuild = _drop_secondary_indexes(cur, BULK_TABLES)
+    history_days = max(months, 1) * 30
+    # Alunos por nível calculado (Alto, Médio, Baixo), base do histórico sintético
+    level_totals = np.zeros(3, dtype=int)
+
+    for start in range(0, students, chunk_size):
+        levels = all_levels[start:start + chunk_size]
+        size = len(levels)
+        ids = np.arange(first_id + start, first_id + start + size)
+        chunk_names = all_names[start:start + size]
+        chunk_classes = classes[rng.integers(0, len(classes), size)]
+        attendance = np.round(_uniform_by_level(rng, 'attendance', levels), 2)
+        grades = np.round(_uniform_by_level(rng, 'grades', levels), 2)
+        participation = np.round(_uniform_by_level(rng, 'participation', levels), 2)
+        absences_range = np.asarray(PROFILE_RANGES['absences'])[levels]
+        absences = rng.integers(absences_range[:, 0], absences_range[:, 1] + 1)
+        socioeconomic = np.round(_uniform_by_level(rng, 'socioeconomic', levels), 1)
+        # Score pela fórmula sobre os valores já arredondados como ficam gravados:
+        # o recálculo de risco não altera os dados gerados
+        risk_score, level_names = calculate_risk_scores(
+            attendance, grades, participation, absences.astype(float), socioeconomic
+        )
+        for position, name in enumerate(RISK_LEVELS):
+            level_totals[position] += int((level_names == name).sum())
+
+        buffer = io.StringIO()
+        buffer.writelines(
+            '%d\t%s\t%s\t%.2f\t%.2f\t%.2f\t%d\t%.1f\t%.2f\t%s\n' % row
+            for row in zip(ids.tolist(), chunk_names, chunk_classes, attendance.tolist(), grades.tolist(),
+                           participation.tolist(), absences.tolist(), socioeconomic.tolist(),
+                           risk_score.tolist(), level_names)
+        )
+        _copy(cur, STUDENT_COPY_COLUMNS, buffer)
+        inserted['students'] += size
+
+        # Alertas para alunos de alto risco
+        high = np.flatnonzero(level_names == 'Alto')
+        if alerts_per_student > 0 and len(high):
+            # No máximo um alerta aberto de cada tipo por aluno (índice único em alerts)
+            alert_counts = rng.integers(1, min(alerts_per_student, len(ALERT_TEMPLATES)) + 1, len(high))
+            ages = rng.random(int(alert_counts.sum())) * 30
+            buffer = io.StringIO()
+            position = 0
+            for index, count in zip(high.tolist(), alert_counts.tolist()):
+                for j in range(count):
+                    alert_type, message, severity = ALERT_TEMPLATES[j % len(ALERT_TEMPLATES)]
+                    message = message.format(name=chunk_names[index], attendance=attendance[index], grades=grades[index])
+                    created_at = _timestamp(now - timedelta(days=float(ages[position])))
+                    buffer.write(f'{ids[index]}\t{alert_type}\t{message}\t{severity}\t{created_at}\n')
+                    position += 1
+            _copy(cur, 'alerts (student_id, alert_type, message, severity, created_at)', buffer)
+            inserted['alerts'] += position
+
+        # Histórico de intervenções: concluídas se abertas há mais de 30 dias
+        if interventions_per_student > 0:
+            intervention_counts = rng.poisson(interventions_per_student, size)
+            total = int(intervention_counts.sum())
+            owners = np.repeat(ids, intervention_counts)
+            types = np.asarray(INTERVENTION_TYPES, dtype=object)[rng.integers(0, len(INTERVENTION_TYPES), total)]
+            ages = rng.random(total) * history_days
+            durations = 1 + rng.random(total) * 29
+            buffer = io.StringIO()
+            for student_id, intervention_type, age, duration in zip(owners.tolist(), types, ages.tolist(), durations.tolist()):
+                created_at = now - timedelta(days=age)
+                if age > 30:
+                    status, completed_at = 'Concluída', _timestamp(created_at + timedelta(days=duration))
+                else:
+                    status, completed_at = 'Pendente', '\\N'
+                buffer.write(
+                    f'{student_id}\t{intervention_type}\tIntervenção sintética\t{status}\t{_timestamp(created_at)}\t{completed_at}\n'
+                )
+            _copy(cur, 'interventions (student_id, intervention_type, description, status, created_at, completed_at)', buffer)
+            inserted['interventions'] += total
+
+        if progress:
+            progress(inserted['students'], students)
+
+    for ddl in rebuild:
+        cur.execute(ddl)
+
+    # Evolução sintética dos meses anteriores em torno da distribuição gerada;
+    # o mês atual é gravado a partir dos dados reais (snapshots.snapshot_month)
+    rows = []
+    for i in range(1, months):
+        month = _months_before(now.date(), i)
+        high_risk = min(int(round(level_totals[0] * rng.uniform(0.9, 1.1))), students)
+        medium_risk = min(int(round(level_totals[1] * rng.uniform(0.9, 1.1))), students - high_risk)
+        rows.append((
+            month, students, high_risk, medium_risk, students - high_risk - medium_risk,
+            round(float(rng.uniform(70, 80)), 2), round(float(rng.uniform(6, 7.5)), 2)
+        ))
+    if rows:
+        # Sem --reset, meses já gravados (reais ou de uma carga anterior) não são sobrescritos
+        inserted['monthly_stats'] = len(execute_values(cur, '''
+            INSERT INTO monthly_stats
+            (month, total_students, high_risk, medium_risk, low_risk, avg_attendance, avg_grades)
+            VALUES %s
+            ON CONFLICT (month) DO NOTHING
+            RETURNING month
+        ''', rows, fetch=True))
+
+    # Agregados por turma recalculados uma vez, em vez de linha a linha
+    rebuild_class_summary(cur)
+    cur.close()
+    return inserted
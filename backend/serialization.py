@@ -0,0 +1,61 @@
+"""Serialização JSON das respostas.
+
+O codificador é plugável: com JSON_ENCODER=orjson (padrão, se o pacote estiver
+instalado) o jsonify usa o orjson, com a mesma saída do provedor padrão do Flask
+(chaves ordenadas, datas no formato HTTP, Decimal como texto); JSON_ENCODER=json
+volta ao módulo json da biblioteca padrão.
+"""
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson' if orjson else 'json')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Provedor JSON do Flask baseado no orjson."""
+
+    def _options(self, indent=None):
+        # Datas passam pelo default() do Flask para manter o formato HTTP
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def init_json(app, encoder=JSON_ENCODER):
+    """Instala no app o codificador escolhido (orjson ou json)"""
+    if encoder == 'orjson':
+        if orjson is None:
+            raise RuntimeError('JSON_ENCODER=orjson, mas o pacote orjson não está instalado')
+        app.json = OrjsonProvider(app)
+    elif encoder != 'json':
+        raise RuntimeError(f'JSON_ENCODER inválido: {encoder} (use orjson ou json)')
+    return app.json
+
+
+def rows_payload(fields, rows, columnar=False):
+    """Linhas de um cursor de tuplas como lista de objetos ou, no formato colunar,
+    como {columns, rows} (os nomes dos campos não se repetem a cada linha)."""
+    if columnar:
+        return {'columns': list(fields), 'rows': rows}
+    return [dict(zip(fields, row)) for row in rows]
@@ -0,0 +1,270 @@
+"""Simulação de pesos e limites de risco ("e se?"), sem alterar os scores gravados.
+
+Os indicadores de todos os alunos são lidos uma vez por worker, com um COPY
+binário decodificado direto em arrays NumPy, no mesmo snapshot (REPEATABLE
+READ) da versão dos dados, e ficam em cache até a próxima escrita. Cada
+candidato (pesos + limites) é avaliado sobre os arrays inteiros: o score com
+weighted_risk_score(), na mesma ordem de operações do cálculo real (com os
+pesos atuais o resultado é o gravado), e as distribuições por turma e as
+transições de nível com np.bincount, sem laço por aluno.
+"""
+import io
+import math
+import os
+import threading
+
+import numpy as np
+
+from cache import VersionedCache, get_data_version
+from risk import (
+    HIGH_RISK_THRESHOLD, MEDIUM_RISK_THRESHOLD, METRIC_FIELDS, RISK_WEIGHTS, risk_factors, weighted_risk_score,
+)
+
+# Tempo máximo (s) que os arrays ficam em cache mesmo sem mudança de versão
+SIMULATION_CACHE_TTL = float(os.environ.get('SIMULATION_CACHE_TTL', 600))
+SIMULATION_MAX_CANDIDATES = int(os.environ.get('SIMULATION_MAX_CANDIDATES', 20))
+# Alunos que mudariam de nível listados por candidato (os de maior variação de score)
+SIMULATION_CHANGES_DEFAULT = 50
+SIMULATION_CHANGES_MAX = 1000
+
+# Níveis na ordem dos códigos usados nos arrays (0, 1, 2)
+RISK_LEVELS = ('Baixo', 'Médio', 'Alto')
+LEVEL_KEYS = ('low_risk', 'medium_risk', 'high_risk')
+
+_COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+_COPY_COLUMNS = (('id', '>i4'), ('class', '>i2'), ('level', '>i2'), ('score', '>f8')) + tuple(
+    (field, '>f8') for field in METRIC_FIELDS
+)
+# Cada linha do COPY binário: número de campos e, por campo, tamanho + valor
+# (sem nulos, então todas as linhas têm o mesmo tamanho)
+_COPY_ROW = np.dtype([('fields', '>i2')] + [
+    item for name, kind in _COPY_COLUMNS for item in ((f'{name}_size', '>i4'), (name, kind))
+])
+
+_population_cache = VersionedCache(SIMULATION_CACHE_TTL)
+# Uma carga por vez no worker: requisições simultâneas esperam e usam o cache
+_load_lock = threading.Lock()
+
+
+class RiskPopulation:
+    """Indicadores de todos os alunos em arrays, prontos para avaliar candidatos."""
+
+    def __init__(self, version, classes, rows):
+        self.version = version
+        self.classes = classes
+        self.ids = rows['id'].astype(np.int64)
+        self.class_codes = rows['class'].astype(np.intp)
+        self.levels = rows['level'].astype(np.int8)
+        self.scores = rows['score'].astype(np.float64)
+        self.factors = np.array(risk_factors(*(rows[field].astype(np.float64) for field in METRIC_FIELDS)))
+        # (turma, nível atual) já multiplicado por 3: somado ao nível simulado, um
+        # único np.bincount conta turma x nível atual x nível simulado
+        self.group_codes = (self.class_codes * 3 + self.levels) * 3
+
+    def __len__(self):
+        return len(self.ids)
+
+    def counts(self, levels):
+        """Contagens [turma, nível atual, nível simulado]"""
+        return np.bincount(self.group_codes + levels, minlength=9 * len(self.classes)).reshape(-1, 3, 3)
+
+    def distribution(self, counts):
+        """Distribuição dos níveis simulados no total e por turma"""
+        by_class = counts.sum(axis=1)
+        return {
+            **level_counts(by_class.sum(axis=0)),
+            'classes': [
+                {'class': name, **level_counts(class_counts)}
+                for name, class_counts in zip(self.classes, by_class) if class_counts.any()
+            ],
+        }
+
+    def current(self):
+        """Distribuição atual, a partir dos níveis gravados"""
+        return {
+            **self.distribution(self.counts(self.levels)),
+            'avg_risk_score': round(float(self.scores.mean()), 2) if len(self) else 0.0,
+        }
+
+    def evaluate(self, candidate, changes_limit=SIMULATION_CHANGES_DEFAULT):
+        """Avalia um candidato; os alunos listados vêm sem nome (ver attach_names)"""
+        scores = weighted_risk_score(self.factors, candidate['weights'])
+        levels = (scores > candidate['medium']).view(np.int8) + (scores > candidate['high']).view(np.int8)
+        counts = self.counts(levels)
+        transitions = counts.sum(axis=0)
+
+        changed = np.flatnonzero(levels != self.levels)
+        delta = np.abs(scores[changed] - self.scores[changed])
+        if changes_limit < len(changed):
+            # Só os de maior variação de score, sem ordenar todos os que mudaram
+            listed = np.argpartition(-delta, changes_limit)[:changes_limit]
+        else:
+            listed = np.arange(len(changed))
+        # Maior variação primeiro; empates (só os limites mudaram) pelo maior score
+        listed = listed[np.lexsort((-scores[changed[listed]], -delta[listed]))]
+        listed = changed[listed]
+
+        return {
+            'name': candidate['name'],
+            'weights': candidate['weights'],
+            'thresholds': {'high': candidate['high'], 'medium': candidate['medium']},
+            **self.distribution(counts),
+            'avg_risk_score': round(float(scores.mean()), 2) if len(self) else 0.0,
+            'changed': int(len(self) - np.trace(transitions)),
+            'transitions': [
+                {'from': RISK_LEVELS[old], 'to': RISK_LEVELS[new], 'count': int(transitions[old, new])}
+                for old in range(3) for new in range(3) if old != new and transitions[old, new]
+            ],
+            'changed_students': [
+                {
+                    'id': int(self.ids[i]),
+                    'class': self.classes[self.class_codes[i]],
+                    'current_level': RISK_LEVELS[self.levels[i]],
+                    'simulated_level': RISK_LEVELS[levels[i]],
+                    'current_score': float(self.scores[i]),
+                    'simulated_score': round(float(scores[i]), 2),
+                }
+                for i in listed
+            ],
+        }
+
+
+def level_counts(counts):
+    return {key: int(count) for key, count in zip(LEVEL_KEYS, counts)}
+
+
+def parse_candidate(item, index):
+    """Valida um candidato {name?, weights?, thresholds?}; retorna (candidato, lista de erros).
+
+    Pesos e limites omitidos ficam com os valores atuais.
+    """
+    if not isinstance(item, dict):
+        return None, ['Cada candidato deve ser um objeto JSON']
+    errors = []
+    name = item.get('name', f'candidato {index + 1}')
+    if not isinstance(name, str):
+        errors.append('name deve ser texto')
+
+    weights = dict(RISK_WEIGHTS)
+    given = item.get('weights') or {}
+    if not isinstance(given, dict):
+        errors.append('weights deve ser um objeto')
+        given = {}
+    for field, value in given.items():
+        if field not in RISK_WEIGHTS:
+            errors.append(f'Peso desconhecido: {field}')
+        elif not is_number(value) or value < 0:
+            errors.append(f'weights.{field} deve ser um número não negativo')
+        else:
+            weights[field] = float(value)
+
+    thresholds = item.get('thresholds') or {}
+    if not isinstance(thresholds, dict):
+        errors.append('thresholds deve ser um objeto')
+        thresholds = {}
+    high = thresholds.get('high', HIGH_RISK_THRESHOLD)
+    medium = thresholds.get('medium', MEDIUM_RISK_THRESHOLD)
+    for key, value in (('high', high), ('medium', medium)):
+        if not is_number(value):
+            errors.append(f'thresholds.{key} deve ser numérico')
+    if not errors and medium >= high:
+        errors.append('thresholds.medium deve ser menor que thresholds.high')
+
+    if errors:
+        return None, errors
+    return {'name': name, 'weights': weights, 'high': float(high), 'medium': float(medium)}, []
+
+
+def is_number(value):
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
+
+
+def load_population(conn):
+    """Retorna os arrays dos alunos para a versão atual dos dados (do cache, se possível).
+
+    Alunos com indicadores nulos ficam de fora, como no recálculo. Termina a
+    transação com rollback.
+    """
+    conn.rollback()
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cur = conn.cursor()
+    try:
+        version, _ = get_data_version(cur)
+        population = _population_cache.get('population', version)
+        if population is not None:
+            return population, True
+        with _load_lock:
+            population = _population_cache.get('population', version)
+            if population is not None:
+                return population, True
+            population = read_population(cur, version)
+            _population_cache.set('population', version, population)
+            return population, False
+    finally:
+        cur.close()
+        conn.rollback()
+        conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+
+
+def read_population(cur, version):
+    """Lê os indicadores de todos os alunos com um COPY binário"""
+    cur.execute('SELECT DISTINCT class FROM students ORDER BY class')
+    classes = [row['class'] for row in cur.fetchall()]
+    metrics = ', '.join(f'{field}::float8' for field in METRIC_FIELDS)
+    complete = ' AND '.join(f'{field} IS NOT NULL' for field in METRIC_FIELDS + ('risk_score',))
+    query = cur.mogrify(f'''
+        COPY (
+            SELECT id, (array_position(%s::text[], class::text) - 1)::int2,
+                   (CASE risk_level WHEN 'Alto' THEN 2 WHEN 'Médio' THEN 1 ELSE 0 END)::int2,
+                   risk_score::float8, {metrics}
+            FROM students
+            WHERE {complete}
+        ) TO STDOUT (FORMAT binary)
+    ''', (classes,)).decode()
+    buffer = io.BytesIO()
+    cur.copy_expert(query, buffer)
+    return RiskPopulation(version, classes, parse_copy_rows(buffer.getvalue()))
+
+
+def parse_copy_rows(data):
+    """Decodifica a saída do COPY binário (linhas de tamanho fixo) em um array estruturado"""
+    if data[:len(_COPY_SIGNATURE)] != _COPY_SIGNATURE:
+        raise ValueError('Saída do COPY binário inválida')
+    extension = int.from_bytes(data[15:19], 'big')
+    offset = 19 + extension
+    count, remainder = divmod(len(data) - offset - 2, _COPY_ROW.itemsize)
+    if remainder:
+        raise ValueError('Saída do COPY binário com linhas de tamanho inesperado')
+    rows = np.frombuffer(data, dtype=_COPY_ROW, count=count, offset=offset)
+    if count and (rows['fields'] != len(_COPY_COLUMNS)).any():
+        raise ValueError('Saída do COPY binário com número de campos inesperado')
+    return rows
+
+
+def attach_names(cur, results):
+    """Completa os alunos listados nos resultados com o nome (uma consulta para todos)"""
+    ids = sorted({student['id'] for result in results for student in result['changed_students']})
+    if not ids:
+        return
+    cur.execute('SELECT id, name FROM students WHERE id = ANY(%s)', (ids,))
+    names = {row['id']: row['name'] for row in cur.fetchall()}
+    for result in results:
+        for student in result['changed_students']:
+            student['name'] = names.get(student['id'])
+
+
+def simulate_risk(conn, candidates, changes_limit=SIMULATION_CHANGES_DEFAULT):
+    """Avalia os candidatos já validados sobre todos os alunos; não grava nada"""
+    population, cached = load_population(conn)
+    results = [population.evaluate(candidate, changes_limit) for candidate in candidates]
+    cur = conn.cursor()
+    attach_names(cur, results)
+    cur.close()
+    conn.rollback()
+    return {
+        'data_version': population.version,
+        'students': len(population),
+        'cached': cached,
+        'current': population.current(),
+        'candidates': results,
+    }
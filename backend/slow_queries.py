@@ -0,0 +1,179 @@
+"""Log de consultas lentas com captura do plano (opcional, SLOW_QUERY_MS > 0).
+
+O cursor instrumentado de metrics.py chama record_slow_query() para toda
+instrução que passar de SLOW_QUERY_MS. A instrução é registrada com a rota, o
+formato dos parâmetros (tipos e tamanhos, nunca os valores) e, para uma fração
+SLOW_QUERY_EXPLAIN_RATE delas, o plano: EXPLAIN (ANALYZE, BUFFERS) dentro de um
+savepoint desfeito em seguida para leituras, e EXPLAIN simples para instruções
+com efeitos colaterais, que não podem ser executadas de novo. As
+SLOW_QUERY_BUFFER mais lentas ficam em memória, por worker, e são somadas entre
+os workers em GET /api/admin/slow-queries.
+"""
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2 import extensions
+
+# Limite (ms) a partir do qual uma instrução é registrada (0 desliga)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))
+# Fração das consultas lentas que recebem o plano (EXPLAIN)
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.2))
+# Quantidade de consultas mais lentas guardadas por worker
+SLOW_QUERY_BUFFER = int(os.environ.get('SLOW_QUERY_BUFFER', 50))
+SLOW_QUERY_TEXT_MAX = 4000
+
+# Instruções que não podem ser executadas de novo pelo EXPLAIN ANALYZE (escritas,
+# locks de linha, sequências, notificações e advisory locks de sessão)
+_SIDE_EFFECTS = re.compile(
+    r'\b(insert|update|delete|merge|copy|nextval|setval|pg_notify|pg_(try_)?advisory\w*)\b', re.IGNORECASE
+)
+_EXPLAINABLE = re.compile(r'^\s*(select|with|insert|update|delete|values)\b', re.IGNORECASE)
+
+
+def params_shape(params):
+    """Descreve os parâmetros sem expor valores: tipo e, para textos e listas, tamanho"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: params_shape(value) for name, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        if len(params) > 20:
+            return f'{type(params).__name__}[{len(params)}]'
+        return [_value_shape(value) for value in params]
+    return _value_shape(params)
+
+
+def _value_shape(value):
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def query_text(cursor, query):
+    """Texto da instrução (str, bytes ou sql.Composed)"""
+    if isinstance(query, bytes):
+        return query.decode(errors='replace')
+    if not isinstance(query, str):
+        return query.as_string(cursor.connection)
+    return query
+
+
+def explain(cursor, query, params):
+    """Plano da instrução na mesma conexão e transação em que ela rodou.
+
+    Leituras recebem EXPLAIN (ANALYZE, BUFFERS) dentro de um savepoint, desfeito
+    em seguida; instruções com efeitos colaterais recebem só o EXPLAIN. Retorna
+    (texto do plano, analisado) ou (None, False) se não houver como explicar.
+    """
+    text = query_text(cursor, query)
+    if not _EXPLAINABLE.match(text):
+        return None, False
+    conn = cursor.connection
+    if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_INERROR:
+        return None, False
+    analyze = not _SIDE_EFFECTS.search(text)
+    options = 'ANALYZE, BUFFERS' if analyze else 'COSTS'
+    # Cursor comum, fora da instrumentação (o EXPLAIN não entra nas métricas)
+    explain_cursor = extensions.cursor(conn)
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            explain_cursor.execute('SAVEPOINT slow_query_explain')
+        explain_cursor.execute(f'EXPLAIN ({options}) {text}', params)
+        plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+        return plan, analyze
+    except psycopg2.Error as e:
+        return f'EXPLAIN falhou: {e}'.strip(), False
+    finally:
+        if savepoint and not conn.closed:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        explain_cursor.close()
+
+
+class SlowQueryLog:
+    """As SLOW_QUERY_BUFFER instruções mais lentas do processo (heap por duração)."""
+
+    def __init__(self, size=SLOW_QUERY_BUFFER):
+        self.size = size
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._sequence = itertools.count()
+        self.recorded = 0
+
+    def add(self, entry):
+        """Guarda a entrada se ela estiver entre as mais lentas; retorna se entrou"""
+        item = (entry['duration_ms'], next(self._sequence), entry)
+        with self._lock:
+            self.recorded += 1
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+                return True
+            if item[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+                return True
+            return False
+
+    def threshold_ms(self):
+        """Duração mínima para entrar no buffer cheio (0 enquanto houver espaço)"""
+        with self._lock:
+            return self._heap[0][0] if len(self._heap) >= self.size else 0
+
+    def entries(self):
+        """Entradas da mais lenta para a mais rápida"""
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_slow_log():
+    """Retorna o log do processo atual, recriando-o após um fork"""
+    global _log
+    log = _log
+    if log is not None and log.pid == os.getpid():
+        return log
+    with _log_lock:
+        if _log is None or _log.pid != os.getpid():
+            _log = SlowQueryLog()
+        return _log
+
+
+def record_slow_query(cursor, query, params, elapsed, route, explainable=True):
+    """Registra uma instrução lenta (chamado pelo cursor instrumentado)"""
+    duration_ms = round(elapsed * 1000, 2)
+    text = query_text(cursor, query)
+    log = get_slow_log()
+    plan, analyzed = None, False
+    # O plano só é capturado para uma amostra, e só se a entrada for ficar no buffer
+    if (explainable and duration_ms > log.threshold_ms()
+            and random.random() < SLOW_QUERY_EXPLAIN_RATE):
+        plan, analyzed = explain(cursor, query, params)
+    compact = ' '.join(text.split())
+    log.add({
+        'duration_ms': duration_ms,
+        'route': route,
+        'query': compact[:SLOW_QUERY_TEXT_MAX],
+        'params': params_shape(params),
+        'rows': cursor.rowcount,
+        'plan': plan,
+        'plan_analyzed': analyzed,
+        'at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+    })
+    print(f"⚠️  Consulta lenta ({duration_ms:.0f} ms) em {route}: {compact[:200]}")
@@ -0,0 +1,252 @@
+"""Registros mensais (monthly_stats) calculados a partir dos dados reais dos alunos.
+
+O mês corrente é recalculado por "flask --app app snapshot" ou pelo agendador em
+processo (SNAPSHOT_INTERVAL); meses passados podem ser preenchidos a partir de um
+histórico por aluno em CSV ("flask --app app snapshot --backfill historico.csv").
+"""
+import csv
+import io
+import itertools
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+import psycopg2
+
+from alert_rules import refresh_student_snapshots
+from db import db_connection
+from events import publish_change
+from history import ensure_history_partitions
+from risk import METRIC_RANGES, METRIC_SCALES, calculate_risk_scores, round_like_python
+
+# Chave do advisory lock que impede dois workers de gravarem o snapshot ao mesmo tempo
+SNAPSHOT_LOCK_KEY = 720411302
+# Intervalo (s) do agendador em processo (0 desliga)
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 3600))
+BACKFILL_CHUNK_SIZE = 100000
+
+# Colunas obrigatórias do CSV de histórico (uma linha por aluno por mês)
+HISTORY_COLUMNS = ('month', 'student_id', 'attendance', 'grades', 'participation', 'absences', 'socioeconomic')
+_HISTORY_METRICS = HISTORY_COLUMNS[2:]
+MAX_STUDENT_ID = 2**31 - 1
+
+# Totais de um mês sobre qualquer relação com (risk_level, attendance, grades)
+_MONTH_AGGREGATES = '''
+    COUNT(*),
+    COUNT(*) FILTER (WHERE risk_level = 'Alto'),
+    COUNT(*) FILTER (WHERE risk_level = 'Médio'),
+    COUNT(*) FILTER (WHERE risk_level = 'Baixo'),
+    COALESCE(ROUND(AVG(attendance), 2), 0),
+    COALESCE(ROUND(AVG(grades), 2), 0)
+'''
+
+_MONTH_COLUMNS = 'month, total_students, high_risk, medium_risk, low_risk, avg_attendance, avg_grades'
+
+_UPSERT_MONTHS = f'''
+    INSERT INTO monthly_stats ({_MONTH_COLUMNS})
+    {{select}}
+    ON CONFLICT (month) DO UPDATE SET
+        total_students = EXCLUDED.total_students,
+        high_risk = EXCLUDED.high_risk,
+        medium_risk = EXCLUDED.medium_risk,
+        low_risk = EXCLUDED.low_risk,
+        avg_attendance = EXCLUDED.avg_attendance,
+        avg_grades = EXCLUDED.avg_grades,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING {_MONTH_COLUMNS}
+'''
+
+
+def month_start(value=None):
+    """Primeiro dia do mês de uma data (hoje, se omitida)"""
+    value = value or date.today()
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.replace(day=1)
+
+
+def snapshot_month(cur, month=None, baselines=False):
+    """Grava os totais atuais de students como o registro do mês (uma única passada).
+
+    Com baselines=True, os indicadores atuais de cada aluno também passam a ser a
+    referência das regras de alerta de queda (student_snapshots).
+    Só publica a mudança (nova versão dos dados e evento SSE) se os totais do mês
+    mudaram: uma passada do agendador sem escritas mantém o cache e os ETags.
+    Não faz commit; retorna a linha gravada.
+    """
+    month = month_start(month)
+    cur.execute(f'SELECT {_MONTH_COLUMNS} FROM monthly_stats WHERE month = %s', (month,))
+    previous = cur.fetchone()
+    cur.execute(_UPSERT_MONTHS.format(select=f'SELECT %s::date, {_MONTH_AGGREGATES} FROM students'), (month,))
+    row = cur.fetchone()
+    if baselines:
+        refresh_student_snapshots(cur)
+    if row != previous:
+        publish_change(cur, 'monthly_stats_changed', months=[month.isoformat()])
+    return row
+
+
+def _invalid_line(first_line, index, column, value):
+    return ValueError(f"Linha {first_line + index} do histórico: {column} inválido ({value.strip()!r})")
+
+
+def _parse_month(value):
+    """Primeiro dia do mês de um valor AAAA-MM ou AAAA-MM-DD; None se inválido"""
+    text = value.strip()
+    try:
+        return date.fromisoformat(text + '-01' if len(text) == 7 else text).replace(day=1)
+    except ValueError:
+        return None
+
+
+def _parse_numeric_column(values, column, first_line, dtype=float):
+    """Converte a coluna com NumPy; se falhar, aponta a primeira linha inválida"""
+    try:
+        return np.array([value.strip() for value in values]).astype(dtype)
+    except (ValueError, OverflowError):
+        for index, value in enumerate(values):
+            try:
+                np.array([value.strip()]).astype(dtype)
+            except (ValueError, OverflowError):
+                raise _invalid_line(first_line, index, column, value) from None
+        raise
+
+
+def _validate_history_chunk(rows, header_size, positions, first_line):
+    """Valida um bloco do CSV de histórico em Python, antes do COPY.
+
+    Retorna (meses, ids, indicadores) ou levanta ValueError com o número da
+    primeira linha inválida.
+    """
+    for index, row in enumerate(rows):
+        if len(row) != header_size:
+            raise ValueError(f"Linha {first_line + index} do histórico: quantidade de colunas diferente do cabeçalho")
+    columns = [[row[position] for row in rows] for position in positions]
+
+    # Poucos meses distintos por arquivo: cada um é validado uma vez
+    months = {value: _parse_month(value) for value in set(columns[0])}
+    for index, value in enumerate(columns[0]):
+        if months[value] is None:
+            raise _invalid_line(first_line, index, 'month', value)
+
+    ids = _parse_numeric_column(columns[1], 'student_id', first_line, np.int64)
+    bad = np.flatnonzero((ids < 1) | (ids > MAX_STUDENT_ID))
+    if len(bad):
+        raise _invalid_line(first_line, bad[0], 'student_id', columns[1][bad[0]])
+
+    metrics = []
+    for field, values in zip(_HISTORY_METRICS, columns[2:]):
+        low, high = METRIC_RANGES[field]
+        parsed = _parse_numeric_column(values, field, first_line)
+        invalid = np.isnan(parsed) | (parsed < low) | (parsed > high)
+        if field == 'absences':
+            invalid |= parsed != np.floor(parsed)
+        bad = np.flatnonzero(invalid)
+        if len(bad):
+            raise _invalid_line(first_line, bad[0], field, values[bad[0]])
+        # Na escala das colunas de students, como no cálculo do risco dos alunos
+        metrics.append(round_like_python(parsed, METRIC_SCALES[field]))
+    return [months[value].isoformat() for value in columns[0]], ids, np.array(metrics)
+
+
+def backfill_from_csv(cur, file, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Grava um registro por mês a partir de um histórico por aluno em CSV.
+
+    O arquivo deve ter as colunas de HISTORY_COLUMNS (month como AAAA-MM ou data);
+    cada bloco é validado em Python (ValueError com o número da linha), o score e
+    o nível de risco de cada linha são calculados com a fórmula atual (NumPy), e
+    as linhas vão por COPY para uma tabela temporária agregada em uma única passada.
+    Se um aluno aparecer mais de uma vez no mesmo mês, vale a última linha.
+    Não faz commit; retorna as linhas gravadas, ordenadas por mês.
+    """
+    reader = csv.reader(file)
+    header = [column.strip() for column in next(reader, [])]
+    missing = [column for column in HISTORY_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Colunas ausentes no histórico: {', '.join(missing)}")
+    positions = [header.index(column) for column in HISTORY_COLUMNS]
+
+    # "line" (preenchida na ordem do COPY) desempata alunos repetidos no mesmo mês
+    cur.execute('''
+        CREATE TEMP TABLE history_import (
+            line BIGSERIAL, month DATE, student_id INTEGER,
+            attendance NUMERIC, grades NUMERIC, risk_level TEXT
+        ) ON COMMIT DROP
+    ''')
+    line = 1
+    try:
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                break
+            months, ids, metrics = _validate_history_chunk(rows, len(header), positions, line + 1)
+            _, levels = calculate_risk_scores(*metrics)
+            buffer = io.StringIO('\n'.join(map('\t'.join, zip(
+                months, ids.astype(str), metrics[0].astype(str), metrics[1].astype(str), levels
+            ))) + '\n')
+            cur.copy_expert('COPY history_import (month, student_id, attendance, grades, risk_level) FROM STDIN', buffer)
+            line += len(rows)
+
+        cur.execute(_UPSERT_MONTHS.format(select=f'''
+            SELECT month, {_MONTH_AGGREGATES}
+            FROM (
+                SELECT DISTINCT ON (month, student_id) month, risk_level, attendance, grades
+                FROM history_import
+                ORDER BY month, student_id, line DESC
+            ) AS latest
+            GROUP BY month
+        '''))
+    except psycopg2.DataError as e:
+        # Rede de segurança: o que a validação não previu não sai como traceback
+        raise ValueError(f"Histórico inválido: {str(e).strip()}") from e
+    rows = sorted(cur.fetchall(), key=lambda row: row['month'])
+    if rows:
+        publish_change(cur, 'monthly_stats_changed', months=[row['month'].isoformat() for row in rows])
+    return rows
+
+
+def run_scheduled_snapshot(conn, interval=SNAPSHOT_INTERVAL):
+    """Um ciclo do agendador: grava o snapshot do mês se ninguém o fez no último intervalo.
+
+    Com vários workers, o advisory lock e a verificação de updated_at garantem uma
+    única passada sobre students por intervalo. A referência das regras de queda
+    só é renovada no primeiro snapshot de cada mês. No mesmo ciclo, as partições
+    do histórico dos próximos meses são criadas (nada é apagado aqui).
+    Retorna a linha gravada ou None.
+    """
+    cur = conn.cursor()
+    cur.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (SNAPSHOT_LOCK_KEY,))
+    if cur.fetchone()['locked']:
+        cur.execute('''
+            SELECT updated_at > CURRENT_TIMESTAMP - make_interval(secs => %s) AS recent
+            FROM monthly_stats
+            WHERE month = %s
+        ''', (interval / 2, month_start()))
+        existing = cur.fetchone()
+        if existing is None or not existing['recent']:
+            row = snapshot_month(cur, baselines=existing is None)
+            ensure_history_partitions(cur)
+            conn.commit()
+            cur.close()
+            return row
+    conn.rollback()
+    cur.close()
+    return None
+
+
+def start_snapshot_scheduler(interval=SNAPSHOT_INTERVAL):
+    """Inicia a thread (greenlet, com gevent) que mantém o registro do mês atualizado"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with db_connection() as conn:
+                    run_scheduled_snapshot(conn, interval)
+            except Exception as e:
+                print(f"⚠️  Falha ao gravar o snapshot mensal: {e}")
+
+    thread = threading.Thread(target=loop, name='eduxo-snapshots', daemon=True)
+    thread.start()
+    return thread
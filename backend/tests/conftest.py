@@ -0,0 +1,6 @@
+"""Os módulos do backend são importados pelo nome, como fazem o gunicorn e o Flask
+nesta pasta ("python -m pytest" a partir de backend/). Nenhum teste usa o banco."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
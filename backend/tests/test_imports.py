@@ -0,0 +1,59 @@
+"""Validação dos blocos do CSV de importação (sem banco)."""
+from imports import CLASS_MAX_LENGTH, NAME_MAX_LENGTH, _parse_numbers, _validate_chunk
+from risk import METRIC_FIELDS
+
+VALID = {'name': 'Ana', 'class': '1A', 'attendance': '90', 'grades': '7.5', 'participation': '80',
+         'absences': '3', 'socioeconomic': '3'}
+
+
+def chunk(*rows, has_id=False):
+    """Colunas transpostas de linhas dadas como alterações sobre VALID"""
+    rows = [{**VALID, **row} for row in rows]
+    fields = (('id',) if has_id else ()) + ('name', 'class') + METRIC_FIELDS
+    return {field: [row.get(field, '') for row in rows] for field in fields}
+
+
+def test_valid_rows():
+    valid, ids, names, classes, metrics, errors = _validate_chunk(
+        chunk({}, {'name': '  Bruno ', 'class': ' 2B', 'grades': '0', 'absences': '0'}), has_id=False
+    )
+    assert errors == {}
+    assert valid.tolist() == [True, True]
+    assert ids.tolist() == [0, 0]
+    assert names.tolist() == ['Ana', 'Bruno']
+    assert classes.tolist() == ['1A', '2B']
+    assert metrics.shape == (len(METRIC_FIELDS), 2)
+    assert metrics[:, 1].tolist() == [90.0, 0.0, 80.0, 0.0, 3.0]
+
+
+def test_invalid_rows_are_reported_by_position():
+    valid, _, _, _, _, errors = _validate_chunk(chunk(
+        {},
+        {'name': ' '},
+        {'class': 'X' * (CLASS_MAX_LENGTH + 1), 'name': 'N' * (NAME_MAX_LENGTH + 1)},
+        {'attendance': '', 'grades': 'abc'},
+        {'participation': '100.5', 'socioeconomic': '0'},
+        {'absences': '2.5'},
+    ), has_id=False)
+    assert valid.tolist() == [True, False, False, False, False, False]
+    assert errors[1] == ['name é obrigatório']
+    assert errors[2] == [f'name deve ter no máximo {NAME_MAX_LENGTH} caracteres',
+                         f'class deve ter no máximo {CLASS_MAX_LENGTH} caracteres']
+    assert errors[3] == ['attendance é obrigatório', 'grades deve ser numérico']
+    assert errors[4] == ['participation deve estar entre 0 e 100', 'socioeconomic deve estar entre 1 e 5']
+    assert errors[5] == ['absences deve ser inteiro']
+
+
+def test_ids():
+    valid, ids, _, _, _, errors = _validate_chunk(chunk(
+        {'id': '12'}, {'id': ''}, {'id': '0'}, {'id': '1.5'}, {'id': 'x'}, {'id': str(2**31)}, has_id=True,
+    ), has_id=True)
+    assert ids.tolist() == [12, 0, 0, 0, 0, 0]
+    assert valid.tolist() == [True, True, False, False, False, False]
+    assert all(errors[i] == ['id deve ser um inteiro positivo'] for i in range(2, 6))
+
+
+def test_parse_numbers_marks_invalid_values_as_nan():
+    numbers = _parse_numbers(['1.5', 'abc', '', ' 7 '])
+    assert numbers[0] == 1.5 and numbers[3] == 7.0
+    assert [n != n for n in numbers.tolist()] == [False, True, True, False]
@@ -0,0 +1,187 @@
+"""Migrações versionadas e verificação de planos.
+
+Os testes de ordem, savepoints, lock e leitura de planos usam cursores falsos.
+Os que precisam de um PostgreSQL de verdade (EXPLAIN, advisory lock entre
+sessões) só rodam com TEST_DATABASE_URL e não gravam nada: tudo acontece em
+schemas temporários dentro de transações desfeitas.
+"""
+import os
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+
+from migrations import (
+    LATEST_VERSION, MIGRATION_LOCK_KEY, MIGRATIONS, _seq_scans, apply_migrations, check_query_plans,
+    migration_lock,
+)
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+class FakeCursor:
+    """Registra as instruções; simula a versão aplicada e erros em instruções escolhidas"""
+
+    def __init__(self, version=0, failing=()):
+        self.version = version
+        self.failing = failing
+        self.executed = []
+        self.closed = False
+
+    def execute(self, query, params=None):
+        self.executed.append((' '.join(query.split()), params))
+        if query in self.failing:
+            raise psycopg2.ProgrammingError('falha simulada')
+
+    def fetchone(self):
+        return {'version': self.version}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cursor_ = FakeCursor()
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.closed = False
+        self.calls = []
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.calls.append('commit')
+
+    def rollback(self):
+        self.calls.append('rollback')
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+
+def recorded_versions(cur):
+    return [params[0] for query, params in cur.executed if query.startswith('INSERT INTO schema_version')]
+
+
+def test_versions_are_sequential():
+    versions = [migration['version'] for migration in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+    assert LATEST_VERSION == versions[-1]
+    for migration in MIGRATIONS:
+        assert migration['description']
+        assert migration['statements']
+
+
+def test_apply_migrations_from_scratch_runs_all_in_order():
+    cur = FakeCursor(version=0)
+    assert apply_migrations(cur) == list(range(1, LATEST_VERSION + 1))
+    assert recorded_versions(cur) == list(range(1, LATEST_VERSION + 1))
+
+
+def test_apply_migrations_skips_applied_versions():
+    cur = FakeCursor(version=LATEST_VERSION - 1)
+    assert apply_migrations(cur) == [LATEST_VERSION]
+    assert recorded_versions(cur) == [LATEST_VERSION]
+    assert apply_migrations(FakeCursor(version=LATEST_VERSION)) == []
+
+
+def test_failed_optional_statements_are_rolled_back_to_savepoint():
+    migration = next(m for m in MIGRATIONS if m.get('optional'))
+    cur = FakeCursor(version=migration['version'] - 1, failing=(migration['optional'][0],))
+    applied = apply_migrations(cur)
+    assert applied[0] == migration['version']
+    queries = [query for query, _ in cur.executed]
+    rollback = queries.index('ROLLBACK TO SAVEPOINT optional_statements')
+    assert 'RELEASE SAVEPOINT optional_statements' not in queries[:rollback]
+
+
+def test_failed_required_statement_aborts():
+    first = MIGRATIONS[0]['statements'][0]
+    cur = FakeCursor(version=0, failing=(first,))
+    with pytest.raises(psycopg2.ProgrammingError):
+        apply_migrations(cur)
+    assert recorded_versions(cur) == []
+
+
+def test_migration_lock_releases_after_error():
+    conn = FakeConnection()
+    with pytest.raises(RuntimeError):
+        with migration_lock(conn):
+            conn.status = extensions.TRANSACTION_STATUS_INERROR
+            raise RuntimeError('falha na migração')
+    assert conn.cursor_.executed == [
+        ('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,)),
+        ('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,)),
+    ]
+    # Desfaz a transação com erro antes de liberar o lock
+    assert conn.calls == ['commit', 'rollback', 'commit']
+    assert conn.cursor_.closed
+
+
+def test_seq_scans_walks_nested_plans():
+    plan = {
+        'Node Type': 'Nested Loop',
+        'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'alerts'},
+            {'Node Type': 'Index Scan', 'Relation Name': 'students', 'Plans': [
+                {'Node Type': 'Seq Scan', 'Relation Name': 'interventions'},
+                # Tabelas fora de PLAN_CHECK_TABLES não contam
+                {'Node Type': 'Seq Scan', 'Relation Name': 'monthly_stats'},
+            ]},
+        ],
+    }
+    assert _seq_scans(plan) == ['alerts', 'interventions']
+    assert _seq_scans({'Node Type': 'Index Only Scan', 'Relation Name': 'students'}) == []
+
+
+requires_database = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason='defina TEST_DATABASE_URL para usar um PostgreSQL'
+)
+
+
+def connect():
+    return psycopg2.connect(TEST_DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+@requires_database
+def test_hot_queries_use_indexes():
+    conn = connect()
+    try:
+        assert check_query_plans(conn, students=50000) == []
+    finally:
+        conn.close()
+
+
+@requires_database
+def test_migration_lock_blocks_other_sessions():
+    holder, other = connect(), connect()
+    try:
+        cur = other.cursor()
+        with migration_lock(holder):
+            cur.execute('SELECT pg_try_advisory_lock(%s) AS locked', (MIGRATION_LOCK_KEY,))
+            assert cur.fetchone()['locked'] is False
+        cur.execute('SELECT pg_try_advisory_lock(%s) AS locked', (MIGRATION_LOCK_KEY,))
+        assert cur.fetchone()['locked'] is True
+        cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,))
+    finally:
+        holder.close()
+        other.close()
+
+
+@requires_database
+def test_migrations_apply_once_on_an_empty_schema():
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute('CREATE SCHEMA eduxo_migration_test')
+        cur.execute('SET LOCAL search_path TO eduxo_migration_test, public')
+        assert apply_migrations(cur) == list(range(1, LATEST_VERSION + 1))
+        assert apply_migrations(cur) == []
+        cur.execute('SELECT array_agg(version ORDER BY version) AS versions FROM schema_version')
+        assert cur.fetchone()['versions'] == list(range(1, LATEST_VERSION + 1))
+    finally:
+        conn.rollback()
+        conn.close()
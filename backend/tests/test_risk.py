@@ -0,0 +1,68 @@
+"""Score de risco: versões escalar e vetorizada e o arredondamento compartilhado."""
+import numpy as np
+import pytest
+
+from risk import (
+    METRIC_FIELDS, calculate_risk_score, calculate_risk_scores, risk_factors, round_like_python, weighted_risk_score,
+)
+
+# (mínimo, máximo, casas decimais) de cada indicador, na ordem dos argumentos de calculate_risk_score
+METRIC_COLUMNS = ((0, 100, 2), (0, 10, 2), (0, 100, 2), (0, 999, 0), (1, 5, 1))
+
+
+def random_metrics(size, seed=7):
+    """Indicadores aleatórios dentro das faixas, já na escala das colunas"""
+    rng = np.random.default_rng(seed)
+    return [round_like_python(rng.uniform(low, high, size), ndigits) for low, high, ndigits in METRIC_COLUMNS]
+
+
+def test_weighted_score_scalar_and_vector_are_bit_identical():
+    metrics = random_metrics(5000)
+    vector = weighted_risk_score(risk_factors(*metrics))
+    scalar = [weighted_risk_score(risk_factors(*map(float, row))) for row in zip(*metrics)]
+    assert vector.tolist() == scalar
+
+
+def test_calculate_risk_scores_matches_scalar_version():
+    metrics = random_metrics(5000, seed=11)
+    scores, levels = calculate_risk_scores(*metrics)
+    expected = [calculate_risk_score(*map(float, row)) for row in zip(*metrics)]
+    assert scores.tolist() == [score for score, _ in expected]
+    assert levels.tolist() == [level for _, level in expected]
+
+
+def test_weighted_score_does_not_modify_the_factors():
+    factors = risk_factors(*random_metrics(10))
+    first = factors[0].copy()
+    weighted_risk_score(factors)
+    assert factors[0].tolist() == first.tolist()
+
+
+def test_custom_weights():
+    factors = risk_factors(50.0, 5.0, 50.0, 10.0, 3.0)
+    weights = {field: 0.0 for field in METRIC_FIELDS}
+    weights['absences'] = 1.0
+    assert weighted_risk_score(factors, weights) == 10.0
+
+
+@pytest.mark.parametrize('level, metrics', [
+    ('Baixo', (100, 10, 100, 0, 5)),
+    ('Médio', (50, 5, 50, 10, 3)),
+    ('Alto', (0, 0, 0, 60, 1)),
+])
+def test_risk_levels(level, metrics):
+    assert calculate_risk_score(*metrics)[1] == level
+
+
+@pytest.mark.parametrize('ndigits', [0, 1, 2])
+def test_round_like_python_matches_round(ndigits):
+    rng = np.random.default_rng(3)
+    # Empates decimais (x.5, x.x5, x.xx5), que np.round e round() podem arredondar diferente
+    ties = (np.arange(-2000, 2000) + 0.5) / 10 ** ndigits
+    values = np.concatenate([ties, rng.uniform(-1000, 1000, 2000), [0.125, 2.675, 1.005, 0.285, 1.115]])
+    assert round_like_python(values.copy(), ndigits).tolist() == [round(float(v), ndigits) for v in values]
+
+
+def test_round_like_python_default_is_two_digits():
+    values = [2.675, 1.005, 41.215]
+    assert round_like_python(np.array(values)).tolist() == [round(v, 2) for v in values]
@@ -0,0 +1,145 @@
+"""Simulação de risco: decodificação do COPY binário, validação e avaliação de candidatos."""
+import struct
+
+import pytest
+
+from risk import HIGH_RISK_THRESHOLD, MEDIUM_RISK_THRESHOLD, RISK_WEIGHTS, calculate_risk_score
+from simulation import RISK_LEVELS, RiskPopulation, parse_candidate, parse_copy_rows
+
+SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+
+def copy_buffer(rows, extension=b'', fields=9):
+    """Saída de "COPY ... TO STDOUT (FORMAT binary)" montada à mão.
+
+    Cada linha: (id, turma, nível, score, attendance, grades, participation,
+    absences, socioeconomic).
+    """
+    data = SIGNATURE + struct.pack('>ii', 0, len(extension)) + extension
+    for student_id, class_code, level, score, *metrics in rows:
+        data += struct.pack('>h', fields)
+        data += struct.pack('>ii', 4, student_id)
+        data += struct.pack('>ih', 2, class_code) + struct.pack('>ih', 2, level)
+        for value in (score, *metrics):
+            data += struct.pack('>id', 8, value)
+    return data + struct.pack('>h', -1)
+
+
+def student_row(student_id, class_code, metrics):
+    """Linha com o score e o nível gravados como o cálculo real os grava"""
+    score, level = calculate_risk_score(*metrics)
+    return (student_id, class_code, RISK_LEVELS.index(level), score, *metrics)
+
+
+ROWS = [
+    student_row(1, 0, (95.0, 8.5, 90.0, 2.0, 4.0)),
+    student_row(2, 0, (60.0, 5.0, 45.0, 15.0, 2.5)),
+    student_row(3, 1, (20.0, 1.5, 10.0, 50.0, 1.0)),
+    student_row(4, 1, (52.5, 4.25, 40.0, 12.0, 2.0)),
+]
+
+
+def test_parse_copy_rows():
+    rows = parse_copy_rows(copy_buffer(ROWS))
+    assert rows['id'].tolist() == [1, 2, 3, 4]
+    assert rows['class'].tolist() == [0, 0, 1, 1]
+    assert rows['score'].tolist() == [row[3] for row in ROWS]
+    assert rows['grades'].tolist() == [8.5, 5.0, 1.5, 4.25]
+    assert rows['absences'].tolist() == [2.0, 15.0, 50.0, 12.0]
+
+
+def test_parse_copy_rows_skips_header_extension():
+    rows = parse_copy_rows(copy_buffer(ROWS[:1], extension=b'\x00' * 6))
+    assert rows['id'].tolist() == [1]
+    assert rows['socioeconomic'].tolist() == [4.0]
+
+
+def test_parse_copy_rows_empty():
+    assert len(parse_copy_rows(copy_buffer([]))) == 0
+
+
+@pytest.mark.parametrize('data', [
+    b'COPY' + copy_buffer(ROWS)[4:],
+    copy_buffer(ROWS)[:-3],
+    copy_buffer(ROWS, fields=8),
+])
+def test_parse_copy_rows_rejects_invalid_output(data):
+    with pytest.raises(ValueError):
+        parse_copy_rows(data)
+
+
+def test_parse_candidate_defaults():
+    candidate, errors = parse_candidate({}, 1)
+    assert errors == []
+    assert candidate == {
+        'name': 'candidato 2', 'weights': RISK_WEIGHTS,
+        'high': float(HIGH_RISK_THRESHOLD), 'medium': float(MEDIUM_RISK_THRESHOLD),
+    }
+
+
+def test_parse_candidate_overrides():
+    candidate, errors = parse_candidate(
+        {'name': 'faltas', 'weights': {'absences': 0.4}, 'thresholds': {'high': 55, 'medium': 30.5}}, 0
+    )
+    assert errors == []
+    assert candidate['name'] == 'faltas'
+    assert candidate['weights'] == {**RISK_WEIGHTS, 'absences': 0.4}
+    assert (candidate['high'], candidate['medium']) == (55.0, 30.5)
+
+
+@pytest.mark.parametrize('item, message', [
+    ([], 'Cada candidato deve ser um objeto JSON'),
+    ({'name': 3}, 'name deve ser texto'),
+    ({'weights': [0.1]}, 'weights deve ser um objeto'),
+    ({'weights': {'height': 1}}, 'Peso desconhecido: height'),
+    ({'weights': {'grades': -0.1}}, 'weights.grades deve ser um número não negativo'),
+    ({'weights': {'grades': True}}, 'weights.grades deve ser um número não negativo'),
+    ({'weights': {'grades': float('inf')}}, 'weights.grades deve ser um número não negativo'),
+    ({'thresholds': 60}, 'thresholds deve ser um objeto'),
+    ({'thresholds': {'high': '60'}}, 'thresholds.high deve ser numérico'),
+    ({'thresholds': {'high': 30, 'medium': 30}}, 'thresholds.medium deve ser menor que thresholds.high'),
+])
+def test_parse_candidate_errors(item, message):
+    candidate, errors = parse_candidate(item, 0)
+    assert candidate is None
+    assert message in errors
+
+
+def population():
+    return RiskPopulation(1, ['1A', '1B'], parse_copy_rows(copy_buffer(ROWS)))
+
+
+def test_current_weights_reproduce_stored_levels():
+    candidate, _ = parse_candidate({}, 0)
+    pop = population()
+    result = pop.evaluate(candidate)
+    assert result['changed'] == 0
+    assert result['transitions'] == []
+    assert result['changed_students'] == []
+    current = pop.current()
+    for key in ('low_risk', 'medium_risk', 'high_risk', 'avg_risk_score', 'classes'):
+        assert result[key] == current[key]
+
+
+def test_evaluate_lists_level_changes():
+    # Com limites mais baixos, todos os Médio viram Alto e os Baixo acima de 10 viram Médio
+    candidate, _ = parse_candidate({'thresholds': {'high': 35, 'medium': 10}}, 0)
+    pop = population()
+    result = pop.evaluate(candidate)
+    expected = {
+        (row[0], RISK_LEVELS[row[2]], 'Alto' if row[3] > 35 else 'Médio' if row[3] > 10 else 'Baixo')
+        for row in ROWS
+    }
+    changed = {(s['id'], s['current_level'], s['simulated_level']) for s in result['changed_students']}
+    assert changed == {item for item in expected if item[1] != item[2]}
+    assert result['changed'] == len(changed)
+    assert sum(item['count'] for item in result['transitions']) == len(changed)
+    assert result['low_risk'] + result['medium_risk'] + result['high_risk'] == len(ROWS)
+    assert [c['class'] for c in result['classes']] == ['1A', '1B']
+
+
+def test_evaluate_limits_listed_students():
+    candidate, _ = parse_candidate({'thresholds': {'high': 1, 'medium': 0.5}}, 0)
+    result = population().evaluate(candidate, changes_limit=1)
+    assert result['changed'] > 1
+    assert len(result['changed_students']) == 1